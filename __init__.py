@@ -9,6 +9,7 @@ node_list = [
     "seedream_node",
     "seedream_fal_node",
     "seedream_ppio_node",  # 添加派欧云即梦4.0节点
+    "seedream_router_node",  # 添加即梦4.0智能路由节点
     "seedance_ppio_node",  # 添加派欧云即梦视频节点
     "minimax_hailuo_ppio_node",  # 添加派欧云Minimax Hailuo-02节点
     "minimax_hailuo23_ppio_node",  # 添加派欧云Minimax Hailuo 2.3节点
@@ -26,17 +27,21 @@ node_list = [
     "kling_ppio_node",  # 添加派欧云Kling V2.5节点
 ]
 
-NODE_CLASS_MAPPINGS = {}
-NODE_DISPLAY_NAME_MAPPINGS = {}
+# 只有路由、没有节点的模块
+route_module_list = [
+    "scheduler",
+    "metrics",
+]
 
-for module_name in node_list:
-    imported_module = importlib.import_module(f".nodes.{module_name}", __name__)
+# 根据节点清单注册占位类，节点模块在第一次使用时才导入（CC_API_LAZY_LOAD=0关闭）
+lazy_loader = importlib.import_module(".nodes.lazy_loader", __name__)
+NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS = lazy_loader.NodeModuleLoader(
+    __name__, node_list, route_module_list
+).install()
 
-    NODE_CLASS_MAPPINGS = {**NODE_CLASS_MAPPINGS, **imported_module.NODE_CLASS_MAPPINGS}
-    NODE_DISPLAY_NAME_MAPPINGS = {
-        **NODE_DISPLAY_NAME_MAPPINGS,
-        **imported_module.NODE_DISPLAY_NAME_MAPPINGS,
-    }
+# 启动时和之后定期在后台刷新远程音色列表，INPUT_TYPES只读取内存中的音色目录
+voice_refresher = importlib.import_module(".nodes.voice_refresher", __name__)
+voice_refresher.VoiceCatalogRefresher().register("minimax_voices", voice_refresher.refresh_minimax_catalog)
 
 
 __all__ = ["NODE_CLASS_MAPPINGS", "NODE_DISPLAY_NAME_MAPPINGS", "WEB_DIRECTORY"]
\ No newline at end of file
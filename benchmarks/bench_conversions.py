@@ -0,0 +1,244 @@
+"""
+图像、音频转换热点的微基准测试
+
+覆盖 ImageUtils.tensor_to_pil / pil_to_base64 / base64_to_tensor、节点的 tensor_to_base64
+（JPEG：可灵等；PNG：万相）、Seedream4PPIO.process_ppio_result 的下载解码、AudioProcessor
+的各处理流程和豆包PCM流式响应的拼接。图像尺寸为1K/2K/4K，批量为1~15张，音频为10秒~10分钟。
+
+每个用例取多次运行的最短耗时，并用tracemalloc记录一次运行的峰值分配（只统计Python和numpy
+的分配，不含torch和PIL内部的内存）。结果与 benchmarks/baselines/conversions.json 中的基线
+比较，耗时或峰值分配超过容差时标记为回退，并以退出码1结束。
+
+process_ppio_result 和豆包用例通过本地模拟服务器（benchmarks/mock_provider.py，需要aiohttp）
+下载数据，缺少aiohttp时跳过。
+
+用法（在插件根目录下运行）：
+    python benchmarks/bench_conversions.py                    # 运行全部用例并与基线比较
+    python benchmarks/bench_conversions.py -k image/ --quick  # 只运行名称包含image/的小尺寸用例
+    python benchmarks/bench_conversions.py --save-baseline    # 保存为新的基线
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import torch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from nodes.audio_utils import AudioProcessor  # noqa: E402
+from nodes.cc_utils import ImageUtils  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines", "conversions.json")
+
+IMAGE_SIZES = {"1K": (1024, 1024), "2K": (2048, 2048), "4K": (3840, 2160)}
+# process_ppio_result 的(尺寸, 批量)组合，大尺寸的批量受内存限制
+RESULT_BATCHES = (("1K", 1), ("1K", 4), ("1K", 15), ("2K", 1), ("2K", 4), ("4K", 1))
+AUDIO_DURATIONS = (10, 60, 600)
+QUICK_IMAGE_SIZES = ("1K",)
+QUICK_AUDIO_DURATIONS = (10,)
+SAMPLE_RATE = 24000
+
+
+def make_image_tensor(size):
+    width, height = IMAGE_SIZES[size]
+    rng = np.random.default_rng(0)
+    # 平滑渐变加噪声，压缩率接近真实图像
+    gradient = np.linspace(0.0, 1.0, width, dtype=np.float32)[np.newaxis, :, np.newaxis]
+    image = np.clip(gradient + rng.normal(0, 0.05, size=(height, width, 3)).astype(np.float32), 0, 1)
+    return torch.from_numpy(image).unsqueeze(0)
+
+
+def make_audio(seconds, channels=1):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * SAMPLE_RATE), dtype=np.float32) / SAMPLE_RATE
+    wave = 0.5 * np.sin(2 * np.pi * 220 * t) + rng.normal(0, 0.01, size=t.shape).astype(np.float32)
+    waveform = np.stack([wave] * channels)[np.newaxis, ...].astype(np.float32)
+    return {"waveform": torch.from_numpy(waveform), "sample_rate": SAMPLE_RATE}
+
+
+def image_cases(sizes):
+    """返回 名称 -> 无参函数"""
+    from nodes.kling_ppio_node import KlingPPIOImg2VideoNode
+    from nodes.wan_ppio_node import WanPPIOImg2VideoNode
+
+    cases = {}
+    kling = KlingPPIOImg2VideoNode()
+    wan = WanPPIOImg2VideoNode()
+    for size in sizes:
+        tensor = make_image_tensor(size)
+        pil_image = ImageUtils.tensor_to_pil(tensor)
+        jpeg_base64 = ImageUtils.pil_to_base64(pil_image, "JPEG")
+        cases[f"image/tensor_to_pil/{size}"] = lambda t=tensor: ImageUtils.tensor_to_pil(t)
+        cases[f"image/pil_to_base64_jpeg/{size}"] = lambda p=pil_image: ImageUtils.pil_to_base64(p, "JPEG")
+        cases[f"image/pil_to_base64_png/{size}"] = lambda p=pil_image: ImageUtils.pil_to_base64(p, "PNG")
+        cases[f"image/base64_to_tensor/{size}"] = lambda b=jpeg_base64: ImageUtils.base64_to_tensor(b)
+        cases[f"node/tensor_to_base64_jpeg/{size}"] = lambda t=tensor: kling.tensor_to_base64(t)
+        cases[f"node/tensor_to_base64_png/{size}"] = lambda t=tensor: wan.tensor_to_base64(t)
+    return cases
+
+
+def audio_cases(durations):
+    cases = {}
+    for seconds in durations:
+        mono = make_audio(seconds)
+        stereo = make_audio(seconds, channels=2)
+        flac, flac_format = AudioProcessor.encode_audio_bytes(mono, "flac")
+        cases[f"audio/prepare_waveform/{seconds}s"] = \
+            lambda a=stereo: AudioProcessor.prepare_waveform(a["waveform"], quantize=True)
+        cases[f"audio/encode_upload_wav/{seconds}s"] = \
+            lambda a=mono: AudioProcessor.encode_upload_bytes(a["waveform"][0, 0].numpy(), SAMPLE_RATE, "wav")
+        cases[f"audio/encode_audio_bytes/{seconds}s"] = lambda a=mono: AudioProcessor.encode_audio_bytes(a, "flac")
+        cases[f"audio/decode_audio_bytes/{seconds}s"] = \
+            lambda d=flac, f=flac_format: AudioProcessor.decode_audio_bytes(d, f)
+        cases[f"audio/hash_audio/{seconds}s"] = lambda a=mono: AudioProcessor.hash_audio(a)
+    return cases
+
+
+def mock_cases(stack, sizes, durations):
+    """需要本地模拟服务器的用例：下载解码Seedream结果、豆包PCM拼接"""
+    try:
+        from mock_provider import MockProviderServer, MockSettings, redirect_requests
+    except ImportError as e:
+        print(f"Skipping mock provider cases: {e}")
+        return {}
+    from run_benchmarks import BENCH_KEY, build_inputs
+    from nodes.doubao_tts_node import DoubaoTTS
+    from nodes.seedream_ppio_node import Seedream4PPIO
+
+    server = stack.enter_context(MockProviderServer(MockSettings(latency=0.0)))
+    stack.enter_context(redirect_requests(server.base_url))
+    provider = server.provider
+
+    cases = {}
+    seedream = Seedream4PPIO()
+    for size, batch in RESULT_BATCHES:
+        if size not in sizes:
+            continue
+        buffer = io.BytesIO()
+        ImageUtils.tensor_to_pil(make_image_tensor(size)).save(buffer, format="PNG")
+        url = provider.add_asset(f"result_{size}.png", buffer.getvalue(), "image/png")
+        result = {"images": [url] * batch}
+        cases[f"ppio/process_ppio_result/{size}x{batch}"] = lambda r=result: seedream.process_ppio_result(r)
+
+    doubao = DoubaoTTS()
+    for seconds in durations:
+        pcm = AudioProcessor.convert_to_int16(make_audio(seconds)["waveform"][0, 0].numpy()).tobytes()
+        inputs = build_inputs(DoubaoTTS, {
+            "text": "基准测试", "app_id": "mock-app", "access_key": BENCH_KEY, "format": "pcm",
+        }, 0)
+
+        def assemble(pcm=pcm, inputs=inputs):
+            provider.pcm = pcm
+            return doubao.generate_speech(**inputs)
+        cases[f"doubao/pcm_assembly/{seconds}s"] = assemble
+    return cases
+
+
+def measure(func, repeat):
+    """返回(最短耗时秒数, 峰值分配字节数)，运行期间屏蔽节点的打印输出"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()  # 预热
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def load_baseline():
+    try:
+        with open(BASELINE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(results):
+    """保存基线；只运行了部分用例时保留其他用例原有的基线"""
+    os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+    cases = dict((load_baseline() or {}).get("cases", {}))
+    cases.update(results)
+    data = {
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "processor": platform.processor(), "torch": torch.__version__, "numpy": np.__version__},
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "cases": cases,
+    }
+    with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"Baseline saved to {BASELINE_PATH}")
+
+
+def compare(name, seconds, peak, baseline, time_tolerance, memory_tolerance):
+    """与基线比较，返回(耗时变化, 分配变化, 是否回退)"""
+    reference = (baseline or {}).get("cases", {}).get(name)
+    if not reference:
+        return "", "", False
+    time_ratio = seconds / reference["seconds"] if reference["seconds"] else 1.0
+    memory_ratio = peak / reference["peak_bytes"] if reference["peak_bytes"] else 1.0
+    regressed = time_ratio > 1 + time_tolerance or memory_ratio > 1 + memory_tolerance
+    return f"{time_ratio - 1:+.0%}", f"{memory_ratio - 1:+.0%}", regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for image and audio conversions")
+    parser.add_argument("-k", dest="filter", default="", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--quick", action="store_true", help="只运行1K图像和10秒音频")
+    parser.add_argument("--repeat", type=int, default=5, help="每个用例的重复次数")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--time-tolerance", type=float, default=0.2, help="允许的耗时增加比例")
+    parser.add_argument("--memory-tolerance", type=float, default=0.1, help="允许的峰值分配增加比例")
+    args = parser.parse_args()
+
+    sizes = QUICK_IMAGE_SIZES if args.quick else tuple(IMAGE_SIZES)
+    durations = QUICK_AUDIO_DURATIONS if args.quick else AUDIO_DURATIONS
+    baseline = None if args.save_baseline else load_baseline()
+
+    results = {}
+    regressions = []
+    with contextlib.ExitStack() as stack:
+        cases = {}
+        cases.update(image_cases(sizes))
+        cases.update(audio_cases(durations))
+        cases.update(mock_cases(stack, sizes, durations))
+
+        print(f"{'case':<40} {'ms':>10} {'peak MB':>9} {'time':>7} {'memory':>7}")
+        for name, func in cases.items():
+            if args.filter not in name:
+                continue
+            seconds, peak = measure(func, args.repeat)
+            results[name] = {"seconds": round(seconds, 6), "peak_bytes": peak}
+            time_change, memory_change, regressed = compare(
+                name, seconds, peak, baseline, args.time_tolerance, args.memory_tolerance)
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{name:<40} {seconds * 1000:>10.2f} {peak / 1e6:>9.1f} {time_change:>7} {memory_change:>7}{flag}")
+            if regressed:
+                regressions.append(name)
+
+    if args.save_baseline:
+        save_baseline(results)
+    elif baseline is None:
+        print("\nNo baseline found, run with --save-baseline to create one")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
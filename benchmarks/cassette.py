@@ -0,0 +1,385 @@
+"""
+HTTP录制/回放（cassette）
+
+在传输层（requests.Session.send 和 urllib.request.urlopen）录制节点与服务商的真实交互，保存为
+压缩的cassette文件；回放时不访问网络，按录制的顺序返回响应，可以保持原始耗时、按比例缩放或不等待，
+使性能对比不受服务商响应波动的影响。
+
+- 密钥不写入文件：不保存请求头；URL中名称像密钥的查询参数替换为 ***；请求体只保存脱敏后的哈希，
+  用于在回放时区分同一接口的不同请求。响应头只保留 Content-Type 和 Retry-After。
+- 相同的响应体（例如轮询返回的状态、重复下载的图片）只保存一份，整个文件用gzip压缩。
+- 回放按 方法+URL 匹配（找不到时按 方法+路径 匹配），同一URL的多次请求按录制顺序返回，
+  优先返回请求体哈希相同的交互；用完后重复最后一个响应（例如任务完成后的轮询）。
+- 流式响应（豆包TTS）录制时读取完整内容，回放时一次返回。
+
+用法（在插件根目录下运行）：
+    # 使用真实密钥录制（密钥来自环境变量或config.ini）
+    python benchmarks/cassette.py record cassettes/seedream_ppio.json.gz -s seedream_ppio -n 3
+    python benchmarks/cassette.py record cassettes/kling.json.gz --node kling_ppio_node:KlingPPIOText2VideoNode \\
+        --inputs '{"prompt": "a cat"}'
+    # 离线回放，--speed 1为原始耗时，0为不等待
+    python benchmarks/cassette.py replay cassettes/seedream_ppio.json.gz -s seedream_ppio -n 3 --speed 0.5
+    python benchmarks/cassette.py show cassettes/seedream_ppio.json.gz
+    # 基准测试使用cassette代替模拟服务商
+    python benchmarks/run_benchmarks.py -s seedream_ppio -n 3 -c 1 --cassette cassettes/seedream_ppio.json.gz
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+CASSETTE_VERSION = 1
+# 名称符合该模式的查询参数和JSON字段视为密钥
+SECRET_PATTERN = re.compile(r"key|token|secret|signature|credential|auth|password|appid|app_id", re.IGNORECASE)
+KEPT_RESPONSE_HEADERS = ("content-type", "retry-after")
+
+
+def scrub_url(url):
+    """把URL中像密钥的查询参数替换为 ***"""
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = [(name, "***" if SECRET_PATTERN.search(name) else value)
+             for name, value in parse_qsl(parts.query, keep_blank_values=True)]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _scrub_json(value):
+    if isinstance(value, dict):
+        return {name: "***" if SECRET_PATTERN.search(name) else _scrub_json(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [_scrub_json(item) for item in value]
+    return value
+
+
+def body_hash(body):
+    """请求体的哈希；JSON请求体先去掉密钥字段并规范化"""
+    if not body:
+        return ""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    elif not isinstance(body, bytes):
+        # 流式上传等无法读取的请求体
+        return ""
+    try:
+        body = json.dumps(_scrub_json(json.loads(body)), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        pass
+    return hashlib.sha256(body).hexdigest()[:16]
+
+
+def path_key(method, url):
+    parts = urlsplit(url)
+    return method, f"{parts.netloc}{parts.path}"
+
+
+class CassetteMiss(Exception):
+    """回放时找不到匹配的交互"""
+
+
+class Cassette:
+    """录制的交互列表和去重后的响应体"""
+
+    def __init__(self, interactions=None, bodies=None, meta=None):
+        self.interactions = interactions or []
+        self.bodies = bodies or {}
+        self.meta = meta or {}
+        self._lock = threading.Lock()
+        self._by_url = None
+        self._by_path = None
+
+    @classmethod
+    def load(cls, path):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version: {data.get('version')}")
+        return cls(data["interactions"], data["bodies"], data.get("meta"))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        data = {"version": CASSETTE_VERSION, "meta": self.meta, "interactions": self.interactions, "bodies": self.bodies}
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+    def store_body(self, content):
+        digest = hashlib.sha256(content).hexdigest()[:24]
+        if digest not in self.bodies:
+            try:
+                self.bodies[digest] = {"text": content.decode("utf-8")}
+            except UnicodeDecodeError:
+                self.bodies[digest] = {"base64": base64.b64encode(content).decode("ascii")}
+        return digest
+
+    def load_body(self, digest):
+        body = self.bodies[digest]
+        return body["text"].encode("utf-8") if "text" in body else base64.b64decode(body["base64"])
+
+    def record(self, method, url, request_body, status, reason, headers, content, elapsed, transfer):
+        kept = {name: value for name, value in headers.items() if name.lower() in KEPT_RESPONSE_HEADERS}
+        with self._lock:
+            self.interactions.append({
+                "method": method,
+                "url": scrub_url(url),
+                "request": body_hash(request_body),
+                "status": status,
+                "reason": reason,
+                "headers": kept,
+                "body": self.store_body(content),
+                "elapsed": round(elapsed, 4),
+                "transfer": round(transfer, 4),
+            })
+
+    def _index(self):
+        self._by_url, self._by_path = {}, {}
+        for interaction in self.interactions:
+            method, url = interaction["method"], interaction["url"]
+            self._by_url.setdefault((method, url), deque()).append(interaction)
+            self._by_path.setdefault(path_key(method, url), deque()).append(interaction)
+
+    def match(self, method, url, request_body):
+        """返回下一条匹配的交互"""
+        url = scrub_url(url)
+        with self._lock:
+            if self._by_url is None:
+                self._index()
+            pending = self._by_url.get((method, url)) or self._by_path.get(path_key(method, url))
+            if not pending:
+                raise CassetteMiss(f"No recorded response for {method} {url}")
+            wanted = body_hash(request_body)
+            for interaction in pending:
+                if interaction["request"] == wanted:
+                    break
+            else:
+                interaction = pending[0]
+            if len(pending) > 1:
+                pending.remove(interaction)
+            return interaction
+
+    def summary(self):
+        endpoints = {}
+        for interaction in self.interactions:
+            _, path = path_key(interaction["method"], interaction["url"])
+            stats = endpoints.setdefault(f"{interaction['method']} {path}", {"count": 0, "seconds": 0.0})
+            stats["count"] += 1
+            stats["seconds"] += interaction["elapsed"] + interaction["transfer"]
+        body_bytes = sum(len(self.load_body(digest)) for digest in self.bodies)
+        return {"interactions": len(self.interactions), "bodies": len(self.bodies),
+                "body_bytes": body_bytes, "endpoints": endpoints}
+
+
+class ReplayedURLResponse(io.BytesIO):
+    """urllib.request.urlopen 的回放响应"""
+
+    def __init__(self, content, status, headers, url):
+        super().__init__(content)
+        self.status = status
+        self.headers = headers
+        self.url = url
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.headers
+
+
+def _request_url(request):
+    return request.full_url if isinstance(request, urllib.request.Request) else request
+
+
+def _request_method(request, data):
+    if isinstance(request, urllib.request.Request):
+        return request.get_method()
+    return "POST" if data is not None else "GET"
+
+
+@contextmanager
+def recording(cassette):
+    """把requests和urllib的请求与响应录制到cassette"""
+    import requests
+
+    original_send = requests.Session.send
+    original_urlopen = urllib.request.urlopen
+
+    def send(session, prepared, **kwargs):
+        start = time.perf_counter()
+        response = original_send(session, prepared, **kwargs)
+        elapsed = time.perf_counter() - start
+        # 读取完整响应体（流式响应之后从缓存的内容中迭代）
+        content = response.content
+        transfer = time.perf_counter() - start - elapsed
+        cassette.record(prepared.method, prepared.url, prepared.body, response.status_code, response.reason,
+                        response.headers, content, elapsed, transfer)
+        return response
+
+    def urlopen(request, data=None, *args, **kwargs):
+        start = time.perf_counter()
+        response = original_urlopen(request, data, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+        with response:
+            content = response.read()
+            status, headers, url = response.status, dict(response.headers), response.geturl()
+        transfer = time.perf_counter() - start - elapsed
+        body = request.data if isinstance(request, urllib.request.Request) else data
+        cassette.record(_request_method(request, data), _request_url(request), body, status, "", headers,
+                        content, elapsed, transfer)
+        return ReplayedURLResponse(content, status, headers, url)
+
+    requests.Session.send = send
+    urllib.request.urlopen = urlopen
+    try:
+        yield cassette
+    finally:
+        requests.Session.send = original_send
+        urllib.request.urlopen = original_urlopen
+
+
+@contextmanager
+def replaying(cassette, speed=1.0):
+    """不访问网络，从cassette返回响应；speed为耗时的缩放比例，0为不等待"""
+    import requests
+    from requests.structures import CaseInsensitiveDict
+    from datetime import timedelta
+
+    original_send = requests.Session.send
+    original_urlopen = urllib.request.urlopen
+
+    def wait(interaction):
+        if speed > 0:
+            time.sleep((interaction["elapsed"] + interaction["transfer"]) * speed)
+
+    def send(session, prepared, **kwargs):
+        try:
+            interaction = cassette.match(prepared.method, prepared.url, prepared.body)
+        except CassetteMiss as e:
+            raise requests.exceptions.ConnectionError(str(e), request=prepared)
+        wait(interaction)
+        content = cassette.load_body(interaction["body"])
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response.reason = interaction["reason"]
+        response.headers = CaseInsensitiveDict(interaction["headers"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = prepared.url
+        response.request = prepared
+        response.elapsed = timedelta(seconds=interaction["elapsed"])
+        response.raw = io.BytesIO(content)
+        response._content = content
+        response._content_consumed = True
+        return response
+
+    def urlopen(request, data=None, *args, **kwargs):
+        url = _request_url(request)
+        body = request.data if isinstance(request, urllib.request.Request) else data
+        try:
+            interaction = cassette.match(_request_method(request, data), url, body)
+        except CassetteMiss as e:
+            raise urllib.error.URLError(str(e))
+        wait(interaction)
+        return ReplayedURLResponse(cassette.load_body(interaction["body"]), interaction["status"],
+                                   interaction["headers"], url)
+
+    requests.Session.send = send
+    urllib.request.urlopen = urlopen
+    try:
+        yield cassette
+    finally:
+        requests.Session.send = original_send
+        urllib.request.urlopen = original_urlopen
+
+
+def resolve_node(args):
+    """返回(标签, 节点类, 覆盖的输入)"""
+    from run_benchmarks import SCENARIOS
+
+    if args.node:
+        module_name, class_name = args.node.split(":", 1)
+        label, overrides = class_name, {}
+    else:
+        module_name, class_name, overrides = SCENARIOS[args.scenario]
+        label = args.scenario
+    module = importlib.import_module(f"nodes.{module_name}")
+    return label, getattr(module, class_name), {**overrides, **json.loads(args.inputs or "{}")}
+
+
+def run_node(node_class, overrides, count, api_key):
+    """依次执行节点，返回每次的(耗时, 错误)"""
+    from run_benchmarks import build_inputs
+
+    node = node_class()
+    results = []
+    for index in range(count):
+        inputs = build_inputs(node_class, overrides, index, api_key=api_key)
+        start = time.perf_counter()
+        try:
+            getattr(node, node_class.FUNCTION)(**inputs)
+            error = None
+        except Exception as e:
+            error = str(e)
+        results.append((time.perf_counter() - start, error))
+    return results
+
+
+def main():
+    from run_benchmarks import BENCH_ENV, BENCH_KEY, SCENARIOS
+
+    parser = argparse.ArgumentParser(description="Record and replay provider HTTP exchanges")
+    parser.add_argument("mode", choices=("record", "replay", "show"))
+    parser.add_argument("cassette", help="cassette文件路径（.json或.json.gz）")
+    parser.add_argument("-s", "--scenario", choices=sorted(SCENARIOS), help="run_benchmarks.py中的场景")
+    parser.add_argument("--node", help="节点，格式为 模块:类，例如 kling_ppio_node:KlingPPIOText2VideoNode")
+    parser.add_argument("--inputs", help="覆盖的输入参数（JSON）")
+    parser.add_argument("-n", "--runs", type=int, default=1, help="执行次数")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放耗时的缩放比例，0为不等待")
+    args = parser.parse_args()
+
+    if args.mode == "show":
+        print(json.dumps(Cassette.load(args.cassette).summary(), ensure_ascii=False, indent=2))
+        return
+    if not args.scenario and not args.node:
+        parser.error("record and replay need --scenario or --node")
+
+    label, node_class, overrides = resolve_node(args)
+    if args.mode == "record":
+        cassette = Cassette(meta={"node": f"{node_class.__module__}.{node_class.__name__}", "runs": args.runs,
+                                  "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+        with recording(cassette):
+            # 录制时使用真实密钥（输入为空时节点从环境变量或config.ini读取）
+            results = run_node(node_class, overrides, args.runs, api_key="")
+        cassette.save(args.cassette)
+        print(f"Recorded {len(cassette.interactions)} exchanges to {args.cassette}")
+    else:
+        for env_var in BENCH_ENV:
+            os.environ[env_var] = BENCH_KEY
+        with replaying(Cassette.load(args.cassette), args.speed):
+            results = run_node(node_class, overrides, args.runs, api_key=BENCH_KEY)
+
+    for index, (seconds, error) in enumerate(results):
+        print(f"{label} #{index}: {seconds:.3f} s{'  error: ' + error[:120] if error else ''}")
+
+
+if __name__ == "__main__":
+    main()
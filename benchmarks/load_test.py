@@ -0,0 +1,414 @@
+"""
+并发工作流负载测试
+
+按目标到达率（泊松分布）回放记录的节点调用（图像、视频和TTS混合），请求发往本地模拟服务商。
+与ComfyUI相同，调用在执行器线程中依次执行（--executor-workers 默认为1）；同时在独立的事件循环
+中运行插件注册的API路由，并按固定频率请求这些路由，用于发现阻塞事件循环的处理函数
+（例如 /minimax_refresh_voices）。
+
+按时间输出：已到达和已完成的调用数、排队长度、事件循环延迟、线程数和内存；结束时输出排队延迟、
+执行耗时、吞吐量和内存增长的汇总。
+
+工作负载文件为JSON列表，每项为 {"scenario": 场景名, "weight": 权重, "inputs": {覆盖的输入}}，
+或用 {"module": 节点模块, "class": 节点类} 代替场景名。场景见 run_benchmarks.py；
+--save-workload 导出默认的混合负载作为模板。
+
+用法（在插件根目录下运行）：
+    python benchmarks/load_test.py --rate 0.5 --duration 120
+    python benchmarks/load_test.py --workload my_mix.json --rate 2 --executor-workers 4 --route-rate 5
+"""
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from mock_provider import MockProviderServer, MockSettings, redirect_requests  # noqa: E402
+from run_benchmarks import BENCH_ENV, BENCH_KEY, SCENARIOS, build_inputs, peak_rss_mb  # noqa: E402
+from nodes.latency_tracker import percentile  # noqa: E402
+
+
+# 默认的混合负载：以图像为主，TTS次之，少量视频
+DEFAULT_WORKLOAD = [
+    {"scenario": "seedream_ppio", "weight": 3},
+    {"scenario": "seedream_fal", "weight": 2},
+    {"scenario": "seedream_ark", "weight": 1},
+    {"scenario": "doubao_tts", "weight": 2},
+    {"scenario": "minimax_tts", "weight": 2},
+    {"scenario": "qwen3_tts", "weight": 1},
+    {"scenario": "wan_t2v_ppio", "weight": 1},
+]
+
+# 注册API路由的模块
+ROUTE_MODULES = ("minimax_tts_node", "qwen3_tts_node", "scheduler", "seedream_router_node", "metrics")
+
+# 负载期间轮流请求的路由
+ROUTE_PROBES = (
+    ("GET", "/cc_api/scheduler", None),
+    ("GET", "/cc_api/metrics", None),
+    ("GET", "/cc_api/metrics/prometheus", None),
+    ("GET", "/cc_api/latency", None),
+    ("POST", "/minimax_refresh_voices", {"api_key": BENCH_KEY, "voice_type": "all"}),
+)
+
+
+def current_rss_mb():
+    """当前常驻内存（MB），无法读取时返回峰值"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def load_workload(path):
+    """读取工作负载，返回[(标签, 节点类, 覆盖输入, 权重)]"""
+    from nodes.metrics import traced_node_class
+
+    entries = DEFAULT_WORKLOAD
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    workload = []
+    for entry in entries:
+        if "scenario" in entry:
+            module_name, class_name, overrides = SCENARIOS[entry["scenario"]]
+            label = entry["scenario"]
+        else:
+            module_name, class_name, overrides = entry["module"], entry["class"], {}
+            label = entry.get("label", class_name)
+        module = importlib.import_module(f"nodes.{module_name}")
+        node_class = traced_node_class(getattr(module, class_name))
+        workload.append((label, node_class, {**overrides, **entry.get("inputs", {})}, float(entry.get("weight", 1))))
+    return workload
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    return {"p50": round(percentile(values, 0.5), 4), "p95": round(percentile(values, 0.95), 4),
+            "max": round(values[-1], 4)}
+
+
+class RouteHost:
+    """在独立线程的事件循环中运行插件的API路由，并测量事件循环延迟"""
+
+    def __init__(self, probe_interval=0.02):
+        self.probe_interval = probe_interval
+        self.base_url = ""
+        self._loop = None
+        self._runner = None
+        self._lags = []
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="route_host", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(30):
+            raise RuntimeError("route host failed to start")
+        return self
+
+    def _build_app(self):
+        from aiohttp import web
+        app = web.Application()
+        for module_name in ROUTE_MODULES:
+            module = importlib.import_module(f"nodes.{module_name}")
+            for method, path, handler in getattr(module, "ROUTES", []):
+                app.router.add_route(method, path, handler)
+        return app
+
+    async def _probe_lag(self):
+        while True:
+            start = self._loop.time()
+            await asyncio.sleep(self.probe_interval)
+            lag = self._loop.time() - start - self.probe_interval
+            with self._lock:
+                self._lags.append(max(0.0, lag))
+
+    def _run(self):
+        from aiohttp import web
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self._build_app(), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        self._loop.run_until_complete(site.start())
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+        self._loop.create_task(self._probe_lag())
+        self._ready.set()
+        self._loop.run_forever()
+
+    def take_lags(self):
+        """取出上次调用以来的事件循环延迟样本（秒）"""
+        with self._lock:
+            lags, self._lags = self._lags, []
+        return lags
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(5)
+
+
+class LoadTest:
+    """按到达率提交节点调用，由执行器线程依次执行，并定期采样运行状态"""
+
+    def __init__(self, workload, rate, duration, executor_workers=1, route_host=None, route_rate=0.0,
+                 sample_interval=5.0, seed=0, route_probes=ROUTE_PROBES):
+        self.workload = workload
+        self.rate = rate
+        self.duration = duration
+        self.executor_workers = executor_workers
+        self.route_host = route_host
+        self.route_rate = route_rate
+        self.route_probes = route_probes
+        self.sample_interval = sample_interval
+        self._random = random.Random(seed)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._counter = itertools.count()
+        self._instances = {}
+        self.arrived = 0
+        self.running = 0
+        self.records = []
+        self.route_records = []
+        self.samples = []
+        self.lags = []
+
+    def _pick(self):
+        total = sum(weight for *_, weight in self.workload)
+        roll = self._random.uniform(0, total)
+        for entry in self.workload:
+            roll -= entry[3]
+            if roll <= 0:
+                return entry
+        return self.workload[-1]
+
+    def _executor(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            arrived_at, (label, node_class, overrides, _), index = item
+            started_at = time.perf_counter()
+            with self._lock:
+                self.running += 1
+            node = self._instances.setdefault(node_class, node_class())
+            error = None
+            try:
+                getattr(node, node_class.FUNCTION)(**build_inputs(node_class, overrides, index))
+            except Exception as e:
+                error = str(e)
+            finished_at = time.perf_counter()
+            with self._lock:
+                self.running -= 1
+                self.records.append({
+                    "label": label,
+                    "queue_delay": started_at - arrived_at,
+                    "service": finished_at - started_at,
+                    "finished_at": finished_at,
+                    "error": error,
+                })
+
+    def _probe_routes(self):
+        import requests
+        probes = itertools.cycle(self.route_probes)
+        while not self._stop.wait(1.0 / self.route_rate):
+            method, path, body = next(probes)
+            start = time.perf_counter()
+            try:
+                response = requests.request(method, self.route_host.base_url + path, json=body, timeout=60)
+                status = response.status_code
+            except Exception as e:
+                status = str(e)
+            self.route_records.append({"path": path, "seconds": time.perf_counter() - start, "status": status})
+
+    def _sample(self, started_at):
+        lags = self.route_host.take_lags() if self.route_host else []
+        self.lags.extend(lags)
+        with self._lock:
+            sample = {
+                "t": round(time.perf_counter() - started_at, 1),
+                "arrived": self.arrived,
+                "done": len(self.records),
+                "queued": self._queue.qsize(),
+                "running": self.running,
+                "threads": threading.active_count(),
+                "rss_mb": round(current_rss_mb() or 0.0, 1),
+                "loop_lag_max_ms": round(max(lags) * 1000, 1) if lags else None,
+            }
+        self.samples.append(sample)
+        lag = f"{sample['loop_lag_max_ms']:.1f}" if sample["loop_lag_max_ms"] is not None else "-"
+        print(f"{sample['t']:>7} {sample['arrived']:>8} {sample['done']:>6} {sample['queued']:>6} "
+              f"{sample['running']:>7} {sample['threads']:>7} {sample['rss_mb']:>8} {lag:>12}")
+
+    def _sampler(self, started_at):
+        while not self._stop.wait(self.sample_interval):
+            self._sample(started_at)
+
+    def run(self, drain_timeout=300):
+        workers = [threading.Thread(target=self._executor, name=f"executor_{i}", daemon=True)
+                   for i in range(self.executor_workers)]
+        for worker in workers:
+            worker.start()
+        started_at = time.perf_counter()
+        print(f"{'t(s)':>7} {'arrived':>8} {'done':>6} {'queue':>6} {'running':>7} {'threads':>7} {'rss MB':>8} {'loop lag ms':>12}")
+        self._sample(started_at)
+        helpers = [threading.Thread(target=self._sampler, args=(started_at,), daemon=True)]
+        if self.route_host is not None and self.route_rate > 0:
+            helpers.append(threading.Thread(target=self._probe_routes, daemon=True))
+        for helper in helpers:
+            helper.start()
+
+        # 泊松到达
+        next_arrival = started_at
+        while True:
+            next_arrival += self._random.expovariate(self.rate)
+            if next_arrival - started_at > self.duration:
+                break
+            time.sleep(max(0.0, next_arrival - time.perf_counter()))
+            with self._lock:
+                self.arrived += 1
+            self._queue.put((time.perf_counter(), self._pick(), next(self._counter)))
+
+        # 等待已到达的调用执行完
+        deadline = time.perf_counter() + drain_timeout
+        while len(self.records) < self.arrived and time.perf_counter() < deadline:
+            time.sleep(0.2)
+        for _ in workers:
+            self._queue.put(None)
+        self._stop.set()
+        for helper in helpers:
+            helper.join(5)
+        self._sample(started_at)
+        return time.perf_counter() - started_at
+
+    def report(self, elapsed):
+        records = list(self.records)
+        errors = [r for r in records if r["error"]]
+        by_label = {}
+        for record in records:
+            by_label.setdefault(record["label"], []).append(record)
+        routes = {}
+        for record in self.route_records:
+            routes.setdefault(record["path"], []).append(record["seconds"])
+        first, last = self.samples[0], self.samples[-1]
+        return {
+            "arrival_rate": self.rate,
+            "executor_workers": self.executor_workers,
+            "elapsed": round(elapsed, 1),
+            "arrived": self.arrived,
+            "completed": len(records),
+            "errors": len(errors),
+            "throughput": round(len(records) / elapsed, 3) if elapsed > 0 else None,
+            "queue_delay": summarize([r["queue_delay"] for r in records]),
+            "service": summarize([r["service"] for r in records]),
+            "by_node": {
+                label: {"count": len(items), "service": summarize([r["service"] for r in items]),
+                        "errors": sum(1 for r in items if r["error"])}
+                for label, items in sorted(by_label.items())
+            },
+            "loop_lag": summarize(self.lags),
+            "routes": {path: summarize(values) for path, values in sorted(routes.items())},
+            "threads_peak": max(s["threads"] for s in self.samples),
+            "rss_start_mb": first["rss_mb"],
+            "rss_end_mb": last["rss_mb"],
+            "rss_growth_mb": round(last["rss_mb"] - first["rss_mb"], 1),
+            "first_error": errors[0]["error"] if errors else None,
+            "samples": self.samples,
+        }
+
+
+def print_summary(summary):
+    print()
+    print(f"Arrived {summary['arrived']}, completed {summary['completed']}, errors {summary['errors']} "
+          f"in {summary['elapsed']} s ({summary['throughput']} req/s at {summary['arrival_rate']} req/s offered)")
+    for name in ("queue_delay", "service", "loop_lag"):
+        stats = summary[name]
+        print(f"  {name:<12} p50={stats['p50']}  p95={stats['p95']}  max={stats['max']} (s)")
+    print(f"  threads peak {summary['threads_peak']}, RSS {summary['rss_start_mb']} -> {summary['rss_end_mb']} MB "
+          f"({summary['rss_growth_mb']:+} MB)")
+    print("\nPer node (service time, s):")
+    for label, stats in summary["by_node"].items():
+        print(f"  {label:<16} n={stats['count']:<5} p50={stats['service']['p50']}  p95={stats['service']['p95']}  "
+              f"errors={stats['errors']}")
+    if summary["routes"]:
+        print("\nRoute latency under load (s):")
+        for path, stats in summary["routes"].items():
+            print(f"  {path:<30} p50={stats['p50']}  p95={stats['p95']}  max={stats['max']}")
+    if summary["first_error"]:
+        print(f"\nFirst error: {summary['first_error'][:200]}")
+    if summary["queue_delay"]["max"] and summary["queue_delay"]["max"] > summary["elapsed"] / 2:
+        print("\nQueue delay keeps growing: the executor is saturated at this arrival rate.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test nodes against the local mock provider")
+    parser.add_argument("--workload", help="工作负载JSON文件，默认使用内置的混合负载")
+    parser.add_argument("--save-workload", help="把默认的混合负载保存到该路径后退出")
+    parser.add_argument("--rate", type=float, default=0.5, help="到达率（次/秒）")
+    parser.add_argument("--duration", type=float, default=60.0, help="产生负载的时间（秒）")
+    parser.add_argument("--executor-workers", type=int, default=1, help="执行器线程数（ComfyUI为1）")
+    parser.add_argument("--route-rate", type=float, default=2.0, help="请求API路由的频率（次/秒），0为不请求")
+    parser.add_argument("--sample-interval", type=float, default=5.0, help="采样间隔（秒）")
+    parser.add_argument("--drain-timeout", type=float, default=300.0, help="负载结束后等待执行完成的最长时间（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="到达时间和负载选择的随机数种子")
+    parser.add_argument("--json", help="保存JSON结果的路径")
+    MockSettings.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.save_workload:
+        with open(args.save_workload, "w", encoding="utf-8") as f:
+            json.dump(DEFAULT_WORKLOAD, f, ensure_ascii=False, indent=2)
+        print(f"Workload saved to {args.save_workload}")
+        return
+
+    for env_var in BENCH_ENV:
+        os.environ[env_var] = BENCH_KEY
+
+    workload = load_workload(args.workload)
+    with MockProviderServer(MockSettings.from_args(args)) as server, redirect_requests(server.base_url):
+        # 音色刷新接口返回当前的音色列表，避免负载测试改写本地的音色缓存文件
+        from nodes.voice_catalog import minimax_voice_catalog
+        server.provider.minimax_voices = dict(minimax_voice_catalog().voice_ids)
+        probes = ROUTE_PROBES
+        if not server.provider.minimax_voices:
+            print("No MiniMax voice catalog found, skipping /minimax_refresh_voices")
+            probes = tuple(probe for probe in ROUTE_PROBES if probe[1] != "/minimax_refresh_voices")
+        # 事件循环延迟始终测量；--route-rate 为0时只测量节点执行对事件循环的影响
+        route_host = RouteHost().start()
+        print(f"Mock provider: {server.base_url}, routes: {route_host.base_url}")
+        test = LoadTest(workload, args.rate, args.duration, args.executor_workers, route_host,
+                        args.route_rate, args.sample_interval, args.seed, probes)
+        try:
+            elapsed = test.run(args.drain_timeout)
+        finally:
+            route_host.stop()
+        summary = test.report(elapsed)
+        summary["mock_requests"] = server.provider.stats
+
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"\nResults saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+"""
+本地模拟服务商接口
+
+用aiohttp在本机模拟节点调用的服务商接口，基准测试无需网络和真实密钥：
+- 派欧云异步任务：POST /v3/async/<模型> 提交，GET /v3/async/task-result 查询（排队 → 生成 → 完成）
+- 派欧云 Seedream 4.0、fal.run、火山方舟图像生成（b64_json）
+- 豆包语音合成（逐行返回的流式JSON）、MiniMax t2a_v2（十六进制音频）和音色列表、DashScope Qwen3-TTS（音频URL）
+
+可配置响应延迟、抖动、结果下载带宽，以及按比例注入的500错误、429限流和失败的异步任务。
+redirect_requests() 把requests发往上述服务商域名的请求改写到本地服务器，
+接口返回的结果文件地址直接指向本地服务器。
+
+单独运行（在插件根目录下）：
+    python benchmarks/mock_provider.py --port 8765 --latency 0.2 --failure-rate 0.05
+"""
+import argparse
+import asyncio
+import base64
+import io
+import itertools
+import json
+import math
+import random
+import struct
+import threading
+import time
+import wave
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+
+from aiohttp import web
+
+
+# 需要改写到本地服务器的服务商域名
+MOCK_HOSTS = (
+    "api.ppinfra.com",
+    "fal.run",
+    "ark.cn-beijing.volces.com",
+    "openspeech.bytedance.com",
+    "api.minimaxi.com",
+    "dashscope.aliyuncs.com",
+)
+
+
+class MockSettings:
+    """模拟接口的行为参数
+
+    latency/jitter: 每个请求的固定延迟和随机附加延迟（秒）
+    bandwidth: 结果文件和流式响应的下载带宽（字节/秒），0表示不限速
+    failure_rate / rate_limit_rate: 返回500错误和429限流的请求比例（不含结果文件下载）
+    queue_seconds / processing_seconds: 异步任务排队和生成的时间
+    task_failure_rate: 异步任务以TASK_STATUS_FAILED结束的比例
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, bandwidth=0, failure_rate=0.0, rate_limit_rate=0.0,
+                 queue_seconds=0.5, processing_seconds=2.0, task_failure_rate=0.0,
+                 audio_seconds=3.0, image_size=512, video_bytes=2 * 1024 * 1024, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.queue_seconds = queue_seconds
+        self.processing_seconds = processing_seconds
+        self.task_failure_rate = task_failure_rate
+        self.audio_seconds = audio_seconds
+        self.image_size = image_size
+        self.video_bytes = video_bytes
+        self.seed = seed
+
+    @classmethod
+    def add_arguments(cls, parser):
+        """向命令行解析器添加模拟参数"""
+        group = parser.add_argument_group("mock provider")
+        group.add_argument("--latency", type=float, default=0.05, help="每个请求的延迟（秒）")
+        group.add_argument("--jitter", type=float, default=0.0, help="随机附加延迟的上限（秒）")
+        group.add_argument("--bandwidth-mbps", type=float, default=0.0, help="下载带宽（Mbit/s），0为不限速")
+        group.add_argument("--failure-rate", type=float, default=0.0, help="返回500错误的请求比例")
+        group.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回429限流的请求比例")
+        group.add_argument("--queue-seconds", type=float, default=0.5, help="异步任务排队时间（秒）")
+        group.add_argument("--processing-seconds", type=float, default=2.0, help="异步任务生成时间（秒）")
+        group.add_argument("--task-failure-rate", type=float, default=0.0, help="异步任务失败的比例")
+        group.add_argument("--audio-seconds", type=float, default=3.0, help="合成音频的时长（秒）")
+        group.add_argument("--mock-seed", type=int, default=0, help="随机数种子")
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(
+            latency=args.latency,
+            jitter=args.jitter,
+            bandwidth=int(args.bandwidth_mbps * 1024 * 1024 / 8),
+            failure_rate=args.failure_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            queue_seconds=args.queue_seconds,
+            processing_seconds=args.processing_seconds,
+            task_failure_rate=args.task_failure_rate,
+            audio_seconds=args.audio_seconds,
+            seed=args.mock_seed,
+        )
+
+
+def make_pcm(seconds, sample_rate=24000):
+    """生成16位单声道正弦波PCM数据"""
+    count = int(seconds * sample_rate)
+    samples = (int(8000 * math.sin(2 * math.pi * 440 * i / sample_rate)) for i in range(count))
+    return struct.pack(f"<{count}h", *samples)
+
+
+def make_wav(seconds, sample_rate=24000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(make_pcm(seconds, sample_rate))
+    return buffer.getvalue()
+
+
+def make_png(size):
+    """生成渐变PNG图像（只依赖标准库）"""
+    import zlib
+    row = bytes(itertools.chain.from_iterable((x % 256, (x * 2) % 256, 128) for x in range(size)))
+    raw = b"".join(b"\x00" + row for _ in range(size))
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+class MockProvider:
+    """模拟接口的aiohttp应用和运行状态"""
+
+    def __init__(self, settings=None):
+        self.settings = settings or MockSettings()
+        self.base_url = ""
+        self._random = random.Random(self.settings.seed)
+        self._task_ids = itertools.count(1)
+        self._tasks = {}
+        self.stats = {}
+        self.assets = {
+            "image.png": (make_png(self.settings.image_size), "image/png"),
+            "audio.wav": (make_wav(self.settings.audio_seconds), "audio/wav"),
+            "video.mp4": (bytes(self._random.getrandbits(8) for _ in range(1024)) *
+                          max(1, self.settings.video_bytes // 1024), "video/mp4"),
+        }
+        self.pcm = make_pcm(self.settings.audio_seconds)
+        # MiniMax音色列表接口返回的 音色名称 -> voice_id
+        self.minimax_voices = {"青涩青年音色": "male-qn-qingse", "少女音色": "female-shaonv"}
+
+    def build_app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get("/assets/{name}", self.asset)
+        app.router.add_get("/_mock/stats", self.get_stats)
+        app.router.add_get("/api.ppinfra.com/v3/async/task-result", self.ppio_task_result)
+        app.router.add_post("/api.ppinfra.com/v3/async/{model}", self.ppio_submit)
+        app.router.add_post("/api.ppinfra.com/v3/seedream-4.0", self.ppio_seedream)
+        app.router.add_post("/fal.run/{path:.*}", self.fal_run)
+        app.router.add_post("/ark.cn-beijing.volces.com/api/v3/images/generations", self.ark_images)
+        app.router.add_post("/openspeech.bytedance.com/api/v3/tts/unidirectional", self.doubao_tts)
+        app.router.add_post("/api.minimaxi.com/v1/t2a_v2", self.minimax_t2a)
+        app.router.add_post("/api.minimaxi.com/v1/get_voice", self.minimax_get_voice)
+        app.router.add_post("/dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation",
+                            self.dashscope_tts)
+        return app
+
+    def asset_url(self, name):
+        return f"{self.base_url}/assets/{name}"
+
+    def add_asset(self, name, body, content_type="application/octet-stream"):
+        """添加或替换结果文件，返回下载地址"""
+        self.assets[name] = (body, content_type)
+        return self.asset_url(name)
+
+    def _count(self, name, outcome):
+        counts = self.stats.setdefault(name, {})
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+    async def _simulate(self, name):
+        """模拟网络延迟并按比例注入错误，需要返回错误时返回响应，否则返回None"""
+        delay = self.settings.latency + self._random.uniform(0, self.settings.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        roll = self._random.random()
+        if roll < self.settings.rate_limit_rate:
+            self._count(name, "429")
+            return web.json_response({"message": "too many requests"}, status=429, headers={"Retry-After": "1"})
+        if roll < self.settings.rate_limit_rate + self.settings.failure_rate:
+            self._count(name, "500")
+            return web.json_response({"message": "mock internal error"}, status=500)
+        self._count(name, "ok")
+        return None
+
+    async def _send(self, request, body, content_type):
+        """按带宽限制分块发送响应体"""
+        bandwidth = self.settings.bandwidth
+        if not bandwidth:
+            return web.Response(body=body, content_type=content_type)
+        response = web.StreamResponse(headers={"Content-Type": content_type, "Content-Length": str(len(body))})
+        await response.prepare(request)
+        chunk_size = 64 * 1024
+        for offset in range(0, len(body), chunk_size):
+            chunk = body[offset:offset + chunk_size]
+            await response.write(chunk)
+            await asyncio.sleep(len(chunk) / bandwidth)
+        await response.write_eof()
+        return response
+
+    async def asset(self, request):
+        name = request.match_info["name"]
+        if name not in self.assets:
+            raise web.HTTPNotFound()
+        self._count("assets", "ok")
+        body, content_type = self.assets[name]
+        return await self._send(request, body, content_type)
+
+    async def get_stats(self, request):
+        return web.json_response({"requests": self.stats, "tasks": len(self._tasks)})
+
+    async def ppio_submit(self, request):
+        model = request.match_info["model"]
+        await request.read()
+        error = await self._simulate(f"ppio/{model}")
+        if error is not None:
+            return error
+        task_id = f"mock-{next(self._task_ids)}"
+        self._tasks[task_id] = {
+            "created_at": time.monotonic(),
+            "failed": self._random.random() < self.settings.task_failure_rate,
+        }
+        return web.json_response({"task_id": task_id})
+
+    async def ppio_task_result(self, request):
+        error = await self._simulate("ppio/task-result")
+        if error is not None:
+            return error
+        task_id = request.query.get("task_id", "")
+        task = self._tasks.get(task_id)
+        if task is None:
+            return web.json_response({"message": f"task {task_id} not found"}, status=404)
+        elapsed = time.monotonic() - task["created_at"]
+        if elapsed < self.settings.queue_seconds:
+            status = "TASK_STATUS_QUEUED"
+        elif elapsed < self.settings.queue_seconds + self.settings.processing_seconds:
+            status = "TASK_STATUS_PROCESSING"
+        else:
+            status = "TASK_STATUS_FAILED" if task["failed"] else "TASK_STATUS_SUCCEEDED"
+        progress = min(100, int(100 * elapsed / max(0.001, self.settings.queue_seconds + self.settings.processing_seconds)))
+        result = {"task": {"task_id": task_id, "status": status, "progress_percent": progress}}
+        if status == "TASK_STATUS_FAILED":
+            result["task"]["reason"] = "mock task failure"
+        if status == "TASK_STATUS_SUCCEEDED":
+            result["videos"] = [{"video_url": self.asset_url("video.mp4"), "video_type": "mp4"}]
+        return web.json_response(result)
+
+    async def ppio_seedream(self, request):
+        payload = await request.json()
+        error = await self._simulate("ppio/seedream-4.0")
+        if error is not None:
+            return error
+        count = max(1, int(payload.get("max_images", 1))) if payload.get("sequential_image_generation") == "auto" else 1
+        return web.json_response({"images": [self.asset_url("image.png")] * count})
+
+    async def fal_run(self, request):
+        await request.read()
+        error = await self._simulate("fal/" + request.match_info["path"])
+        if error is not None:
+            return error
+        return web.json_response({
+            "images": [{"url": self.asset_url("image.png"), "content_type": "image/png"}],
+            "seed": self._random.randint(0, 2 ** 31),
+        })
+
+    async def ark_images(self, request):
+        await request.read()
+        error = await self._simulate("ark/images")
+        if error is not None:
+            return error
+        encoded = base64.b64encode(self.assets["image.png"][0]).decode("ascii")
+        return web.json_response({"created": int(time.time()), "data": [{"b64_json": encoded}]})
+
+    async def doubao_tts(self, request):
+        """豆包流式合成：每行一个JSON，音频分块base64编码，最后返回结束码"""
+        payload = await request.json()
+        error = await self._simulate("doubao/tts")
+        if error is not None:
+            return error
+        audio_format = payload.get("req_params", {}).get("audio_params", {}).get("format", "pcm")
+        audio = self.pcm if audio_format == "pcm" else self.assets["audio.wav"][0]
+        lines = []
+        chunk_size = 32 * 1024
+        for offset in range(0, len(audio), chunk_size):
+            chunk = base64.b64encode(audio[offset:offset + chunk_size]).decode("ascii")
+            lines.append(json.dumps({"code": 0, "message": "", "data": chunk}))
+        lines.append(json.dumps({"code": 20000000, "message": "OK", "data": None}))
+        return await self._send(request, ("\n".join(lines) + "\n").encode("utf-8"), "application/json")
+
+    async def minimax_t2a(self, request):
+        await request.read()
+        error = await self._simulate("minimax/t2a_v2")
+        if error is not None:
+            return error
+        return web.json_response({
+            "data": {"audio": self.assets["audio.wav"][0].hex(), "status": 2},
+            "extra_info": {"audio_length": int(self.settings.audio_seconds * 1000), "audio_format": "wav"},
+            "base_resp": {"status_code": 0, "status_msg": "success"},
+        })
+
+    async def minimax_get_voice(self, request):
+        await request.read()
+        error = await self._simulate("minimax/get_voice")
+        if error is not None:
+            return error
+        return web.json_response({
+            "system_voice": [{"voice_id": voice_id, "voice_name": name} for name, voice_id in self.minimax_voices.items()],
+            "voice_cloning": [],
+            "voice_generation": [],
+            "base_resp": {"status_code": 0, "status_msg": "success"},
+        })
+
+    async def dashscope_tts(self, request):
+        await request.read()
+        error = await self._simulate("dashscope/tts")
+        if error is not None:
+            return error
+        return web.json_response({
+            "output": {"finish_reason": "stop", "audio": {"url": self.asset_url("audio.wav")}},
+            "request_id": f"mock-{next(self._task_ids)}",
+        })
+
+
+class MockProviderServer:
+    """在后台线程中运行模拟接口，用作上下文管理器"""
+
+    def __init__(self, settings=None, host="127.0.0.1", port=0):
+        self.provider = MockProvider(settings)
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    @property
+    def base_url(self):
+        return self.provider.base_url
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mock_provider", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(10):
+            raise RuntimeError("mock provider server failed to start")
+        return self
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.provider.build_app(), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        host, port = self._runner.addresses[0][:2]
+        self.port = port
+        self.provider.base_url = f"http://{host}:{port}"
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+@contextmanager
+def redirect_requests(base_url, hosts=MOCK_HOSTS):
+    """把requests发往服务商域名的请求改写为 <base_url>/<域名>/<路径>"""
+    import requests
+
+    original_send = requests.Session.send
+    base = urlsplit(base_url)
+
+    def send(session, prepared, **kwargs):
+        parts = urlsplit(prepared.url)
+        if parts.hostname in hosts:
+            prepared.url = urlunsplit((base.scheme, base.netloc, f"/{parts.hostname}{parts.path}", parts.query, ""))
+        return original_send(session, prepared, **kwargs)
+
+    requests.Session.send = send
+    try:
+        yield
+    finally:
+        requests.Session.send = original_send
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the mock provider server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    MockSettings.add_arguments(parser)
+    args = parser.parse_args()
+
+    provider = MockProvider(MockSettings.from_args(args))
+    provider.base_url = f"http://{args.host}:{args.port}"
+    print(f"Mock provider listening on {provider.base_url}")
+    print("Requests are routed by host prefix, e.g. POST /api.ppinfra.com/v3/async/wan-2.5-t2v-preview")
+    web.run_app(provider.build_app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+节点基准测试
+
+启动本地模拟服务商（benchmarks/mock_provider.py），把节点的请求改写到模拟服务器，
+并发执行真实的节点类，报告吞吐量、p50/p95耗时、进程峰值内存和各阶段的平均耗时。
+不需要网络和真实密钥。
+
+用法（在插件根目录下运行）：
+    python benchmarks/run_benchmarks.py                       # 全部场景
+    python benchmarks/run_benchmarks.py -s seedream_ark -s doubao_tts -n 50 -c 8
+    python benchmarks/run_benchmarks.py --latency 0.5 --bandwidth-mbps 50 --failure-rate 0.1
+    python benchmarks/run_benchmarks.py --json bench.json     # 同时保存JSON结果
+    python benchmarks/run_benchmarks.py -s seedream_ppio -n 3 -c 1 --cassette seedream.json.gz  # 回放录制的交互
+
+--cassette 使用 benchmarks/cassette.py 录制的真实交互代替模拟服务商，录制和回放的执行次数应一致。
+
+注意：部分视频节点按固定的5秒间隔轮询任务结果，单次执行至少需要一个轮询间隔。
+"""
+import argparse
+import importlib
+import inspect
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from mock_provider import MockProviderServer, MockSettings, redirect_requests  # noqa: E402
+from nodes.latency_tracker import percentile  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# 基准测试使用的密钥（只发送给模拟服务器）
+BENCH_KEY = "mock-benchmark-key"
+BENCH_ENV = ("PPIO_API_KEY", "VOLCENGINE_API_KEY", "FAL_API_KEY", "MINIMAX_API_KEY", "DASHSCOPE_API_KEY")
+
+# 场景名称 -> (节点模块, 节点类, 覆盖的输入参数)
+# 文本和种子在每次执行时加上序号并关闭use_cache，避免命中TTS缓存和请求结果缓存
+SCENARIOS = {
+    "seedream_ark": ("seedream_node", "Seedream4", {"prompt": "a lighthouse at dawn"}),
+    "seedream_fal": ("seedream_fal_node", "Seedream4Fal", {"prompt": "a lighthouse at dawn"}),
+    "seedream_ppio": ("seedream_ppio_node", "Seedream4PPIO", {"prompt": "a lighthouse at dawn"}),
+    "wan_t2v_ppio": ("wan_ppio_node", "WanPPIOText2VideoNode", {"prompt": "waves rolling onto a beach"}),
+    "doubao_tts": ("doubao_tts_node", "DoubaoTTS", {
+        "text": "今天天气很好，我们去公园散步吧。", "app_id": "mock-app", "access_key": BENCH_KEY,
+    }),
+    "minimax_tts": ("minimax_tts_node", "MiniMaxTTS", {"text": "今天天气很好，我们去公园散步吧。"}),
+    "qwen3_tts": ("qwen3_tts_node", "Qwen3TTS", {"text": "今天天气很好，我们去公园散步吧。"}),
+}
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB），不支持时返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def default_value(spec):
+    """根据INPUT_TYPES中的定义生成输入值：下拉框取默认值或第一项，其他类型取默认值"""
+    kind = spec[0]
+    options = spec[1] if len(spec) > 1 and isinstance(spec[1], dict) else {}
+    if isinstance(kind, (list, tuple)):
+        return options.get("default", kind[0] if kind else "")
+    if "default" in options:
+        return options["default"]
+    if kind == "IMAGE":
+        import torch
+        return torch.rand(1, 512, 512, 3)
+    return {"STRING": "", "INT": 0, "FLOAT": 0.0, "BOOLEAN": False}.get(kind)
+
+
+def build_inputs(node_class, overrides, index, api_key=BENCH_KEY):
+    """生成一次执行的参数：必填输入取默认值，再应用场景的覆盖参数"""
+    inputs = {}
+    for name, spec in node_class.INPUT_TYPES().get("required", {}).items():
+        inputs[name] = default_value(spec)
+    parameters = inspect.signature(getattr(node_class, node_class.FUNCTION)).parameters
+    if "api_key" in parameters:
+        inputs["api_key"] = api_key
+    if "use_cache" in parameters:
+        inputs["use_cache"] = False
+    inputs.update(overrides)
+    for name in ("prompt", "text"):
+        if name in inputs:
+            inputs[name] = f"{inputs[name]} #{index}"
+    if "seed" in inputs:
+        inputs["seed"] = index + 1
+    return {name: value for name, value in inputs.items() if name in parameters}
+
+
+def run_scenario(name, requests_count, concurrency):
+    """并发执行节点，返回统计结果"""
+    from nodes.metrics import MetricsRegistry, traced_node_class
+
+    module_name, class_name, overrides = SCENARIOS[name]
+    module = importlib.import_module(f"nodes.{module_name}")
+    node_class = traced_node_class(getattr(module, class_name))
+    function = getattr(node_class(), node_class.FUNCTION)
+    MetricsRegistry().reset()
+
+    def run_once(index):
+        inputs = build_inputs(node_class, overrides, index)
+        start = time.perf_counter()
+        try:
+            function(**inputs)
+            error = None
+        except Exception as e:
+            error = str(e)
+        return time.perf_counter() - start, error
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(run_once, range(requests_count)))
+    wall = time.perf_counter() - start
+
+    latencies = sorted(seconds for seconds, _ in results)
+    errors = [error for _, error in results if error]
+    phases = {}
+    for endpoint, stats in MetricsRegistry().snapshot(recent=1)["endpoints"].items():
+        for phase, values in stats.items():
+            if phase != "total":
+                phases[phase] = round(phases.get(phase, 0.0) + values["mean"], 4)
+    return {
+        "scenario": name,
+        "requests": requests_count,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "wall_seconds": round(wall, 3),
+        "throughput": round(requests_count / wall, 3) if wall > 0 else None,
+        "p50": round(percentile(latencies, 0.5), 4),
+        "p95": round(percentile(latencies, 0.95), 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1) if resource is not None else None,
+        "phases": phases,
+    }
+
+
+def print_report(results):
+    print(f"{'scenario':<16} {'n':>4} {'conc':>4} {'err':>4} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'peak RSS MB':>12}")
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "-"
+        print(
+            f"{r['scenario']:<16} {r['requests']:>4} {r['concurrency']:>4} {r['errors']:>4} "
+            f"{r['throughput']:>8.2f} {r['p50']:>8.3f} {r['p95']:>8.3f} {rss:>12}"
+        )
+    print("\nMean phase breakdown (s):")
+    for r in results:
+        breakdown = ", ".join(f"{phase}={seconds:.3f}" for phase, seconds in sorted(r["phases"].items()))
+        print(f"  {r['scenario']:<16} {breakdown or '-'}")
+        if r["first_error"]:
+            print(f"  {'':<16} first error: {r['first_error'][:120]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark nodes against the local mock provider")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="要运行的场景（可重复），默认全部")
+    parser.add_argument("-n", "--requests", type=int, default=20, help="每个场景的执行次数")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="并发执行数")
+    parser.add_argument("--json", help="保存JSON结果的路径")
+    parser.add_argument("--cassette", help="回放该cassette文件，不启动模拟服务商")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放耗时的缩放比例，0为不等待")
+    MockSettings.add_arguments(parser)
+    args = parser.parse_args()
+
+    for env_var in BENCH_ENV:
+        os.environ[env_var] = BENCH_KEY
+
+    results = []
+    mock_stats = None
+    if args.cassette:
+        from cassette import Cassette, replaying
+        with replaying(Cassette.load(args.cassette), args.speed):
+            print(f"Replaying {args.cassette}")
+            for name in args.scenario or list(SCENARIOS):
+                print(f"Running {name} ...")
+                results.append(run_scenario(name, args.requests, args.concurrency))
+    else:
+        with MockProviderServer(MockSettings.from_args(args)) as server, redirect_requests(server.base_url):
+            print(f"Mock provider: {server.base_url}")
+            for name in args.scenario or list(SCENARIOS):
+                print(f"Running {name} ...")
+                results.append(run_scenario(name, args.requests, args.concurrency))
+            mock_stats = server.provider.stats
+
+    print()
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "mock_requests": mock_stats}, f, ensure_ascii=False, indent=2)
+        print(f"\nResults saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
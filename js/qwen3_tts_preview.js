@@ -74,81 +74,16 @@ app.registerExtension({
                 // 显示容器
                 this.audioContainer.style.display = "block";
                 
-                // 发送API请求获取预览音频
-                fetch("/qwen3_tts_preview", {
-                    method: "POST",
-                    headers: {
-                        "Content-Type": "application/json",
-                    },
-                    body: JSON.stringify({
-                        voice: voice
-                    })
-                })
-                .then(response => {
-                    console.log("API响应状态:", response.status);
-                    console.log("API响应头:", response.headers);
-                    
-                    if (!response.ok) {
-                        return response.text().then(text => {
-                            throw new Error(`HTTP error! status: ${response.status}, text: ${text}`);
-                        });
-                    }
-                    
-                    return response.text().then(text => {
-                        console.log("API响应文本:", text);
-                        try {
-                            return JSON.parse(text);
-                        } catch (e) {
-                            console.error("JSON解析错误:", e);
-                            console.error("响应文本:", text);
-                            throw new Error(`Invalid JSON response: ${text}`);
-                        }
-                    });
-                })
-                .then(data => {
-                    console.log("API响应数据:", data);
-                    
-                    if (data.error) {
-                        throw new Error(data.error);
-                    }
-                    
-                    // 创建音频URL并设置到audio元素
-                    const audioBlob = this.base64ToBlob(data.audio, "audio/wav");
-                    const audioUrl = URL.createObjectURL(audioBlob);
-                    
-                    // 如果已有URL，先释放
-                    if (this.audioPreview.currentSrc) {
-                        URL.revokeObjectURL(this.audioPreview.currentSrc);
-                    }
-                    
-                    this.audioPreview.src = audioUrl;
-                })
-                .catch(error => {
-                    console.error("加载预览音频失败:", error);
-                    
-                    // 3秒后隐藏整个容器
+                // 加载失败时3秒后隐藏整个容器
+                this.audioPreview.onerror = () => {
+                    console.error("加载预览音频失败:", voice);
                     setTimeout(() => {
                         this.audioContainer.style.display = "none";
                     }, 3000);
-                });
-            };
-            
-            // 添加Base64转Blob的方法
-            nodeType.prototype.base64ToBlob = function(base64, mimeType) {
-                try {
-                    const byteCharacters = atob(base64);
-                    const byteNumbers = new Array(byteCharacters.length);
-                    
-                    for (let i = 0; i < byteCharacters.length; i++) {
-                        byteNumbers[i] = byteCharacters.charCodeAt(i);
-                    }
-                    
-                    const byteArray = new Uint8Array(byteNumbers);
-                    return new Blob([byteArray], { type: mimeType });
-                } catch (e) {
-                    console.error("Base64转Blob失败:", e);
-                    throw new Error("Failed to convert base64 to blob: " + e.message);
-                }
+                };
+                
+                // 直接使用预览文件地址，浏览器按需分段加载并缓存
+                this.audioPreview.src = "/qwen3_tts_preview?voice=" + encodeURIComponent(voice);
             };
         }
     }
@@ -0,0 +1,43 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+# 路由处理函数中阻塞调用使用的线程池，避免阻塞ComfyUI的事件循环
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cc_api_route")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """在线程池中执行阻塞函数并等待结果"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+class AsyncCoalescer:
+    """合并相同键的并发请求：同一时间只执行一次阻塞调用，其余请求等待同一结果
+
+    只在事件循环线程中使用，不需要加锁。
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def run(self, key, func, *args, **kwargs):
+        """执行func并返回结果；相同key的调用正在进行时直接等待其结果"""
+        future = self._inflight.get(key)
+        if future is None:
+            self.calls += 1
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+            self._inflight[key] = future
+            future.add_done_callback(functools.partial(self._done, key))
+        else:
+            self.coalesced += 1
+        # shield：某个客户端断开时不取消其他请求正在等待的调用
+        return await asyncio.shield(future)
+
+    def _done(self, key, future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
@@ -2,6 +2,9 @@ import numpy as np
 import torch
 import tempfile
 import os
+import io
+import hashlib
+import time
 
 try:
     import soundfile as sf
@@ -17,6 +20,11 @@ except ImportError:
 
 from scipy.io import wavfile
 
+from .cache_utils import (
+    DiskLRUCache, JsonRecordStore, make_cache_key, normalize_text, account_fingerprint, signed_url_expires_at
+)
+from .cc_utils import CCConfig
+
 
 class AudioProcessor:
     """音频处理工具类"""
@@ -133,9 +141,67 @@ class AudioProcessor:
         
         return duration
     
+    @staticmethod
+    def prepare_waveform(waveform, quantize=False):
+        """单次完成波形整理：支持[B, C, T]、[C, T]、[T]，混音为单声道并限幅到[-1, 1]
+        
+        torch张量和numpy数组均在原数据类型上直接计算，只分配输出数组，不打印调试信息。
+        quantize为True时返回int16数组，否则返回float32数组。
+        """
+        is_tensor = isinstance(waveform, torch.Tensor)
+        if not is_tensor and not isinstance(waveform, np.ndarray):
+            waveform = np.asarray(waveform)
+        
+        # [B, C, T] -> [C, T]，只使用第一个批次
+        if waveform.ndim == 3:
+            waveform = waveform[0]
+        if waveform.ndim == 1:
+            waveform = waveform[None, :]
+        elif waveform.ndim == 2:
+            # 可能是[T, C]格式（声道数不小于时间步数），转置为[C, T]视图，不复制数据
+            if not (waveform.shape[0] <= 2 and waveform.shape[0] < waveform.shape[1]):
+                waveform = waveform.T
+        else:
+            raise ValueError(f"Unsupported waveform dimensions: {waveform.ndim}")
+        
+        if is_tensor:
+            waveform = waveform.detach()
+            if waveform.is_floating_point():
+                # 在float32中完成混音，结果为新张量，可原地限幅
+                if waveform.shape[0] > 1:
+                    mono = waveform.mean(dim=0, dtype=torch.float32)
+                else:
+                    mono = waveform[0].to(torch.float32, copy=True)
+                mono = mono.clamp_(-1.0, 1.0).cpu().numpy()
+            else:
+                waveform = waveform.cpu().numpy()
+                is_tensor = False
+        
+        if not is_tensor:
+            if np.issubdtype(waveform.dtype, np.integer):
+                # 整数类型，先在float32中混音，再线性映射到[-1, 1]
+                info = np.iinfo(waveform.dtype)
+                mono = waveform.mean(axis=0, dtype=np.float32)
+                mono -= info.min
+                mono *= 2.0 / (float(info.max) - float(info.min))
+                mono -= 1.0
+            elif waveform.shape[0] > 1:
+                mono = waveform.mean(axis=0, dtype=np.float32)
+            else:
+                mono = waveform[0].astype(np.float32, copy=True)
+            np.clip(mono, -1.0, 1.0, out=mono)
+        
+        if quantize:
+            mono *= 32767
+            return mono.astype(np.int16)
+        return mono
+    
     @staticmethod
     def convert_to_int16(waveform):
         """将波形数据转换为16位整数"""
+        if waveform.dtype == np.int16:
+            # 已经是16位整数（如prepare_waveform量化后的结果）
+            return waveform
         # 确保在[-1, 1]范围内
         waveform = np.clip(waveform, -1.0, 1.0)
         # 转换为16位整数
@@ -167,23 +233,349 @@ class AudioProcessor:
         print(f"Audio file saved: {temp_filename}, size: {file_size} bytes")
         return file_size
 
+    # 上传格式对应的文件名和MIME类型
+    UPLOAD_FORMATS = {
+        "wav": ("audio.wav", "audio/wav"),
+        "flac": ("audio.flac", "audio/flac"),
+        "mp3": ("audio.mp3", "audio/mpeg"),
+    }
 
-def process_audio_for_minimax(audio_data):
-    """处理音频以供MiniMax API使用"""
+    @staticmethod
+    def encode_upload_bytes(waveform, sample_rate, format="wav"):
+        """将单声道波形编码到内存缓冲区，返回(bytes, 实际格式)"""
+        audio_int16 = AudioProcessor.convert_to_int16(waveform)
+        buffer = io.BytesIO()
+
+        if format == "mp3" and HAS_PYDUB:
+            try:
+                segment = AudioSegment(audio_int16.tobytes(), frame_rate=sample_rate, sample_width=2, channels=1)
+                segment.export(buffer, format="mp3", bitrate="320k")
+                return buffer.getvalue(), "mp3"
+            except Exception as e:
+                # 缺少ffmpeg等编码器时回退为WAV
+                print(f"MP3 encoding failed, falling back to WAV: {e}")
+                buffer = io.BytesIO()
+
+        if format == "flac" and HAS_SOUNDFILE:
+            sf.write(buffer, audio_int16, sample_rate, format="FLAC", subtype="PCM_16")
+            return buffer.getvalue(), "flac"
+
+        if HAS_SOUNDFILE:
+            sf.write(buffer, audio_int16, sample_rate,
+                     subtype='PCM_16', endian='LITTLE', format='WAV')
+        else:
+            wavfile.write(buffer, sample_rate, audio_int16)
+        return buffer.getvalue(), "wav"
+
+    @staticmethod
+    def hash_audio(audio_data):
+        """计算音频内容哈希（波形数据、形状和采样率），用于识别相同的音频"""
+        waveform, sample_rate = AudioProcessor.validate_audio_data(audio_data)
+        if isinstance(waveform, torch.Tensor):
+            waveform = waveform.detach().cpu().contiguous().numpy()
+        else:
+            waveform = np.ascontiguousarray(waveform)
+        hasher = hashlib.sha256()
+        hasher.update(f"{sample_rate}|{waveform.dtype}|{waveform.shape}|".encode("utf-8"))
+        hasher.update(waveform.tobytes())
+        return hasher.hexdigest()
+
+    @staticmethod
+    def encode_audio_bytes(audio_data, format="flac"):
+        """将ComfyUI音频编码为压缩字节，返回(bytes, 实际格式)"""
+        waveform, sample_rate = AudioProcessor.validate_audio_data(audio_data)
+        waveform = AudioProcessor.convert_to_numpy(waveform)
+
+        # [B, C, T] -> [C, T]，只保存第一个批次
+        if waveform.ndim == 3:
+            waveform = waveform[0]
+        elif waveform.ndim == 1:
+            waveform = waveform.reshape(1, -1)
+
+        # 量化为16位整数，[C, T] -> [T, C]
+        audio_int16 = AudioProcessor.convert_to_int16(waveform.astype(np.float32, copy=False)).T
+
+        buffer = io.BytesIO()
+        if format == "flac" and HAS_SOUNDFILE:
+            sf.write(buffer, audio_int16, sample_rate, format="FLAC", subtype="PCM_16")
+        else:
+            # soundfile不可用时使用numpy压缩格式
+            np.savez_compressed(buffer, waveform=audio_int16, sample_rate=np.int64(sample_rate))
+            format = "npz"
+        return buffer.getvalue(), format
+
+    @staticmethod
+    def decode_audio_bytes(data, format="flac"):
+        """将encode_audio_bytes生成的字节解码为ComfyUI音频"""
+        if format == "npz":
+            with np.load(io.BytesIO(data)) as archive:
+                audio_int16 = archive["waveform"]
+                sample_rate = int(archive["sample_rate"])
+            waveform = audio_int16.astype(np.float32) / 32767.0
+        else:
+            waveform, sample_rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+
+        # [T, C] -> [1, C, T]
+        waveform = np.ascontiguousarray(waveform.T)[np.newaxis, ...]
+        return {
+            "waveform": torch.from_numpy(waveform),
+            "sample_rate": sample_rate
+        }
+
+
+class TTSCache:
+    """TTS合成结果的持久化缓存，按总大小进行LRU淘汰"""
+
+    _store = None
+    _default_max_mb = 512
+
+    @classmethod
+    def _get_store(cls):
+        if cls._store is None:
+            try:
+                max_mb = float(CCConfig().get_setting("cache", "TTS_CACHE_MAX_MB", cls._default_max_mb))
+            except ValueError:
+                max_mb = cls._default_max_mb
+            cls._store = DiskLRUCache("tts", int(max_mb * 1024 * 1024))
+        return cls._store
+
+    @staticmethod
+    def make_key(provider, model, voice, text, **params):
+        """生成缓存键：服务商、模型、音色、音频参数和规范化文本"""
+        return make_cache_key(
+            provider=provider,
+            model=model,
+            voice=voice,
+            text=normalize_text(text),
+            params=params
+        )
+
+    @classmethod
+    def get(cls, key):
+        """获取缓存的音频，未命中返回None"""
+        try:
+            cached = cls._get_store().get(key)
+            if cached is None:
+                return None
+            data, meta = cached
+            return AudioProcessor.decode_audio_bytes(data, meta.get("format", "flac"))
+        except Exception as e:
+            print(f"Error reading TTS cache: {e}")
+            return None
+
+    @classmethod
+    def put(cls, key, audio_data):
+        """缓存合成的音频"""
+        try:
+            data, format = AudioProcessor.encode_audio_bytes(audio_data, "flac")
+            cls._get_store().put(key, data, meta={"format": format}, suffix=f".{format}")
+        except Exception as e:
+            print(f"Error writing TTS cache: {e}")
+
+    @classmethod
+    def clear(cls):
+        """清空TTS缓存"""
+        cls._get_store().clear()
+        print("TTS cache cleared")
+
+    @classmethod
+    def get_cache_info(cls):
+        """获取TTS缓存状态信息"""
+        return cls._get_store().get_cache_info()
+
+
+class UploadCache:
+    """已上传音频文件的缓存，记录服务端返回的file_id或文件URL及其过期时间"""
+
+    _store = None
+    # 各服务商上传文件的默认保留时间（秒），可通过config.ini的[cache] UPLOAD_TTL_HOURS覆盖
+    _default_ttl = {
+        "minimax": 24 * 3600,
+        "minimax_ppio": 24 * 3600,
+    }
+    # 在服务端过期前提前失效的安全余量（秒）
+    _expiry_margin = 300
+
+    @classmethod
+    def _get_store(cls):
+        if cls._store is None:
+            cls._store = JsonRecordStore("uploads")
+        return cls._store
+
+    @classmethod
+    def _get_ttl(cls, provider):
+        ttl = cls._default_ttl.get(provider, 3600)
+        try:
+            hours = CCConfig().get_setting("cache", "UPLOAD_TTL_HOURS", None)
+            if hours:
+                ttl = float(hours) * 3600
+        except ValueError:
+            pass
+        return ttl
+
+    @staticmethod
+    def _url_expires_at(file_url):
+        """解析签名URL中的过期时间，无法解析返回None"""
+        return signed_url_expires_at(file_url)
+
+    @staticmethod
+    def make_key(provider, api_key, audio_data, purpose, encoding="wav"):
+        """生成缓存键：服务商、账号、音频内容哈希、用途和上传编码格式"""
+        return make_cache_key(
+            provider=provider,
+            account=account_fingerprint(api_key),
+            audio=AudioProcessor.hash_audio(audio_data),
+            purpose=purpose,
+            encoding=encoding
+        )
+
+    @classmethod
+    def get(cls, key):
+        """获取未过期的file_id或文件URL，未命中返回None"""
+        try:
+            return cls._get_store().get(key)
+        except Exception as e:
+            print(f"Error reading upload cache: {e}")
+            return None
+
+    @classmethod
+    def put(cls, key, provider, file_ref):
+        """记录上传结果，过期时间取服务商保留时间与签名URL过期时间中较早者"""
+        try:
+            expires_at = time.time() + cls._get_ttl(provider)
+            url_expires_at = cls._url_expires_at(file_ref) if str(file_ref).startswith("http") else None
+            if url_expires_at is not None:
+                expires_at = min(expires_at, url_expires_at)
+            cls._get_store().put(key, file_ref, expires_at=expires_at - cls._expiry_margin)
+        except Exception as e:
+            print(f"Error writing upload cache: {e}")
+
+    @classmethod
+    def invalidate(cls, key):
+        """删除上传记录（如服务端文件已失效）"""
+        try:
+            cls._get_store().delete(key)
+        except Exception as e:
+            print(f"Error invalidating upload cache: {e}")
+
+    @classmethod
+    def clear(cls):
+        """清空上传缓存"""
+        cls._get_store().clear()
+        print("Upload cache cleared")
+
+    @classmethod
+    def get_cache_info(cls):
+        """获取上传缓存状态信息"""
+        return cls._get_store().get_cache_info()
+
+
+class VoiceCloneRegistry:
+    """已克隆音色的持久化登记表，相同样本和参数不再重复提交克隆任务"""
+
+    _store = None
+    _demo_store = None
+    # MiniMax复刻音色若7天内未被正式调用会被删除，登记记录按此期限过期
+    _voice_ttl = 7 * 24 * 3600
+    _demo_max_bytes = 64 * 1024 * 1024
+
+    @classmethod
+    def _get_stores(cls):
+        if cls._store is None:
+            cls._store = JsonRecordStore("voice_clones")
+            cls._demo_store = DiskLRUCache("voice_clone_demo", cls._demo_max_bytes)
+        return cls._store, cls._demo_store
+
+    @staticmethod
+    def make_key(provider, api_key, clone_audio, prompt_audio=None, **options):
+        """生成登记键：服务商、账号、样本音频哈希、示例音频哈希和克隆参数"""
+        for name in ("prompt_text", "test_text"):
+            if name in options:
+                options[name] = normalize_text(options[name])
+        return make_cache_key(
+            provider=provider,
+            account=account_fingerprint(api_key),
+            clone_audio=AudioProcessor.hash_audio(clone_audio),
+            prompt_audio=AudioProcessor.hash_audio(prompt_audio) if prompt_audio is not None else "",
+            options=options
+        )
+
+    @classmethod
+    def get(cls, key):
+        """获取已登记的克隆结果，返回(voice_id, 试听音频或None)；未命中返回None"""
+        try:
+            store, demo_store = cls._get_stores()
+            voice_id = store.get(key)
+            if not voice_id:
+                return None
+            demo_audio = None
+            cached = demo_store.get(key)
+            if cached is not None:
+                data, meta = cached
+                demo_audio = AudioProcessor.decode_audio_bytes(data, meta.get("format", "flac"))
+            return voice_id, demo_audio
+        except Exception as e:
+            print(f"Error reading voice clone registry: {e}")
+            return None
+
+    @classmethod
+    def put(cls, key, voice_id, demo_audio=None):
+        """登记克隆结果及试听音频"""
+        try:
+            store, demo_store = cls._get_stores()
+            store.put(key, voice_id, ttl=cls._voice_ttl)
+            if demo_audio is not None:
+                data, format = AudioProcessor.encode_audio_bytes(demo_audio, "flac")
+                demo_store.put(key, data, meta={"format": format}, suffix=f".{format}")
+            else:
+                demo_store.delete(key)
+        except Exception as e:
+            print(f"Error writing voice clone registry: {e}")
+
+    @classmethod
+    def invalidate(cls, key):
+        """删除登记记录"""
+        try:
+            store, demo_store = cls._get_stores()
+            store.delete(key)
+            demo_store.delete(key)
+        except Exception as e:
+            print(f"Error invalidating voice clone registry: {e}")
+
+    @classmethod
+    def clear(cls):
+        """清空登记表"""
+        store, demo_store = cls._get_stores()
+        store.clear()
+        demo_store.clear()
+        print("Voice clone registry cleared")
+
+    @classmethod
+    def get_cache_info(cls):
+        """获取登记表状态信息"""
+        store, demo_store = cls._get_stores()
+        info = store.get_cache_info()
+        info["demo_audio"] = demo_store.get_cache_info()
+        return info
+
+
+def _prepare_audio_for_minimax(audio_data):
+    """验证并整理音频为单声道16位整数波形，检查时长是否符合MiniMax要求"""
     # 1. 验证音频数据
     waveform, sample_rate = AudioProcessor.validate_audio_data(audio_data)
     
-    # 2. 转换为numpy数组
-    waveform = AudioProcessor.convert_to_numpy(waveform)
-    
-    # 3. 标准化波形数据
-    waveform = AudioProcessor.normalize_waveform(waveform)
+    # 2. 单次完成混音、限幅和量化
+    waveform = AudioProcessor.prepare_waveform(waveform, quantize=True)
     
-    # 4. 重新整形波形数据
-    waveform = AudioProcessor.reshape_waveform(waveform)
+    # 3. 检查时长
+    AudioProcessor.check_duration(waveform, sample_rate)
     
-    # 5. 检查时长
-    duration = AudioProcessor.check_duration(waveform, sample_rate)
+    return waveform, sample_rate
+
+
+def process_audio_for_minimax(audio_data):
+    """处理音频以供MiniMax API使用"""
+    waveform, sample_rate = _prepare_audio_for_minimax(audio_data)
     
     # 6. 创建临时文件
     with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
@@ -197,4 +589,16 @@ def process_audio_for_minimax(audio_data):
         # 确保即使出错也删除临时文件
         if os.path.exists(temp_filename):
             os.unlink(temp_filename)
-        raise e
\ No newline at end of file
+        raise e
+
+
+def encode_audio_for_minimax(audio_data, format="wav"):
+    """处理音频并在内存中编码以供MiniMax API上传，返回(bytes, 文件名, MIME类型, 实际编码格式)
+
+    请求的格式无法编码时（如缺少MP3编码器）会回退为WAV，调用方应以返回的实际格式为准
+    """
+    waveform, sample_rate = _prepare_audio_for_minimax(audio_data)
+    data, format = AudioProcessor.encode_upload_bytes(waveform, sample_rate, format)
+    filename, mime_type = AudioProcessor.UPLOAD_FORMATS[format]
+    print(f"Audio encoded for upload: {format}, size: {len(data)} bytes")
+    return data, filename, mime_type, format
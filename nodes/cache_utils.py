@@ -0,0 +1,411 @@
+import atexit
+import calendar
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+from urllib.parse import parse_qs, urlparse
+
+from .metrics import register_cache
+
+# 缓存根目录，位于插件目录下，与config.ini同级
+CACHE_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache")
+
+
+def make_cache_key(**fields):
+    """根据参数生成规范化的缓存键（SHA-256）"""
+    canonical = json.dumps(fields, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def account_fingerprint(api_key):
+    """生成API密钥的短指纹，用于区分账号级资源，避免在缓存中保存明文密钥"""
+    if not api_key:
+        return ""
+    return hashlib.sha256(str(api_key).encode("utf-8")).hexdigest()[:16]
+
+
+def normalize_text(text):
+    """规范化文本，避免因换行符或首尾空白不同导致缓存失效"""
+    if text is None:
+        return ""
+    text = unicodedata.normalize("NFC", str(text))
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text.strip()
+
+
+def signed_url_expires_at(url):
+    """解析签名URL中的过期时间戳，无法解析返回None"""
+    try:
+        query = parse_qs(urlparse(url).query)
+        if "Expires" in query:
+            return float(query["Expires"][0])
+        if "X-Amz-Date" in query and "X-Amz-Expires" in query:
+            signed_at = calendar.timegm(time.strptime(query["X-Amz-Date"][0], "%Y%m%dT%H%M%SZ"))
+            return signed_at + float(query["X-Amz-Expires"][0])
+    except Exception:
+        pass
+    return None
+
+
+def atomic_write_bytes(path, data):
+    """原子写入文件，避免进程中断时留下不完整的文件"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def atomic_write_json(path, data):
+    """原子写入JSON文件"""
+    atomic_write_bytes(path, json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+class DiskLRUCache:
+    """基于磁盘的LRU缓存，按总字节数限制大小"""
+
+    # 命中时只在内存中更新访问时间，索引文件最多每隔该秒数写入一次
+    INDEX_FLUSH_INTERVAL = 5.0
+
+    def __init__(self, name, max_bytes):
+        self.directory = os.path.join(CACHE_ROOT, name)
+        self.index_path = os.path.join(self.directory, "index.json")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_dirty = False
+        self._last_flush = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        register_cache(name, self.get_cache_info)
+        # 进程退出时写入尚未保存的访问时间，重启后的淘汰顺序仍然正确
+        atexit.register(self.flush)
+
+    def _load_index(self):
+        """加载索引文件（仅首次访问时读取磁盘）"""
+        if self._index is not None:
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self._index = json.load(f)
+        except FileNotFoundError:
+            self._index = {}
+        except Exception as e:
+            print(f"Error loading cache index {self.index_path}: {e}")
+            self._index = {}
+
+    def _save_index(self):
+        """保存索引文件"""
+        self._index_dirty = False
+        self._last_flush = time.monotonic()
+        try:
+            atomic_write_json(self.index_path, self._index)
+        except Exception as e:
+            print(f"Error saving cache index {self.index_path}: {e}")
+
+    def flush(self):
+        """立即保存命中时在内存中更新、尚未写入的索引"""
+        with self._lock:
+            if self._index is not None and self._index_dirty:
+                self._save_index()
+
+    def _entry_path(self, entry):
+        return os.path.join(self.directory, entry["file"])
+
+    def _remove_entry(self, key):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            try:
+                os.unlink(self._entry_path(entry))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """按最近访问时间淘汰条目，直到总大小不超过上限"""
+        total = sum(entry["size"] for entry in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            total -= entry["size"]
+            self._remove_entry(key)
+            self.evictions += 1
+
+    def get(self, key):
+        """获取缓存数据，返回(bytes, meta)；未命中返回None"""
+        with self._lock:
+            self._load_index()
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            try:
+                with open(self._entry_path(entry), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                # 数据文件已被外部删除，清理索引
+                self._index.pop(key, None)
+                self._save_index()
+                self.misses += 1
+                return None
+            entry["last_access"] = time.time()
+            # 访问时间仅用于淘汰排序，丢失少量更新无妨，不必每次命中都重写索引
+            self._index_dirty = True
+            if time.monotonic() - self._last_flush >= self.INDEX_FLUSH_INTERVAL:
+                self._save_index()
+            self.hits += 1
+            return data, entry.get("meta", {})
+
+    def put(self, key, data, meta=None, suffix=".bin"):
+        """写入缓存数据"""
+        if len(data) > self.max_bytes:
+            # 单个条目超过缓存上限，不缓存
+            return
+        with self._lock:
+            self._load_index()
+            self._remove_entry(key)
+            entry = {
+                "file": f"{key}{suffix}",
+                "size": len(data),
+                "last_access": time.time(),
+                "meta": meta or {},
+            }
+            try:
+                atomic_write_bytes(self._entry_path(entry), data)
+            except Exception as e:
+                print(f"Error writing cache entry: {e}")
+                return
+            self._index[key] = entry
+            self._evict()
+            self._save_index()
+
+    def delete(self, key):
+        """删除指定缓存条目"""
+        with self._lock:
+            self._load_index()
+            if key in self._index:
+                self._remove_entry(key)
+                self._save_index()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._load_index()
+            for key in list(self._index.keys()):
+                self._remove_entry(key)
+            self._save_index()
+
+    def get_cache_info(self):
+        """获取缓存状态信息"""
+        with self._lock:
+            self._load_index()
+            return {
+                "total_entries": len(self._index),
+                "total_bytes": sum(entry["size"] for entry in self._index.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class JsonRecordStore:
+    """基于JSON文件的持久化记录存储，支持按条目设置过期时间"""
+
+    def __init__(self, name, max_entries=1000):
+        self.path = os.path.join(CACHE_ROOT, f"{name}.json")
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._records = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        register_cache(name, self.get_cache_info)
+
+    def _load(self):
+        """加载记录文件（仅首次访问时读取磁盘）"""
+        if self._records is not None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._records = json.load(f)
+        except FileNotFoundError:
+            self._records = {}
+        except Exception as e:
+            print(f"Error loading record store {self.path}: {e}")
+            self._records = {}
+
+    def _save(self):
+        """保存记录文件"""
+        try:
+            atomic_write_json(self.path, self._records)
+        except Exception as e:
+            print(f"Error saving record store {self.path}: {e}")
+
+    def _prune(self):
+        """清理过期记录，超过条目上限时删除最早写入的记录"""
+        now = time.time()
+        expired = [
+            key for key, record in self._records.items()
+            if record.get("expires_at") is not None and record["expires_at"] <= now
+        ]
+        for key in expired:
+            del self._records[key]
+        if len(self._records) > self.max_entries:
+            sorted_items = sorted(self._records.items(), key=lambda item: item[1]["updated_at"])
+            for key, _ in sorted_items[:len(self._records) - self.max_entries]:
+                del self._records[key]
+                self.evictions += 1
+
+    def get(self, key):
+        """获取未过期的记录值，不存在或已过期返回None"""
+        with self._lock:
+            self._load()
+            record = self._records.get(key)
+            if record is None:
+                self.misses += 1
+                return None
+            expires_at = record.get("expires_at")
+            if expires_at is not None and expires_at <= time.time():
+                del self._records[key]
+                self._save()
+                self.misses += 1
+                return None
+            self.hits += 1
+            return record["value"]
+
+    def put(self, key, value, ttl=None, expires_at=None):
+        """写入记录，ttl为有效秒数，expires_at为绝对过期时间戳"""
+        now = time.time()
+        if expires_at is None and ttl is not None:
+            expires_at = now + ttl
+        with self._lock:
+            self._load()
+            self._records[key] = {
+                "value": value,
+                "updated_at": now,
+                "expires_at": expires_at,
+            }
+            self._prune()
+            self._save()
+
+    def items(self):
+        """返回所有未过期记录的(键, 值)列表"""
+        with self._lock:
+            self._load()
+            now = time.time()
+            return [
+                (key, record["value"]) for key, record in self._records.items()
+                if record.get("expires_at") is None or record["expires_at"] > now
+            ]
+
+    def delete(self, key):
+        """删除指定记录"""
+        with self._lock:
+            self._load()
+            if self._records.pop(key, None) is not None:
+                self._save()
+
+    def clear(self):
+        """清空所有记录"""
+        with self._lock:
+            self._records = {}
+            self._save()
+
+    def get_cache_info(self):
+        """获取记录存储状态信息"""
+        with self._lock:
+            self._load()
+            return {
+                "total_entries": len(self._records),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class RequestCache(dict):
+    """节点内存中的请求结果缓存（相同参数的请求直接返回上次结果），记录命中次数"""
+
+    def __init__(self, node):
+        super().__init__()
+        self.hits = 0
+        self.misses = 0
+        register_cache("request", self.get_cache_info, node=node)
+
+    def lookup(self, key):
+        """获取缓存的结果，未命中返回None"""
+        result = self.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def get_cache_info(self):
+        """获取缓存状态信息"""
+        return {
+            "total_entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": 0,
+        }
+
+
+class SingleFlight:
+    """合并相同请求的并发执行：同一键的调用正在进行时，其他线程等待并共享其结果或异常
+
+    用于避免重复排队的相同提示词各自提交一次付费任务。hits为共享结果的次数，misses为实际执行的次数。
+    """
+
+    def __init__(self, node):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        register_cache("single_flight", self.get_cache_info, node=node)
+
+    def run(self, key, func, *args, **kwargs):
+        """执行func并返回结果；相同key的调用正在进行时等待其结果"""
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = {"event": threading.Event(), "result": None, "error": None}
+                self._inflight[key] = call
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not leader:
+            print("Identical request already in flight, waiting for its result")
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = func(*args, **kwargs)
+            return call["result"]
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call["event"].set()
+
+    def get_cache_info(self):
+        """获取状态信息，total_entries为正在进行的请求数"""
+        with self._lock:
+            return {
+                "total_entries": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": 0,
+            }
@@ -1,6 +1,4 @@
-import configparser
 import io
-import os
 import tempfile
 import hashlib
 import time
@@ -12,137 +10,10 @@ import requests
 import torch
 from PIL import Image
 
-
-class CCConfig:
-    """Singleton class to handle CC API configuration and client setup."""
-
-    _instance = None
-    _key = None
-    _minimax_key = None
-    _doubao_app_id = None
-    _doubao_access_key = None
-    _ppio_key = None  # 派欧云API密钥
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(CCConfig, cls).__new__(cls)
-            cls._instance._initialize()
-        return cls._instance
-
-    def _initialize(self):
-        """Initialize configuration and API key."""
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-
-        config = configparser.ConfigParser()
-        config.read(config_path)
-
-        try:
-            if os.environ.get("VOLCENGINE_API_KEY") is not None:
-                print("VOLCENGINE_API_KEY found in environment variables")
-                self._key = os.environ["VOLCENGINE_API_KEY"]
-            else:
-                print("VOLCENGINE_API_KEY not found in environment variables")
-                self._key = config["volcengine"]["API_KEY"]
-                print("VOLCENGINE_API_KEY found in config.ini")
-                os.environ["VOLCENGINE_API_KEY"] = self._key
-                print("VOLCENGINE_API_KEY set in environment variables")
-
-            # Check if API key is the default placeholder
-            if self._key == "<your_volcengine_api_key_here>":
-                print("WARNING: You are using the default API key placeholder!")
-                print("Please set your actual API key in either:")
-                print("1. The config.ini file under [volcengine] section")
-                print("2. Or as an environment variable named VOLCENGINE_API_KEY")
-        except KeyError:
-            print("Error: API_KEY not found in config.ini or environment variables")
-            
-        try:
-            if os.environ.get("MINIMAX_API_KEY") is not None:
-                self._minimax_key = os.environ["MINIMAX_API_KEY"]
-            else:
-                self._minimax_key = config["minimax"]["API_KEY"]
-                if self._minimax_key != "<your_minimax_api_key_here>":
-                    os.environ["MINIMAX_API_KEY"] = self._minimax_key
-        except KeyError:
-            # MiniMax key is optional, so we don't print an error
-            self._minimax_key = None
-            
-        # Initialize Doubao API credentials
-        try:
-            if os.environ.get("DOUBAO_APP_ID") is not None:
-                self._doubao_app_id = os.environ["DOUBAO_APP_ID"]
-            else:
-                self._doubao_app_id = config["doubao"]["APP_ID"]
-                if self._doubao_app_id != "<your_doubao_app_id_here>":
-                    os.environ["DOUBAO_APP_ID"] = self._doubao_app_id
-        except KeyError:
-            # Doubao credentials are optional
-            self._doubao_app_id = None
-            
-        try:
-            if os.environ.get("DOUBAO_ACCESS_KEY") is not None:
-                self._doubao_access_key = os.environ["DOUBAO_ACCESS_KEY"]
-            else:
-                self._doubao_access_key = config["doubao"]["ACCESS_KEY"]
-                if self._doubao_access_key != "<your_doubao_access_key_here>":
-                    os.environ["DOUBAO_ACCESS_KEY"] = self._doubao_access_key
-        except KeyError:
-            # Doubao credentials are optional
-            self._doubao_access_key = None
-
-        # Initialize PPIO API credentials
-        try:
-            if os.environ.get("PPIO_API_KEY") is not None:
-                self._ppio_key = os.environ["PPIO_API_KEY"]
-            else:
-                self._ppio_key = config["ppio"]["API_KEY"]
-                if self._ppio_key != "<your_ppio_api_key_here>":
-                    os.environ["PPIO_API_KEY"] = self._ppio_key
-        except KeyError:
-            # PPIO credentials are optional
-            self._ppio_key = None
-
-    def get_key(self):
-        """Get the API key for volcengine."""
-        return self._key
-
-    def get_minimax_key(self):
-        """Get the API key for MiniMax."""
-        # First check if MiniMax API key is provided as environment variable
-        if os.environ.get("MINIMAX_API_KEY") is not None:
-            return os.environ["MINIMAX_API_KEY"]
-        
-        # Return the stored key
-        return self._minimax_key
-
-    def get_doubao_app_id(self):
-        """Get the App ID for Doubao."""
-        # First check if Doubao App ID is provided as environment variable
-        if os.environ.get("DOUBAO_APP_ID") is not None:
-            return os.environ["DOUBAO_APP_ID"]
-        
-        # Return the stored App ID
-        return self._doubao_app_id
-
-    def get_doubao_access_key(self):
-        """Get the Access Key for Doubao."""
-        # First check if Doubao Access Key is provided as environment variable
-        if os.environ.get("DOUBAO_ACCESS_KEY") is not None:
-            return os.environ["DOUBAO_ACCESS_KEY"]
-        
-        # Return the stored Access Key
-        return self._doubao_access_key
-
-    def get_ppio_key(self):
-        """Get the API key for PPIO."""
-        # First check if PPIO API key is provided as environment variable
-        if os.environ.get("PPIO_API_KEY") is not None:
-            return os.environ["PPIO_API_KEY"]
-        
-        # Return the stored key
-        return self._ppio_key
+from .latency_tracker import LatencyTracker
+from .metrics import count_bytes, phase, register_cache, timed_phase
+# CCConfig不依赖torch，单独放在config模块中，这里保留导入以兼容原有的from .cc_utils import CCConfig
+from .config import CCConfig
 
 
 class ImageUtils:
@@ -152,6 +23,9 @@ class ImageUtils:
     _image_cache = {}
     _cache_max_size = 50  # Maximum number of cached images
     _cache_max_age = 3600  # Maximum cache age in seconds (1 hour)
+    _cache_hits = 0
+    _cache_misses = 0
+    _cache_evictions = 0
     
     @staticmethod
     def _get_image_hash(image_tensor):
@@ -177,12 +51,14 @@ class ImageUtils:
         ]
         for key in expired_keys:
             del ImageUtils._image_cache[key]
+            ImageUtils._cache_evictions += 1
         
         # If still too large, remove oldest entries
         if len(ImageUtils._image_cache) > ImageUtils._cache_max_size:
             sorted_items = sorted(ImageUtils._image_cache.items(), key=lambda x: x[1][0])
             for key, _ in sorted_items[:len(ImageUtils._image_cache) - ImageUtils._cache_max_size]:
                 del ImageUtils._image_cache[key]
+                ImageUtils._cache_evictions += 1
     
     @staticmethod
     def _get_cached_image(image_hash):
@@ -190,10 +66,13 @@ class ImageUtils:
         if image_hash in ImageUtils._image_cache:
             timestamp, pil_image = ImageUtils._image_cache[image_hash]
             if time.time() - timestamp < ImageUtils._cache_max_age:
+                ImageUtils._cache_hits += 1
                 return pil_image
             else:
                 # Remove expired entry
                 del ImageUtils._image_cache[image_hash]
+                ImageUtils._cache_evictions += 1
+        ImageUtils._cache_misses += 1
         return None
     
     @staticmethod
@@ -229,10 +108,14 @@ class ImageUtils:
             "valid_entries": valid_entries,
             "expired_entries": expired_entries,
             "max_size": ImageUtils._cache_max_size,
-            "max_age_seconds": ImageUtils._cache_max_age
+            "max_age_seconds": ImageUtils._cache_max_age,
+            "hits": ImageUtils._cache_hits,
+            "misses": ImageUtils._cache_misses,
+            "evictions": ImageUtils._cache_evictions
         }
 
     @staticmethod
+    @timed_phase("encode")
     def tensor_to_pil(image):
         """Convert image tensor to PIL Image."""
         try:
@@ -263,6 +146,7 @@ class ImageUtils:
             return None
 
     @staticmethod
+    @timed_phase("encode")
     def pil_to_base64(pil_image, format="JPEG"):
         """Convert PIL Image to base64 string."""
         try:
@@ -275,6 +159,7 @@ class ImageUtils:
             return None
 
     @staticmethod
+    @timed_phase("decode")
     def base64_to_tensor(base64_str):
         """Convert base64 string to image tensor."""
         try:
@@ -322,9 +207,11 @@ class ResultProcessor:
                     if img_tensor is not None:
                         images.append(img_tensor)
                 elif "url" in img_info:
-                    img_response = requests.get(img_info["url"])
-                    img = Image.open(io.BytesIO(img_response.content))
-                    img_array = np.array(img).astype(np.float32) / 255.0
+                    with phase("download"):
+                        img_response = count_bytes("download", requests.get(img_info["url"]))
+                    with phase("decode"):
+                        img = Image.open(io.BytesIO(img_response.content))
+                        img_array = np.array(img).astype(np.float32) / 255.0
                     images.append(img_array)
 
             if not images:
@@ -359,6 +246,7 @@ class ApiHandler:
     def call_seedream_api(api_key, prompt, images=None, size="2048x2048", 
                          sequential_image_generation="disabled", max_images=15):
         """Call Seedream 4.0 API and return result."""
+        start_time = time.time()
         try:
             # Prepare the request payload
             payload = {
@@ -390,18 +278,25 @@ class ApiHandler:
                 "Authorization": f"Bearer {api_key}"
             }
             
-            response = requests.post(
-                "https://ark.cn-beijing.volces.com/api/v3/images/generations",
-                headers=headers,
-                json=payload
-            )
+            # scheduler依赖CCConfig，在函数内导入以避免循环导入
+            from .scheduler import JobScheduler
+            with JobScheduler().slot("ark", "seedream-4.0", api_key) as slot:
+                response = slot.request(
+                    requests.post,
+                    "https://ark.cn-beijing.volces.com/api/v3/images/generations",
+                    headers=headers,
+                    json=payload
+                )
             
             if response.status_code == 200:
+                LatencyTracker().record("seedream/ark", time.time() - start_time)
                 return response.json()
             else:
+                LatencyTracker().record("seedream/ark", time.time() - start_time, ok=False)
                 print(f"API request failed with status {response.status_code}: {response.text}")
                 return None
         except Exception as e:
+            LatencyTracker().record("seedream/ark", time.time() - start_time, ok=False)
             print(f"Error calling Seedream API: {str(e)}")
             return None
 
@@ -409,4 +304,8 @@ class ApiHandler:
     def handle_image_generation_error(model_name, error):
         """Handle image generation errors consistently."""
         print(f"Error generating image with {model_name}: {str(error)}")
-        return ResultProcessor.create_blank_image()
\ No newline at end of file
+        return ResultProcessor.create_blank_image()
+
+
+# 导出图像缓存的命中统计（/cc_api/metrics/prometheus）
+register_cache("image", ImageUtils.get_cache_info)
@@ -0,0 +1,286 @@
+import configparser
+import os
+import threading
+import time
+
+
+class CCConfig:
+    """Singleton class to handle CC API configuration and client setup.
+
+    config.ini is parsed once and re-read only when its modification time changes,
+    so edits take effect without restarting ComfyUI.
+    """
+
+    _instance = None
+    _key = None
+    _minimax_key = None
+    _doubao_app_id = None
+    _doubao_access_key = None
+    _ppio_key = None  # 派欧云API密钥
+    _config = None
+    _config_path = None
+    _config_mtime = None
+    _last_check = 0.0
+    _check_interval = 1.0  # 检查文件修改时间的最小间隔（秒）
+
+    # 服务商：config.ini中的节名与环境变量前缀
+    _providers = {
+        "volcengine": "VOLCENGINE",
+        "minimax": "MINIMAX",
+        "ppio": "PPIO",
+        "dashscope": "DASHSCOPE",
+        "fal": "FAL",
+    }
+
+    # 启动时从配置文件导出到环境变量的设置
+    _env_settings = {
+        "VOLCENGINE_API_KEY": ("volcengine", "API_KEY"),
+        "MINIMAX_API_KEY": ("minimax", "API_KEY"),
+        "DOUBAO_APP_ID": ("doubao", "APP_ID"),
+        "DOUBAO_ACCESS_KEY": ("doubao", "ACCESS_KEY"),
+        "PPIO_API_KEY": ("ppio", "API_KEY"),
+    }
+
+    # 传输层默认设置，可在config.ini的[transport]中覆盖
+    _transport_defaults = {
+        "connect_timeout": 10.0,
+        "read_timeout": 120.0,
+        "pool_connections": 10,
+        "pool_maxsize": 20,
+    }
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(CCConfig, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _read_config(self):
+        """Parse config.ini, preferring UTF-8."""
+        config = configparser.ConfigParser()
+        try:
+            with open(self._config_path, "r", encoding="utf-8") as f:
+                config.read_file(f)
+        except FileNotFoundError:
+            pass
+        except UnicodeDecodeError:
+            # 如果UTF-8失败，尝试使用系统默认编码
+            config.read(self._config_path)
+        return config
+
+    def _get_mtime(self):
+        try:
+            return os.path.getmtime(self._config_path)
+        except OSError:
+            return None
+
+    def _initialize(self):
+        """Initialize configuration and API key."""
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        parent_dir = os.path.dirname(current_dir)
+        self._config_path = os.path.join(parent_dir, "config.ini")
+        self._lock = threading.Lock()
+        self._reload_listeners = []
+        self._exported_env = {}
+
+        self._config_mtime = self._get_mtime()
+        self._last_check = time.time()
+        config = self._read_config()
+        self._config = config
+
+        try:
+            if os.environ.get("VOLCENGINE_API_KEY") is not None:
+                print("VOLCENGINE_API_KEY found in environment variables")
+                self._key = os.environ["VOLCENGINE_API_KEY"]
+            else:
+                print("VOLCENGINE_API_KEY not found in environment variables")
+                self._key = config["volcengine"]["API_KEY"]
+                print("VOLCENGINE_API_KEY found in config.ini")
+                self._export_env("VOLCENGINE_API_KEY", self._key)
+                print("VOLCENGINE_API_KEY set in environment variables")
+
+            # Check if API key is the default placeholder
+            if self._key == "<your_volcengine_api_key_here>":
+                print("WARNING: You are using the default API key placeholder!")
+                print("Please set your actual API key in either:")
+                print("1. The config.ini file under [volcengine] section")
+                print("2. Or as an environment variable named VOLCENGINE_API_KEY")
+        except KeyError:
+            print("Error: API_KEY not found in config.ini or environment variables")
+
+        # MiniMax、豆包和派欧云的密钥是可选的，未配置时不打印错误
+        self._minimax_key = self._load_optional_env("MINIMAX_API_KEY", "<your_minimax_api_key_here>")
+        self._doubao_app_id = self._load_optional_env("DOUBAO_APP_ID", "<your_doubao_app_id_here>")
+        self._doubao_access_key = self._load_optional_env("DOUBAO_ACCESS_KEY", "<your_doubao_access_key_here>")
+        self._ppio_key = self._load_optional_env("PPIO_API_KEY", "<your_ppio_api_key_here>")
+
+    def _load_optional_env(self, env_var, placeholder):
+        """Read an optional credential from the environment or config.ini and export it."""
+        if os.environ.get(env_var) is not None:
+            return os.environ[env_var]
+        section, option = self._env_settings[env_var]
+        value = self._config.get(section, option, fallback=None)
+        if value is not None and value != placeholder:
+            self._export_env(env_var, value)
+        return value
+
+    def _export_env(self, env_var, value):
+        """Export a config value to the environment, remembering it so reloads can update it."""
+        os.environ[env_var] = value
+        self._exported_env[env_var] = value
+
+    def reload_if_changed(self):
+        """Re-read config.ini if its modification time changed; returns True when reloaded."""
+        now = time.time()
+        if now - self._last_check < self._check_interval:
+            return False
+        self._last_check = now
+        mtime = self._get_mtime()
+        if mtime == self._config_mtime:
+            return False
+
+        with self._lock:
+            if mtime == self._config_mtime:
+                return False
+            self._config = self._read_config()
+            self._config_mtime = mtime
+            # 只更新由配置文件导出的环境变量，用户自行设置的环境变量保持优先
+            for env_var, exported in list(self._exported_env.items()):
+                if os.environ.get(env_var) != exported:
+                    continue
+                section, option = self._env_settings[env_var]
+                value = self._config.get(section, option, fallback=None)
+                if value and not value.startswith("<"):
+                    self._export_env(env_var, value)
+                else:
+                    del os.environ[env_var]
+                    del self._exported_env[env_var]
+            listeners = list(self._reload_listeners)
+        print("config.ini changed, configuration reloaded")
+
+        for listener in listeners:
+            try:
+                listener()
+            except Exception as e:
+                print(f"Error applying reloaded configuration: {e}")
+        return True
+
+    def add_reload_listener(self, listener):
+        """Register a callback invoked after config.ini is reloaded."""
+        with self._lock:
+            self._reload_listeners.append(listener)
+
+    def get_api_key(self, provider, provided_key="", pooled=True):
+        """Resolve a provider API key: parameter > key pool > environment variable > config.ini."""
+        # 首先检查传入的参数
+        if provided_key:
+            return provided_key
+
+        # 配置了多个密钥时从密钥池中选择
+        if pooled:
+            pooled_key = self._get_pooled_key(provider)
+            if pooled_key:
+                return pooled_key
+
+        # 然后检查环境变量
+        prefix = self._providers.get(provider, provider.upper())
+        env_var = f"{prefix}_API_KEY"
+        if os.environ.get(env_var) is not None:
+            return os.environ[env_var]
+
+        # 最后检查配置文件
+        api_key = self.get_setting(provider, "API_KEY")
+        if api_key and api_key.startswith("<"):
+            print(f"WARNING: You are using the default {prefix} API key placeholder!")
+            print("Please set your actual API key in either:")
+            print(f"1. The config.ini file under [{provider}] section")
+            print(f"2. Or as an environment variable named {env_var}")
+            return None
+        return api_key or None
+
+    def get_key(self):
+        """Get the API key for volcengine."""
+        return self.get_api_key("volcengine")
+
+    def get_minimax_key(self):
+        """Get the API key for MiniMax."""
+        # 克隆音色归属于单个账号，MiniMax不使用密钥池
+        return self.get_api_key("minimax", pooled=False)
+
+    def get_doubao_app_id(self):
+        """Get the App ID for Doubao."""
+        # First check if Doubao App ID is provided as environment variable
+        if os.environ.get("DOUBAO_APP_ID") is not None:
+            return os.environ["DOUBAO_APP_ID"]
+        
+        # Return the configured App ID
+        return self.get_setting("doubao", "APP_ID")
+
+    def get_doubao_access_key(self):
+        """Get the Access Key for Doubao."""
+        # First check if Doubao Access Key is provided as environment variable
+        if os.environ.get("DOUBAO_ACCESS_KEY") is not None:
+            return os.environ["DOUBAO_ACCESS_KEY"]
+        
+        # Return the configured Access Key
+        return self.get_setting("doubao", "ACCESS_KEY")
+
+    def get_ppio_key(self):
+        """Get the API key for PPIO."""
+        return self.get_api_key("ppio")
+
+    def get_setting(self, section, option, fallback=None):
+        """Get an optional setting from config.ini."""
+        self.reload_if_changed()
+        try:
+            return self._config.get(section, option, fallback=fallback)
+        except Exception:
+            return fallback
+
+    def get_api_keys(self, provider):
+        """Get the key pool of a provider as (keys, weights).
+
+        Keys come from the <PREFIX>_API_KEYS environment variable or API_KEYS
+        in config.ini (comma separated); weights from API_KEY_WEIGHTS.
+        """
+        prefix = self._providers.get(provider, provider.upper())
+        raw_keys = os.environ.get(f"{prefix}_API_KEYS") or self.get_setting(provider, "API_KEYS", "")
+        keys = [key.strip() for key in (raw_keys or "").split(",") if key.strip() and not key.strip().startswith("<")]
+        weights = []
+        raw_weights = self.get_setting(provider, "API_KEY_WEIGHTS", "") or ""
+        for weight in [w.strip() for w in raw_weights.split(",")] if raw_weights.strip() else []:
+            try:
+                weights.append(int(weight))
+            except ValueError:
+                print(f"Invalid {provider} API_KEY_WEIGHTS value: {weight}")
+                weights.append(1)
+        return keys, weights
+
+    def _get_pooled_key(self, provider):
+        """Select a key from the provider's key pool, or None if no pool is configured."""
+        # key_pool依赖CCConfig，在函数内导入以避免循环导入
+        from .key_pool import KeyPool
+        return KeyPool.select_key(provider)
+
+    def get_section(self, section):
+        """Get all options of a config.ini section as a dict."""
+        self.reload_if_changed()
+        try:
+            if self._config.has_section(section):
+                return dict(self._config.items(section))
+        except Exception:
+            pass
+        return {}
+
+    def get_transport_settings(self):
+        """Get HTTP transport settings (timeouts in seconds, connection pool sizes) from [transport]."""
+        settings = dict(self._transport_defaults)
+        for option, default in self._transport_defaults.items():
+            value = self.get_setting("transport", option)
+            if value is None:
+                continue
+            try:
+                settings[option] = type(default)(value)
+            except ValueError:
+                print(f"Invalid transport setting {option} = {value}")
+        return settings
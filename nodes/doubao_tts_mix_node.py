@@ -7,36 +7,18 @@ import numpy as np
 import torch
 from scipy.io import wavfile
 from .cc_utils import CCConfig
+from .audio_utils import TTSCache
+from .scheduler import JobScheduler
+from .voice_catalog import doubao_voice_catalog
 
 class DoubaoTTS_Mix:
     """豆包语音合成MIX节点 - 支持多个音色混合"""
     
     def __init__(self):
-        """初始化节点，从JSON文件加载音色映射"""
-        # 获取当前文件所在目录
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        # 构建JSON文件路径
-        json_file_path = os.path.join(current_dir, 'doubao_voices.json')
-        
-        # 从JSON文件加载音色映射
-        self.VOICE_MAP = {}
-        self.VOICE_CATEGORIES = {}
-        
-        try:
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                voices = data.get('voice_categories', {})
-                
-                # 将嵌套的音色分类结构扁平化为VOICE_MAP
-                for category, voice_dict in voices.items():
-                    self.VOICE_CATEGORIES[category] = list(voice_dict.keys())
-                    for voice_name, voice_info in voice_dict.items():
-                        self.VOICE_MAP[voice_name] = voice_info
-                        
-        except FileNotFoundError:
-            print(f"Warning: Could not find voice mapping file at {json_file_path}")
-        except Exception as e:
-            print(f"Error loading voice mapping from JSON: {str(e)}")
+        """初始化节点，从共享的音色目录获取音色映射"""
+        catalog = doubao_voice_catalog()
+        self.VOICE_MAP = catalog.voices
+        self.VOICE_CATEGORIES = catalog.categories
     
     # 定义可用的音频格式列表
     FORMAT_LIST = [
@@ -56,11 +38,8 @@ class DoubaoTTS_Mix:
     @classmethod
     def INPUT_TYPES(cls):
         """定义节点输入类型"""
-        # 创建节点实例以获取音色列表
-        instance = cls()
-        
         # 只获取1.0非多情感音色
-        voice_1_0 = instance.VOICE_CATEGORIES.get("1.0", [])
+        voice_1_0 = doubao_voice_catalog().categories.get("1.0", ())
         # 添加分类前缀
         voice_1_0_categorized = [f"1.0/{voice}" for voice in voice_1_0]
         
@@ -85,6 +64,7 @@ class DoubaoTTS_Mix:
                 "channel": (cls.CHANNEL_LIST, {"default": 1}),
                 "app_id": ("STRING", {"default": "", "display_name": "APP ID"}),
                 "access_key": ("STRING", {"default": "", "display_name": "Access Token"}),
+                "use_cache": ("BOOLEAN", {"default": True, "tooltip": "相同文本和参数时直接使用本地缓存的合成结果，不再重复请求API"}),
             }
         }
     
@@ -107,7 +87,8 @@ class DoubaoTTS_Mix:
         pitch=0,
         format="pcm",
         sample_rate=24000,
-        channel=1
+        channel=1,
+        use_cache=True
     ):
         """生成混合音色语音"""
         
@@ -229,6 +210,17 @@ class DoubaoTTS_Mix:
         if pitch != 0:
             request_data["req_params"]["audio_params"]["pitch"] = pitch
         
+        # 检查TTS缓存
+        cache_key = TTSCache.make_key(
+            "doubao_mix", "seed-tts-1.0", request_data["req_params"]["mix_speaker"]["speakers"], text,
+            speed=speed, pitch=pitch, format=format, sample_rate=sample_rate, channel=channel
+        )
+        if use_cache:
+            cached_audio = TTSCache.get(cache_key)
+            if cached_audio is not None:
+                print(f"Using cached TTS result: {cache_key[:12]}")
+                return (cached_audio,)
+        
         try:
             # 发送请求
             headers = {
@@ -238,11 +230,13 @@ class DoubaoTTS_Mix:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
-                "https://openspeech.bytedance.com/api/v3/tts/unidirectional",
-                headers=headers,
-                json=request_data
-            )
+            with JobScheduler().slot("doubao", "seed-tts-1.0", access_key) as slot:
+                response = slot.request(
+                    requests.post,
+                    "https://openspeech.bytedance.com/api/v3/tts/unidirectional",
+                    headers=headers,
+                    json=request_data
+                )
             
             if response.status_code == 200:
                 # 用于存储音频数据
@@ -328,6 +322,9 @@ class DoubaoTTS_Mix:
                             "waveform": waveform_tensor,
                             "sample_rate": sample_rate
                         }
+                        # 写入TTS缓存
+                        if use_cache:
+                            TTSCache.put(cache_key, audio_data)
                         return (audio_data,)
                     except Exception as e:
                         raise ValueError(f"Error processing PCM audio data: {str(e)}")
@@ -387,6 +384,9 @@ class DoubaoTTS_Mix:
                             "waveform": waveform_tensor,
                             "sample_rate": audio_sample_rate
                         }
+                        # 写入TTS缓存
+                        if use_cache:
+                            TTSCache.put(cache_key, audio_data)
                         return (audio_data,)
                     except Exception as e:
                         # 删除临时文件
@@ -8,40 +8,27 @@ import torch
 import re
 from scipy.io import wavfile
 from .cc_utils import CCConfig
+from .audio_utils import TTSCache
+from .scheduler import JobScheduler
+from .voice_catalog import doubao_voice_catalog
 
 class DoubaoTTS:
     """豆包语音合成节点"""
     
     def __init__(self):
-        """初始化节点，从JSON文件加载音色映射"""
-        # 获取当前文件所在目录
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        # 构建JSON文件路径
-        json_file_path = os.path.join(current_dir, 'doubao_voices.json')
+        """初始化节点，从共享的音色目录获取音色映射"""
+        catalog = doubao_voice_catalog()
         
-        # 从JSON文件加载音色映射
-        self.VOICE_MAP = {}
-        self.VOICE_CATEGORIES = {}
-        
-        try:
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                voices = data.get('voice_categories', {})  # 修正这里，使用'voice_categories'而不是'voices'
-                
-                # 将嵌套的音色分类结构扁平化为VOICE_MAP
-                for category, voice_dict in voices.items():
-                    self.VOICE_CATEGORIES[category] = list(voice_dict.keys())
-                    for voice_name, voice_info in voice_dict.items():
-                        self.VOICE_MAP[voice_name] = voice_info
-                        
-        except FileNotFoundError:
-            print(f"Warning: Could not find voice mapping file at {json_file_path}")
-            # 如果找不到JSON文件，使用默认的音色映射
-            self._load_default_voices()
-        except Exception as e:
-            print(f"Error loading voice mapping from JSON: {str(e)}")
-            # 如果加载JSON文件出错，使用默认的音色映射
+        if catalog.voices:
+            self.VOICE_MAP = catalog.voices
+            self.VOICE_EMOTIONS = catalog.emotions
+            self.VOICE_CATEGORIES = catalog.categories
+        else:
+            print("Warning: Could not load doubao_voices.json, using default voice mapping")
+            # 如果JSON文件不可用，使用默认的音色映射
             self._load_default_voices()
+            self.VOICE_EMOTIONS = {}
+            self.VOICE_CATEGORIES = {}
     
     def _load_default_voices(self):
         """加载默认音色映射（当JSON文件不可用时）"""
@@ -215,16 +202,12 @@ class DoubaoTTS:
     @classmethod
     def INPUT_TYPES(cls):
         """定义节点输入类型"""
-        # 创建节点实例以获取音色列表
-        instance = cls()
+        # 从共享的音色目录获取音色列表
+        catalog = doubao_voice_catalog()
         
-        # 如果有音色分类，创建带分类的音色列表
-        if instance.VOICE_CATEGORIES:
-            # 创建分类音色列表，格式为 "分类名/音色名"
-            categorized_voices = []
-            for category, voices in instance.VOICE_CATEGORIES.items():
-                for voice in voices:
-                    categorized_voices.append(f"{category}/{voice}")
+        # 如果有音色分类，使用带分类的音色列表，格式为 "分类名/音色名"
+        if catalog.categories:
+            categorized_voices = catalog.categorized_names
             
             # 默认音色也使用分类格式
             default_voice = "1.0多情感/爽快思思（多情感）"
@@ -232,7 +215,8 @@ class DoubaoTTS:
                 # 如果默认音色不在列表中，使用第一个可用的音色
                 default_voice = categorized_voices[0] if categorized_voices else "爽快思思（多情感）"
         else:
-            # 如果没有分类信息，使用扁平的音色列表
+            # 如果没有分类信息，使用默认的扁平音色列表
+            instance = cls()
             categorized_voices = instance.VOICE_NAMES
             default_voice = "爽快思思（多情感）"
         
@@ -252,6 +236,7 @@ class DoubaoTTS:
                 # "debug_output": ("BOOLEAN", {"default": False}),  # 调试输出选项已隐藏
                 "app_id": ("STRING", {"default": "", "display_name": "APP ID"}),  # 始终用英文显示
                 "access_key": ("STRING", {"default": "", "display_name": "Access Token"}),  # 始终用英文显示
+                "use_cache": ("BOOLEAN", {"default": True, "tooltip": "相同文本和参数时直接使用本地缓存的合成结果，不再重复请求API"}),
             }
         }
     
@@ -273,7 +258,8 @@ class DoubaoTTS:
         format="pcm",
         sample_rate=24000,
         channel=1,
-        debug_output=False  # 调试输出参数（已隐藏）
+        debug_output=False,  # 调试输出参数（已隐藏）
+        use_cache=True
     ):
         """生成语音"""
         
@@ -367,6 +353,20 @@ class DoubaoTTS:
                 # 音色支持多情感但选择的情感不被支持，不发送emotion参数
                 pass
         
+        # 检查TTS缓存
+        audio_params = request_data["req_params"]["audio_params"]
+        cache_key = TTSCache.make_key(
+            "doubao", resource_id, voice_type, text,
+            speed=speed, pitch=pitch, volume=volume,
+            emotion=audio_params.get("emotion", ""),
+            format=format, sample_rate=sample_rate, channel=channel
+        )
+        if use_cache and not debug_output:
+            cached_audio = TTSCache.get(cache_key)
+            if cached_audio is not None:
+                print(f"Using cached TTS result: {cache_key[:12]}")
+                return (cached_audio, "")
+        
         try:
             # 发送请求
             headers = {
@@ -382,11 +382,13 @@ class DoubaoTTS:
                 debug_info += f"Request Headers: {headers}\n"
                 debug_info += f"Request Data: {json.dumps(request_data, ensure_ascii=False, indent=2)}\n\n"
             
-            response = requests.post(
-                "https://openspeech.bytedance.com/api/v3/tts/unidirectional",
-                headers=headers,
-                json=request_data
-            )
+            with JobScheduler().slot("doubao", resource_id, access_key) as slot:
+                response = slot.request(
+                    requests.post,
+                    "https://openspeech.bytedance.com/api/v3/tts/unidirectional",
+                    headers=headers,
+                    json=request_data
+                )
             
             # 如果启用了调试输出，直接返回原始响应内容
             if debug_output:
@@ -565,6 +567,9 @@ class DoubaoTTS:
                                 "waveform": waveform_tensor,
                                 "sample_rate": sample_rate
                             }
+                            # 写入TTS缓存
+                            if use_cache:
+                                TTSCache.put(cache_key, audio_data)
                             return (audio_data, "")
                         except Exception as e:
                             print(f"Error processing PCM audio data: {str(e)}")
@@ -668,6 +673,9 @@ class DoubaoTTS:
                             "waveform": waveform_tensor,
                             "sample_rate": audio_sample_rate
                         }
+                        # 写入TTS缓存
+                        if use_cache:
+                            TTSCache.put(cache_key, audio_data)
                         return (audio_data, "")
                 except Exception as e:
                     print(f"Error processing stream response: {str(e)}")
@@ -688,22 +696,12 @@ class DoubaoTTS:
 
     def _is_voice_support_emotion(self, actual_voice):
         """检查音色是否支持多情感"""
-        # 检查音色是否在VOICE_MAP中，并且是否有情感支持列表
-        if actual_voice in self.VOICE_MAP:
-            voice_info = self.VOICE_MAP[actual_voice]
-            # 如果有第三个元素且是列表，则表示支持多情感
-            return len(voice_info) >= 3 and isinstance(voice_info[2], list)
-        return False
+        # 只有带情感支持列表的音色在VOICE_EMOTIONS中
+        return actual_voice in self.VOICE_EMOTIONS
     
     def _is_emotion_supported(self, actual_voice, emotion_en):
         """检查选择的情感是否被音色支持"""
-        if actual_voice in self.VOICE_MAP:
-            voice_info = self.VOICE_MAP[actual_voice]
-            # 检查是否有情感支持列表
-            if len(voice_info) >= 3 and isinstance(voice_info[2], list):
-                supported_emotions = voice_info[2]
-                return emotion_en in supported_emotions
-        return False
+        return emotion_en in self.VOICE_EMOTIONS.get(actual_voice, frozenset())
     
     def _create_blank_audio(self, sample_rate=24000):
         """创建一个空白音频文件"""
@@ -0,0 +1,275 @@
+import re
+import threading
+import time
+
+from .config import CCConfig
+from .cache_utils import account_fingerprint
+
+
+# 识别密钥失效或余额、配额耗尽的错误信息
+AUTH_ERROR_PATTERN = re.compile(
+    r"status (401|403)|unauthorized|forbidden|invalid api[ _-]?key|invalid token|authentication",
+    re.IGNORECASE
+)
+QUOTA_ERROR_PATTERN = re.compile(
+    r"status 402|insufficient (balance|quota|credit)|quota exceeded|balance not enough|arrears",
+    re.IGNORECASE
+)
+
+STRATEGIES = ("least_outstanding", "weighted_round_robin")
+
+# 已选中但尚未获取调度槽位的密钥，超过该时间视为已放弃
+PENDING_TIMEOUT = 60
+
+
+def classify_key_error(error):
+    """判断错误是否由密钥本身导致，返回"auth"、"quota"或None"""
+    message = str(error)
+    if AUTH_ERROR_PATTERN.search(message):
+        return "auth"
+    if QUOTA_ERROR_PATTERN.search(message):
+        return "quota"
+    return None
+
+
+class KeyPool:
+    """单个服务商的API密钥池，按策略选择密钥并隔离失效的密钥
+
+    密钥通过config.ini中的API_KEYS（逗号分隔）或环境变量<PROVIDER>_API_KEYS配置。
+    正在运行的任务数由全局调度器在获取和释放槽位时通知。
+    """
+
+    # 按服务商缓存的密钥池，以及密钥指纹到密钥池的索引
+    _pools = {}
+    _pools_by_key_id = {}
+    # 可重入锁：创建密钥池时读取配置可能触发重新加载并调用reset
+    _registry_lock = threading.RLock()
+
+    def __init__(self, provider, keys, weights=None, strategy="least_outstanding",
+                 auth_quarantine=3600, quota_quarantine=600):
+        self.provider = provider
+        self.strategy = strategy if strategy in STRATEGIES else "least_outstanding"
+        self.auth_quarantine = auth_quarantine
+        self.quota_quarantine = quota_quarantine
+        self._lock = threading.Lock()
+        weights = weights or []
+        self._entries = []
+        for index, key in enumerate(keys):
+            weight = weights[index] if index < len(weights) else 1
+            self._entries.append({
+                "key": key,
+                "key_id": account_fingerprint(key),
+                "weight": max(1, weight),
+                "current_weight": 0,
+                "outstanding": 0,
+                "pending": [],
+                "requests": 0,
+                "errors": 0,
+                "rate_limited": 0,
+                "quarantined_until": 0,
+                "quarantine_reason": None,
+                "last_used": None,
+            })
+
+    @classmethod
+    def for_provider(cls, provider):
+        """获取服务商的密钥池，未配置多个密钥时返回None"""
+        with cls._registry_lock:
+            if provider not in cls._pools:
+                cls._pools[provider] = cls._build(provider)
+                pool = cls._pools[provider]
+                if pool is not None:
+                    for entry in pool._entries:
+                        cls._pools_by_key_id[entry["key_id"]] = pool
+            return cls._pools[provider]
+
+    @classmethod
+    def _build(cls, provider):
+        """根据配置创建密钥池"""
+        config = CCConfig()
+        keys, weights = config.get_api_keys(provider)
+        if len(keys) < 2:
+            return None
+        strategy = (config.get_setting("key_pool", "STRATEGY", "least_outstanding") or "").strip().lower()
+        try:
+            auth_quarantine = float(config.get_setting("key_pool", "AUTH_QUARANTINE_MINUTES", 60)) * 60
+            quota_quarantine = float(config.get_setting("key_pool", "QUOTA_QUARANTINE_MINUTES", 10)) * 60
+        except ValueError:
+            print("Invalid [key_pool] quarantine setting, using defaults")
+            auth_quarantine, quota_quarantine = 3600, 600
+        print(f"{provider} key pool enabled with {len(keys)} keys ({strategy})")
+        return cls(provider, keys, weights, strategy, auth_quarantine, quota_quarantine)
+
+    @classmethod
+    def reset(cls):
+        """清空已创建的密钥池，下次使用时按最新配置重建"""
+        with cls._registry_lock:
+            cls._pools = {}
+            cls._pools_by_key_id = {}
+
+    @classmethod
+    def select_key(cls, provider):
+        """从服务商的密钥池中选择一个密钥，未配置密钥池时返回None"""
+        pool = cls.for_provider(provider)
+        return pool.select() if pool is not None else None
+
+    @classmethod
+    def first_key(cls, provider):
+        """返回服务商密钥池中配置的第一个密钥（不计入负载），未配置密钥池时返回None"""
+        pool = cls.for_provider(provider)
+        return pool._entries[0]["key"] if pool is not None else None
+
+    @classmethod
+    def lookup(cls, key_id):
+        """根据密钥指纹查找所属的密钥池"""
+        return cls._pools_by_key_id.get(key_id)
+
+    @classmethod
+    def find_key(cls, provider, key_id):
+        """根据密钥指纹在服务商的密钥池中查找密钥，找不到返回None"""
+        pool = cls.for_provider(provider)
+        if pool is None:
+            return None
+        for entry in pool._entries:
+            if entry["key_id"] == key_id:
+                return entry["key"]
+        return None
+
+    @classmethod
+    def notify_start(cls, key_id):
+        """调度器获取槽位后调用，记录密钥上正在运行的任务"""
+        pool = cls.lookup(key_id)
+        if pool is not None:
+            pool._on_start(key_id)
+
+    @classmethod
+    def notify_finish(cls, key_id):
+        """调度器释放槽位后调用"""
+        pool = cls.lookup(key_id)
+        if pool is not None:
+            pool._on_finish(key_id)
+
+    @classmethod
+    def notify_error(cls, key_id, error):
+        """记录请求错误，密钥失效或配额耗尽时隔离该密钥"""
+        pool = cls.lookup(key_id)
+        if pool is not None:
+            pool._on_error(key_id, error)
+
+    @classmethod
+    def notify_rate_limited(cls, key_id):
+        """记录限流次数（冷却由调度器处理）"""
+        pool = cls.lookup(key_id)
+        if pool is not None:
+            with pool._lock:
+                entry = pool._entry(key_id)
+                if entry is not None:
+                    entry["rate_limited"] += 1
+
+    @classmethod
+    def snapshot_all(cls):
+        """获取所有密钥池的状态"""
+        with cls._registry_lock:
+            pools = [pool for pool in cls._pools.values() if pool is not None]
+        return {pool.provider: pool.get_stats() for pool in pools}
+
+    def _entry(self, key_id):
+        for entry in self._entries:
+            if entry["key_id"] == key_id:
+                return entry
+        return None
+
+    def _prune_pending(self, entry, now):
+        entry["pending"] = [t for t in entry["pending"] if now - t < PENDING_TIMEOUT]
+
+    def _load(self, entry):
+        """密钥当前负载：运行中和已选中待运行的任务数按权重折算"""
+        return (entry["outstanding"] + len(entry["pending"])) / entry["weight"]
+
+    def select(self):
+        """选择一个可用密钥；全部被隔离时返回最早解除隔离的密钥"""
+        now = time.time()
+        with self._lock:
+            for entry in self._entries:
+                self._prune_pending(entry, now)
+            candidates = [entry for entry in self._entries if entry["quarantined_until"] <= now]
+            if not candidates:
+                entry = min(self._entries, key=lambda e: e["quarantined_until"])
+                print(f"WARNING: all {self.provider} keys are quarantined, using {entry['key_id']}")
+            elif self.strategy == "weighted_round_robin":
+                # 平滑加权轮询
+                total = sum(e["weight"] for e in candidates)
+                for e in candidates:
+                    e["current_weight"] += e["weight"]
+                entry = max(candidates, key=lambda e: e["current_weight"])
+                entry["current_weight"] -= total
+            else:
+                entry = min(candidates, key=lambda e: (self._load(e), e["requests"]))
+            entry["pending"].append(now)
+            entry["last_used"] = now
+            return entry["key"]
+
+    def _on_start(self, key_id):
+        with self._lock:
+            entry = self._entry(key_id)
+            if entry is None:
+                return
+            if entry["pending"]:
+                entry["pending"].pop(0)
+            entry["outstanding"] += 1
+            entry["requests"] += 1
+
+    def _on_finish(self, key_id):
+        with self._lock:
+            entry = self._entry(key_id)
+            if entry is not None:
+                entry["outstanding"] = max(0, entry["outstanding"] - 1)
+
+    def _on_error(self, key_id, error):
+        kind = classify_key_error(error)
+        with self._lock:
+            entry = self._entry(key_id)
+            if entry is None:
+                return
+            entry["errors"] += 1
+            if kind is None:
+                return
+            duration = self.auth_quarantine if kind == "auth" else self.quota_quarantine
+            entry["quarantined_until"] = time.time() + duration
+            entry["quarantine_reason"] = kind
+        print(f"{self.provider} key {key_id} quarantined for {duration / 60:.0f} min ({kind} error)")
+
+    def release_quarantine(self, key_id=None):
+        """解除指定密钥（或全部密钥）的隔离"""
+        with self._lock:
+            for entry in self._entries:
+                if key_id is None or entry["key_id"] == key_id:
+                    entry["quarantined_until"] = 0
+                    entry["quarantine_reason"] = None
+
+    def get_stats(self):
+        """获取各密钥的使用统计（只包含密钥指纹，不包含明文密钥）"""
+        now = time.time()
+        with self._lock:
+            return {
+                "strategy": self.strategy,
+                "keys": [
+                    {
+                        "key_id": entry["key_id"],
+                        "weight": entry["weight"],
+                        "outstanding": entry["outstanding"],
+                        "pending": len(entry["pending"]),
+                        "requests": entry["requests"],
+                        "errors": entry["errors"],
+                        "rate_limited": entry["rate_limited"],
+                        "quarantined": entry["quarantined_until"] > now,
+                        "quarantine_remaining": max(0, round(entry["quarantined_until"] - now, 1)),
+                        "quarantine_reason": entry["quarantine_reason"] if entry["quarantined_until"] > now else None,
+                    }
+                    for entry in self._entries
+                ],
+            }
+
+
+# config.ini修改后按新的密钥配置重建密钥池
+CCConfig().add_reload_listener(KeyPool.reset)
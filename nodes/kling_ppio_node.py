@@ -1,10 +1,12 @@
 import requests
-import os
 import time
 import io
 import base64
 from typing import Tuple, Dict, Any
-from .cc_utils import ImageUtils
+from .cc_utils import CCConfig, ImageUtils
+from .ppio_utils import parse_prompt_list, parse_seed_list, split_image_batch, expand_batch_jobs, run_batch_video_tasks, detach_task
+from .scheduler import JobScheduler
+from .metrics import count_bytes, phase, timed_phase, traced_polling, traced_task_query
 
 # 尝试导入ComfyUI的视频处理模块
 try:
@@ -34,50 +36,21 @@ class KlingPPIOImg2VideoNode:
             },
             "optional": {
                 "negative_prompt": ("STRING", {"default": "", "multiline": True}),
+                "detach": ("BOOLEAN", {"default": False, "tooltip": "提交任务后立即返回task_id，不等待视频生成；用“派欧云收集视频任务”节点获取视频"}),
             }
         }
 
-    RETURN_TYPES = ("VIDEO",) if HAS_COMFY_VIDEO else ("STRING",)
-    RETURN_NAMES = ("video",) if HAS_COMFY_VIDEO else ("video_url",)
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("video", "task_id") if HAS_COMFY_VIDEO else ("video_url", "task_id")
     FUNCTION = "generate_video"
     CATEGORY = "CC-API/Video"
     OUTPUT_NODE = False
 
     def get_api_key(self, provided_key=""):
-        """获取API密钥，优先级：参数 > 环境变量 > 配置文件"""
-        # 首先检查传入的参数
-        if provided_key:
-            return provided_key
-        
-        # 然后检查环境变量
-        env_var_name = "PPIO_API_KEY"
-        if os.environ.get(env_var_name) is not None:
-            return os.environ[env_var_name]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            # 在Windows系统上明确指定使用UTF-8编码读取配置文件
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config.read_file(f)
-            except UnicodeDecodeError:
-                # 如果UTF-8失败，尝试使用系统默认编码
-                config.read(config_path)
-            
-            try:
-                if "ppio" in config and "API_KEY" in config["ppio"]:
-                    return config["ppio"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        """获取API密钥，优先级：参数 > 密钥池 > 环境变量 > 配置文件"""
+        return CCConfig().get_api_key("ppio", provided_key)
 
+    @timed_phase("encode", upload=True)
     def tensor_to_base64(self, image_tensor):
         """将ComfyUI图像张量转换为base64字符串"""
         try:
@@ -144,6 +117,7 @@ class KlingPPIOImg2VideoNode:
         except Exception as e:
             raise Exception(f"Error calling Kling Img2Video API: {str(e)}")
 
+    @traced_task_query
     def query_task_result(self, api_key, task_id):
         """查询任务结果"""
         try:
@@ -171,6 +145,7 @@ class KlingPPIOImg2VideoNode:
         except Exception as e:
             raise Exception(f"Error querying task result: {str(e)}")
 
+    @traced_polling
     def poll_task_result(self, api_key, task_id, poll_interval=5, max_attempts=120):
         """轮询任务结果直到完成或失败"""
         for attempt in range(max_attempts):
@@ -236,7 +211,8 @@ class KlingPPIOImg2VideoNode:
         mode,
         seed,
         api_key="",
-        negative_prompt=""
+        negative_prompt="",
+        detach=False
     ):
         """生成图生视频"""
         # 获取API密钥
@@ -255,22 +231,27 @@ class KlingPPIOImg2VideoNode:
         try:
             # 调用API生成视频
             print("Calling Kling V2.5 Turbo Img2Video API...")
-            task_id = self.call_kling_img2video_api(
-                api_key=api_key,
-                image=image,
-                prompt=prompt,
-                duration=duration,
-                cfg_scale=cfg_scale,
-                mode=mode,
-                seed=seed if seed != -1 else None,
-                negative_prompt=negative_prompt
-            )
+            # 通过全局调度器限制并发任务数，任务完成后释放槽位
+            with JobScheduler().slot("ppio", "kling-2.5-turbo-i2v", api_key) as slot:
+                task_id = slot.call(
+                    self.call_kling_img2video_api,
+                    api_key=api_key,
+                    image=image,
+                    prompt=prompt,
+                    duration=duration,
+                    cfg_scale=cfg_scale,
+                    mode=mode,
+                    seed=seed if seed != -1 else None,
+                    negative_prompt=negative_prompt
+                )
             
-            print(f"Task submitted with ID: {task_id}")
+                print(f"Task submitted with ID: {task_id}")
+                if detach:
+                    return detach_task(api_key, task_id, self.__class__.__name__, "kling-2.5-turbo-i2v")
             
-            # 轮询任务结果
-            print("Waiting for video generation to complete...")
-            video_url = self.poll_task_result(api_key, task_id)
+                # 轮询任务结果
+                print("Waiting for video generation to complete...")
+                video_url = self.poll_task_result(api_key, task_id)
             
             print(f"Video generated successfully: {video_url}")
             
@@ -279,16 +260,18 @@ class KlingPPIOImg2VideoNode:
                 # 使用同步方式下载视频，避免事件循环冲突
                 try:
                     import urllib.request
-                    video_io = io.BytesIO(urllib.request.urlopen(video_url).read())
-                    video_output = VideoFromFile(video_io)
-                    return (video_output,)
+                    with phase("download"):
+                        video_io = io.BytesIO(count_bytes("download", urllib.request.urlopen(video_url).read()))
+                    with phase("decode"):
+                        video_output = VideoFromFile(video_io)
+                    return (video_output, task_id)
                 except Exception as e:
                     print(f"Error downloading video synchronously: {str(e)}")
                     # 如果同步下载失败，回退到返回URL
-                    return (video_url,)
+                    return (video_url, task_id)
             else:
                 # 否则返回URL字符串
-                return (video_url,)
+                return (video_url, task_id)
             
         except Exception as e:
             print(f"Error generating video: {str(e)}")
@@ -312,49 +295,19 @@ class KlingPPIOText2VideoNode:
             },
             "optional": {
                 "negative_prompt": ("STRING", {"default": "", "multiline": True}),
+                "detach": ("BOOLEAN", {"default": False, "tooltip": "提交任务后立即返回task_id，不等待视频生成；用“派欧云收集视频任务”节点获取视频"}),
             }
         }
 
-    RETURN_TYPES = ("VIDEO",) if HAS_COMFY_VIDEO else ("STRING",)
-    RETURN_NAMES = ("video",) if HAS_COMFY_VIDEO else ("video_url",)
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("video", "task_id") if HAS_COMFY_VIDEO else ("video_url", "task_id")
     FUNCTION = "generate_video"
     CATEGORY = "CC-API/Video"
     OUTPUT_NODE = False
 
     def get_api_key(self, provided_key=""):
-        """获取API密钥，优先级：参数 > 环境变量 > 配置文件"""
-        # 首先检查传入的参数
-        if provided_key:
-            return provided_key
-        
-        # 然后检查环境变量
-        env_var_name = "PPIO_API_KEY"
-        if os.environ.get(env_var_name) is not None:
-            return os.environ[env_var_name]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            # 在Windows系统上明确指定使用UTF-8编码读取配置文件
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config.read_file(f)
-            except UnicodeDecodeError:
-                # 如果UTF-8失败，尝试使用系统默认编码
-                config.read(config_path)
-            
-            try:
-                if "ppio" in config and "API_KEY" in config["ppio"]:
-                    return config["ppio"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        """获取API密钥，优先级：参数 > 密钥池 > 环境变量 > 配置文件"""
+        return CCConfig().get_api_key("ppio", provided_key)
 
     def call_kling_text2video_api(self, api_key, prompt, duration, aspect_ratio, cfg_scale, mode, seed, negative_prompt=None):
         """调用Kling V2.5 Turbo文生视频API"""
@@ -401,6 +354,7 @@ class KlingPPIOText2VideoNode:
         except Exception as e:
             raise Exception(f"Error calling Kling Text2Video API: {str(e)}")
 
+    @traced_task_query
     def query_task_result(self, api_key, task_id):
         """查询任务结果"""
         try:
@@ -428,6 +382,7 @@ class KlingPPIOText2VideoNode:
         except Exception as e:
             raise Exception(f"Error querying task result: {str(e)}")
 
+    @traced_polling
     def poll_task_result(self, api_key, task_id, poll_interval=5, max_attempts=120):
         """轮询任务结果直到完成或失败"""
         for attempt in range(max_attempts):
@@ -493,7 +448,8 @@ class KlingPPIOText2VideoNode:
         mode,
         seed,
         api_key="",
-        negative_prompt=""
+        negative_prompt="",
+        detach=False
     ):
         """生成文生视频"""
         # 获取API密钥
@@ -508,22 +464,27 @@ class KlingPPIOText2VideoNode:
         try:
             # 调用API生成视频
             print("Calling Kling V2.5 Turbo Text2Video API...")
-            task_id = self.call_kling_text2video_api(
-                api_key=api_key,
-                prompt=prompt,
-                duration=duration,
-                aspect_ratio=aspect_ratio,
-                cfg_scale=cfg_scale,
-                mode=mode,
-                seed=seed if seed != -1 else None,
-                negative_prompt=negative_prompt
-            )
+            # 通过全局调度器限制并发任务数，任务完成后释放槽位
+            with JobScheduler().slot("ppio", "kling-2.5-turbo-t2v", api_key) as slot:
+                task_id = slot.call(
+                    self.call_kling_text2video_api,
+                    api_key=api_key,
+                    prompt=prompt,
+                    duration=duration,
+                    aspect_ratio=aspect_ratio,
+                    cfg_scale=cfg_scale,
+                    mode=mode,
+                    seed=seed if seed != -1 else None,
+                    negative_prompt=negative_prompt
+                )
             
-            print(f"Task submitted with ID: {task_id}")
+                print(f"Task submitted with ID: {task_id}")
+                if detach:
+                    return detach_task(api_key, task_id, self.__class__.__name__, "kling-2.5-turbo-t2v")
             
-            # 轮询任务结果
-            print("Waiting for video generation to complete...")
-            video_url = self.poll_task_result(api_key, task_id)
+                # 轮询任务结果
+                print("Waiting for video generation to complete...")
+                video_url = self.poll_task_result(api_key, task_id)
             
             print(f"Video generated successfully: {video_url}")
             
@@ -532,30 +493,103 @@ class KlingPPIOText2VideoNode:
                 # 使用同步方式下载视频，避免事件循环冲突
                 try:
                     import urllib.request
-                    video_io = io.BytesIO(urllib.request.urlopen(video_url).read())
-                    video_output = VideoFromFile(video_io)
-                    return (video_output,)
+                    with phase("download"):
+                        video_io = io.BytesIO(count_bytes("download", urllib.request.urlopen(video_url).read()))
+                    with phase("decode"):
+                        video_output = VideoFromFile(video_io)
+                    return (video_output, task_id)
                 except Exception as e:
                     print(f"Error downloading video synchronously: {str(e)}")
                     # 如果同步下载失败，回退到返回URL
-                    return (video_url,)
+                    return (video_url, task_id)
             else:
                 # 否则返回URL字符串
-                return (video_url,)
+                return (video_url, task_id)
             
         except Exception as e:
             print(f"Error generating video: {str(e)}")
             raise ValueError(f"Video generation failed: {str(e)}")
 
 
+class KlingPPIOBatchVideoNode:
+    """Kling V2.5 Turbo 批量视频节点 (派欧云)，提供图像时为图生视频，否则为文生视频"""
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "prompts": ("STRING", {"default": "", "multiline": True, "tooltip": "每行一个提示词，每行生成一个视频"}),
+                "duration": ([5, 10], {"default": 5}),
+                "aspect_ratio": (["16:9", "9:16", "1:1"], {"default": "16:9"}),
+                "cfg_scale": ("FLOAT", {"default": 0.5, "min": 0.0, "max": 1.0, "step": 0.1}),
+                "mode": (["pro"], {"default": "pro"}),
+                "seeds": ("STRING", {"default": "", "tooltip": "种子列表，用逗号分隔；为空表示随机，只填一个则所有任务共用"}),
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 16, "tooltip": "同时提交的最大任务数"}),
+                "api_key": ("STRING", {"default": ""}),
+            },
+            "optional": {
+                "images": ("IMAGE", {"tooltip": "可选的首帧图像批次，提供时使用图生视频；单张图像会用于所有任务"}),
+                "negative_prompt": ("STRING", {"default": "", "multiline": True}),
+            }
+        }
+
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("videos", "task_ids") if HAS_COMFY_VIDEO else ("video_urls", "task_ids")
+    OUTPUT_IS_LIST = (True, True)
+    FUNCTION = "generate_videos"
+    CATEGORY = "CC-API/Video"
+    OUTPUT_NODE = False
+
+    def generate_videos(
+        self,
+        prompts,
+        duration,
+        aspect_ratio,
+        cfg_scale,
+        mode,
+        seeds,
+        max_concurrency,
+        api_key="",
+        images=None,
+        negative_prompt=""
+    ):
+        """批量生成视频"""
+        img2video = KlingPPIOImg2VideoNode()
+        text2video = KlingPPIOText2VideoNode()
+        
+        # 获取API密钥
+        api_key = text2video.get_api_key(api_key)
+        if not api_key:
+            raise ValueError("API key is required")
+        
+        jobs = expand_batch_jobs(parse_prompt_list(prompts), parse_seed_list(seeds), split_image_batch(images))
+        
+        def submit(job):
+            if job["image"] is not None:
+                return img2video.call_kling_img2video_api(
+                    job["api_key"], job["image"], job["prompt"], duration, cfg_scale, mode, job["seed"], negative_prompt
+                )
+            return text2video.call_kling_text2video_api(
+                job["api_key"], job["prompt"], duration, aspect_ratio, cfg_scale, mode, job["seed"], negative_prompt
+            )
+        
+        def endpoint(job):
+            return "kling-2.5-turbo-i2v" if job["image"] is not None else "kling-2.5-turbo-t2v"
+        
+        videos, task_ids = run_batch_video_tasks(api_key, jobs, submit, max_concurrency, endpoint)
+        return (videos, task_ids)
+
+
 # Node class mappings
 NODE_CLASS_MAPPINGS = {
     "KlingPPIOImg2VideoNode": KlingPPIOImg2VideoNode,
-    "KlingPPIOText2VideoNode": KlingPPIOText2VideoNode
+    "KlingPPIOText2VideoNode": KlingPPIOText2VideoNode,
+    "KlingPPIOBatchVideoNode": KlingPPIOBatchVideoNode
 }
 
 # Node display name mappings
 NODE_DISPLAY_NAME_MAPPINGS = {
     "KlingPPIOImg2VideoNode": "可灵 2.5 图生视频 (派欧云)",
-    "KlingPPIOText2VideoNode": "可灵 2.5 文生视频 (派欧云)"
+    "KlingPPIOText2VideoNode": "可灵 2.5 文生视频 (派欧云)",
+    "KlingPPIOBatchVideoNode": "可灵 2.5 批量视频 (派欧云)"
 }
\ No newline at end of file
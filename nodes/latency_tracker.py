@@ -0,0 +1,83 @@
+import math
+import threading
+import time
+from collections import deque
+
+
+def percentile(values, fraction):
+    """计算已排序列表的分位数（最近秩法）"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+class LatencyTracker:
+    """按服务商记录近期请求耗时和错误率，用于选择当前最快的服务商
+
+    只保留最近window_seconds内、最多max_samples条记录，使统计跟随一天中不同时段的排队情况变化。
+    """
+
+    _instance = None
+    max_samples = 100
+    window_seconds = 3600
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(LatencyTracker, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def _prune(self, samples, now):
+        while samples and now - samples[0][0] > self.window_seconds:
+            samples.popleft()
+
+    def record(self, name, seconds, ok=True):
+        """记录一次请求的耗时和是否成功"""
+        now = time.time()
+        with self._lock:
+            samples = self._samples.setdefault(name, deque(maxlen=self.max_samples))
+            samples.append((now, seconds, ok))
+            self._prune(samples, now)
+
+    def stats(self, name):
+        """获取统计：样本数、成功请求耗时的p50/p95（秒）和错误率"""
+        now = time.time()
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is not None:
+                self._prune(samples, now)
+            samples = list(samples or [])
+        durations = sorted(seconds for _, seconds, ok in samples if ok)
+        errors = sum(1 for _, _, ok in samples if not ok)
+        return {
+            "count": len(samples),
+            "p50": percentile(durations, 0.5),
+            "p95": percentile(durations, 0.95),
+            "error_rate": errors / len(samples) if samples else 0.0,
+        }
+
+    def expected_latency(self, name):
+        """估计请求耗时：p50加上按错误率折算的失败代价；没有样本时返回None"""
+        stats = self.stats(name)
+        if stats["p50"] is None:
+            return None
+        return stats["p50"] + stats["error_rate"] * (stats["p95"] or stats["p50"])
+
+    def rank(self, names):
+        """按估计耗时从快到慢排序，没有样本的服务商排在最前以便探测"""
+        def sort_key(item):
+            index, name = item
+            latency = self.expected_latency(name)
+            return (latency is not None, latency or 0.0, index)
+        return [name for _, name in sorted(enumerate(names), key=sort_key)]
+
+    def snapshot(self):
+        """获取所有服务商的统计"""
+        with self._lock:
+            names = list(self._samples.keys())
+        return {name: self.stats(name) for name in names}
@@ -0,0 +1,307 @@
+"""
+节点模块延迟加载
+
+首次启动（或节点代码、音色数据文件变化后）正常导入全部节点模块，并把每个节点的
+INPUT_TYPES、RETURN_TYPES等描述信息写入清单 cache/node_manifest.json。之后启动时只根据
+清单注册轻量的占位类，真正的实现模块（及其依赖的torch、PyAV、音色数据等）在节点
+第一次执行时才导入。
+
+设置环境变量 CC_API_LAZY_LOAD=0 可关闭延迟加载；CC_API_PROFILE_IMPORTS=1 会在启动时
+打印各模块的导入耗时。
+
+注册给ComfyUI的是记录请求耗时分解的节点子类（见metrics.py）。
+
+本模块只依赖标准库，避免在启动阶段引入重量级依赖。
+"""
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+
+from .cache_utils import CACHE_ROOT, atomic_write_json
+from .metrics import traced_node_class
+
+
+MANIFEST_PATH = os.path.join(CACHE_ROOT, "node_manifest.json")
+MANIFEST_VERSION = 1
+
+# 占位类需要提供给ComfyUI的类属性
+CLASS_ATTRIBUTES = (
+    "RETURN_TYPES",
+    "RETURN_NAMES",
+    "OUTPUT_IS_LIST",
+    "OUTPUT_NODE",
+    "OUTPUT_TOOLTIPS",
+    "INPUT_IS_LIST",
+    "FUNCTION",
+    "CATEGORY",
+    "DESCRIPTION",
+    "DEPRECATED",
+    "EXPERIMENTAL",
+    "NOT_IDEMPOTENT",
+)
+
+# ComfyUI会在执行前检查的可选类方法，存在时由占位类转发给真实类
+OPTIONAL_METHODS = ("IS_CHANGED", "VALIDATE_INPUTS", "check_lazy_status")
+
+# 需要保持为元组的类属性
+TUPLE_ATTRIBUTES = ("RETURN_TYPES", "RETURN_NAMES", "OUTPUT_IS_LIST", "OUTPUT_TOOLTIPS")
+
+
+def lazy_loading_enabled():
+    return os.environ.get("CC_API_LAZY_LOAD", "1").strip().lower() not in ("0", "false", "no")
+
+
+def profiling_enabled():
+    return os.environ.get("CC_API_PROFILE_IMPORTS", "").strip().lower() in ("1", "true", "yes")
+
+
+def _restore_input_types(input_types):
+    """将清单中的输入定义还原为ComfyUI使用的(类型, 选项)元组"""
+    restored = {}
+    for group, inputs in input_types.items():
+        if isinstance(inputs, dict):
+            restored[group] = {
+                name: tuple(spec) if isinstance(spec, list) else spec
+                for name, spec in inputs.items()
+            }
+        else:
+            restored[group] = inputs
+    return restored
+
+
+class NodeModuleLoader:
+    """按需导入节点模块，并记录每个模块的导入耗时"""
+
+    def __init__(self, package, module_names, route_modules=()):
+        self.package = package
+        self.module_names = list(module_names)
+        self.route_modules = list(route_modules)
+        self.nodes_dir = os.path.dirname(os.path.abspath(__file__))
+        self._modules = {}
+        self._traced_classes = {}
+        self._lock = threading.RLock()
+        self.profile = {}
+
+    def fingerprint(self):
+        """节点代码和数据文件的指纹，任何文件变化都会使清单失效"""
+        digest = hashlib.sha256()
+        digest.update(str(MANIFEST_VERSION).encode())
+        digest.update(sys.version.encode())
+        digest.update(",".join(self.module_names + self.route_modules).encode())
+        # 是否存在ComfyUI视频模块会影响部分节点的RETURN_TYPES
+        digest.update(str(importlib.util.find_spec("comfy_api") is not None).encode())
+        for name in sorted(os.listdir(self.nodes_dir)):
+            if name.endswith((".py", ".json")):
+                stat = os.stat(os.path.join(self.nodes_dir, name))
+                digest.update(f"{name}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+        return digest.hexdigest()
+
+    def load_module(self, module_name):
+        """导入节点模块（只导入一次），记录耗时和新增加载的模块数"""
+        with self._lock:
+            module = self._modules.get(module_name)
+            if module is not None:
+                return module
+            modules_before = len(sys.modules)
+            start = time.perf_counter()
+            module = importlib.import_module(f"{self.package}.nodes.{module_name}")
+            elapsed = time.perf_counter() - start
+            self.profile[module_name] = {
+                "seconds": round(elapsed, 4),
+                "new_modules": len(sys.modules) - modules_before,
+            }
+            self._modules[module_name] = module
+            if profiling_enabled():
+                print(f"[CC-API] imported {module_name} in {elapsed * 1000:.1f} ms")
+            return module
+
+    def is_loaded(self, module_name):
+        return module_name in self._modules
+
+    def get_class(self, module_name, node_name):
+        """获取注册给ComfyUI的节点类（记录请求耗时分解的子类）"""
+        with self._lock:
+            key = (module_name, node_name)
+            if key not in self._traced_classes:
+                node_class = self.load_module(module_name).NODE_CLASS_MAPPINGS[node_name]
+                self._traced_classes[key] = traced_node_class(node_class)
+            return self._traced_classes[key]
+
+    def node_classes(self, module_name):
+        module = self.load_module(module_name)
+        return {
+            node_name: self.get_class(module_name, node_name)
+            for node_name in getattr(module, "NODE_CLASS_MAPPINGS", {})
+        }
+
+    def describe_module(self, module):
+        """生成模块的清单条目"""
+        nodes = {}
+        for node_name, node_class in getattr(module, "NODE_CLASS_MAPPINGS", {}).items():
+            nodes[node_name] = {
+                "input_types": node_class.INPUT_TYPES(),
+                "attributes": {
+                    attr: getattr(node_class, attr)
+                    for attr in CLASS_ATTRIBUTES if hasattr(node_class, attr)
+                },
+                "methods": [name for name in OPTIONAL_METHODS if hasattr(node_class, name)],
+            }
+        return {
+            "nodes": nodes,
+            "display_names": dict(getattr(module, "NODE_DISPLAY_NAME_MAPPINGS", {})),
+            "routes": [(method, path, handler.__name__) for method, path, handler in getattr(module, "ROUTES", [])],
+        }
+
+    def load_manifest(self):
+        """读取清单，不存在或已失效时返回None"""
+        try:
+            with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if manifest.get("fingerprint") != self.fingerprint():
+            return None
+        return manifest
+
+    def save_manifest(self, modules):
+        """保存清单；无法序列化的模块标记为需要立即加载"""
+        entries = {}
+        for module_name, module in modules.items():
+            try:
+                entry = self.describe_module(module)
+                json.dumps(entry)
+            except (TypeError, ValueError) as e:
+                print(f"[CC-API] {module_name} cannot be loaded lazily: {e}")
+                entry = {"eager": True}
+            entry["profile"] = self.profile.get(module_name)
+            entries[module_name] = entry
+        manifest = {"fingerprint": self.fingerprint(), "modules": entries}
+        try:
+            atomic_write_json(MANIFEST_PATH, manifest)
+        except Exception as e:
+            print(f"[CC-API] Error saving node manifest: {e}")
+
+    def make_stub(self, module_name, node_name, description):
+        """创建占位类：提供清单中的描述信息，实例化时导入真实模块并返回真实节点实例"""
+        loader = self
+        attributes = dict(description["attributes"])
+        for attr in TUPLE_ATTRIBUTES:
+            if isinstance(attributes.get(attr), list):
+                attributes[attr] = tuple(attributes[attr])
+        cached_input_types = _restore_input_types(description["input_types"])
+
+        def INPUT_TYPES(cls):
+            # 真实模块已加载时使用真实定义，以便音色列表等动态选项保持最新
+            if loader.is_loaded(module_name):
+                return loader.get_class(module_name, node_name).INPUT_TYPES()
+            return cached_input_types
+
+        def __new__(cls, *args, **kwargs):
+            return loader.get_class(module_name, node_name)(*args, **kwargs)
+
+        namespace = dict(attributes)
+        namespace["INPUT_TYPES"] = classmethod(INPUT_TYPES)
+        namespace["__new__"] = __new__
+        namespace["__doc__"] = f"Lazy stub for {module_name}.{node_name}"
+        namespace["__module__"] = f"{self.package}.nodes.{module_name}"
+        for method_name in description["methods"]:
+            namespace[method_name] = classmethod(self._forward_method(module_name, node_name, method_name))
+        return type(node_name, (object,), namespace)
+
+    def _forward_method(self, module_name, node_name, method_name):
+        loader = self
+
+        def forward(cls, *args, **kwargs):
+            return getattr(loader.get_class(module_name, node_name), method_name)(*args, **kwargs)
+        return forward
+
+    def _lazy_handler(self, module_name, handler_name):
+        """创建路由代理：第一次请求时导入模块并转发给真实处理函数"""
+        loader = self
+
+        async def handler(request):
+            module = loader.load_module(module_name)
+            return await getattr(module, handler_name)(request)
+        handler.__name__ = handler_name
+        return handler
+
+    def register_routes(self, routes):
+        """向ComfyUI注册路由，列表元素为(方法, 路径, 处理函数)"""
+        try:
+            import server
+        except ImportError:
+            return
+        table = server.PromptServer.instance.routes
+        for method, path, handler in routes:
+            table.route(method, path)(handler)
+
+    def install(self):
+        """加载节点，返回(NODE_CLASS_MAPPINGS, NODE_DISPLAY_NAME_MAPPINGS)"""
+        manifest = self.load_manifest() if lazy_loading_enabled() else None
+        if manifest is None:
+            return self._install_eager()
+        return self._install_lazy(manifest)
+
+    def _install_eager(self):
+        """导入全部模块并重建清单"""
+        class_mappings = {}
+        display_mappings = {}
+        routes = []
+        modules = {}
+        for module_name in self.module_names + self.route_modules:
+            module = self.load_module(module_name)
+            modules[module_name] = module
+            class_mappings.update(self.node_classes(module_name))
+            display_mappings.update(getattr(module, "NODE_DISPLAY_NAME_MAPPINGS", {}))
+            routes.extend(getattr(module, "ROUTES", []))
+        self.register_routes(routes)
+        if lazy_loading_enabled():
+            self.save_manifest(modules)
+        self.report(deferred={})
+        return class_mappings, display_mappings
+
+    def _install_lazy(self, manifest):
+        """根据清单注册占位类和路由代理，需要立即加载的模块正常导入"""
+        class_mappings = {}
+        display_mappings = {}
+        routes = []
+        deferred = {}
+        for module_name in self.module_names + self.route_modules:
+            entry = manifest["modules"].get(module_name, {"eager": True})
+            if entry.get("eager"):
+                module = self.load_module(module_name)
+                class_mappings.update(self.node_classes(module_name))
+                display_mappings.update(getattr(module, "NODE_DISPLAY_NAME_MAPPINGS", {}))
+                routes.extend(getattr(module, "ROUTES", []))
+                continue
+            for node_name, description in entry["nodes"].items():
+                class_mappings[node_name] = self.make_stub(module_name, node_name, description)
+            display_mappings.update(entry["display_names"])
+            for method, path, handler_name in entry["routes"]:
+                routes.append((method, path, self._lazy_handler(module_name, handler_name)))
+            deferred[module_name] = entry.get("profile")
+        self.register_routes(routes)
+        self.report(deferred)
+        return class_mappings, display_mappings
+
+    def report(self, deferred):
+        """打印导入耗时报告：已导入模块的实测耗时和延迟模块上次的导入耗时"""
+        if not profiling_enabled():
+            return
+        rows = [(name, info, "loaded") for name, info in self.profile.items()]
+        rows += [(name, info, "deferred") for name, info in deferred.items()]
+        rows.sort(key=lambda row: -(row[1] or {}).get("seconds", 0))
+        total = sum(info["seconds"] for info in self.profile.values())
+        print("[CC-API] Import profile (first import of a module includes shared dependencies):")
+        print(f"  {'module':<28} {'state':<9} {'ms':>9} {'new modules':>12}")
+        for name, info, state in rows:
+            info = info or {}
+            seconds = info.get("seconds")
+            ms = f"{seconds * 1000:.1f}" if seconds is not None else "-"
+            print(f"  {name:<28} {state:<9} {ms:>9} {info.get('new_modules', '-'):>12}")
+        print(f"  startup import time: {total * 1000:.1f} ms, deferred modules: {len(deferred)}")
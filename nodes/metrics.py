@@ -0,0 +1,668 @@
+"""
+请求耗时分解
+
+每次节点执行记录一条trace，按阶段统计耗时：
+- queue_wait: 在本地全局调度器中等待槽位
+- encode: 图像张量转换和编码
+- request: 提交/同步接口请求（包括上传请求体和同步接口的处理时间）
+- provider_queue / processing: 异步任务在服务商排队和生成的时间（根据轮询到的状态变化估计）
+- poll_lag: 任务完成到下一次轮询发现之间的延迟（估计值）
+- download / decode: 下载和解码结果
+- other: 未归入以上阶段的时间
+
+阶段按独占时间统计（嵌套阶段的时间不重复计入外层阶段），各阶段之和等于总耗时。
+结果通过 /cc_api/metrics 接口查询，并作为节点的UI输出（cc_timing）返回。
+
+/cc_api/metrics/prometheus 以Prometheus文本格式导出按服务商、接口和节点类统计的请求数、
+耗时直方图、运行中的请求数、轮询次数、上传和下载字节数，以及各缓存的命中统计和调度器
+队列长度。只依赖标准库。
+"""
+import functools
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .latency_tracker import percentile
+
+
+# 派欧云异步任务的状态
+FINAL_STATUSES = ("TASK_STATUS_SUCCEEDED", "TASK_STATUS_SUCCEED", "TASK_STATUS_FAILED")
+QUEUED_STATUSES = ("TASK_STATUS_QUEUED", "TASK_STATUS_PENDING")
+FAILED_STATUS = "TASK_STATUS_FAILED"
+
+# 请求耗时直方图的桶上限（秒），覆盖同步图像接口到长时间的视频生成任务
+LATENCY_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800)
+
+_local = threading.local()
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def current_trace():
+    """当前线程正在记录的trace，没有时返回None"""
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+class Trace:
+    """一次节点执行（或一个独立的接口调用）的耗时记录，只在创建它的线程中写入阶段
+
+    node为发起调用的节点类名，子trace继承父trace的节点，独立的接口调用为空字符串。
+    """
+
+    def __init__(self, name, node=None):
+        self.name = name
+        self.node = name if node is None else node
+        self.calls = []
+        self.phases = {}
+        self.children = []
+        self.error = None
+        self.polls = 0
+        self.last_status = None
+        self.bytes = {"upload": 0, "download": 0}
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._end = None
+        self._phase_stack = []
+        self._observations = []
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        """累加阶段耗时"""
+        if seconds > 0:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """记录阶段耗时，嵌套阶段的时间从外层阶段中扣除"""
+        frame = [0.0]
+        self._phase_stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._phase_stack.pop()
+            self.add(name, elapsed - frame[0])
+            if self._phase_stack:
+                self._phase_stack[-1][0] += elapsed
+
+    def observe_status(self, status):
+        """记录一次轮询查询到的任务状态（可在轮询线程中调用）"""
+        self._observations.append((time.perf_counter(), status))
+        self.polls += 1
+        self.last_status = status
+
+    def add_bytes(self, direction, count):
+        """累加上传（upload）或下载（download）的字节数（可在其他线程中调用）"""
+        with self._lock:
+            self.bytes[direction] = self.bytes.get(direction, 0) + count
+
+    @contextmanager
+    def polling(self):
+        """等待异步任务完成：根据轮询到的状态变化拆分为排队、生成和轮询延迟"""
+        self._observations = []
+        with self.phase("poll"):
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                end = time.perf_counter()
+                split = self._split_polling(start, end, list(self._observations))
+        if split:
+            # 用拆分后的阶段替换整体的poll阶段（扣除嵌套阶段后按比例缩放）
+            poll_time = self.phases.pop("poll", 0.0)
+            split_time = sum(split.values())
+            scale = poll_time / split_time if split_time > poll_time else 1.0
+            for phase, seconds in split.items():
+                self.add(phase, seconds * scale)
+            remaining = poll_time - split_time * scale
+            if remaining > 0.0005:
+                self.add("poll", remaining)
+
+    @staticmethod
+    def _split_polling(start, end, observations):
+        """状态变化时间取相邻两次查询的中点作为估计"""
+        if not observations:
+            return None
+        previous_time = start
+        previous_kind = "provider_queue"
+        boundaries = {}
+        for observed_at, status in observations:
+            if status in FINAL_STATUSES:
+                kind = "done"
+            elif status in QUEUED_STATUSES:
+                kind = "provider_queue"
+            else:
+                kind = "processing"
+            if kind != previous_kind and kind not in boundaries:
+                boundaries[kind] = (previous_time + observed_at) / 2
+                if kind == "done":
+                    break
+            previous_time = observed_at
+            previous_kind = kind
+        processing_start = boundaries.get("processing", boundaries.get("done", end))
+        done = boundaries.get("done", end)
+        split = {
+            "provider_queue": max(0.0, processing_start - start),
+            "processing": max(0.0, done - processing_start),
+            "poll_lag": max(0.0, end - done),
+        }
+        return {phase: seconds for phase, seconds in split.items() if seconds > 0}
+
+    def finish(self):
+        self._end = time.perf_counter()
+
+    @property
+    def total(self):
+        return (self._end or time.perf_counter()) - self._start
+
+    def summary(self):
+        """耗时分解（秒），other为未归入任何阶段的时间"""
+        phases = {phase: round(seconds, 4) for phase, seconds in self.phases.items()}
+        other = self.total - sum(self.phases.values())
+        if other > 0.0005:
+            phases["other"] = round(other, 4)
+        summary = {
+            "name": self.name,
+            "calls": list(self.calls),
+            "started_at": round(self.started_at, 3),
+            "total": round(self.total, 4),
+            "phases": phases,
+        }
+        if self.polls:
+            summary["polls"] = self.polls
+        if any(self.bytes.values()):
+            summary["bytes"] = dict(self.bytes)
+        if self.error:
+            summary["error"] = self.error
+        with self._lock:
+            if self.children:
+                summary["children"] = [child.summary() for child in self.children]
+        return summary
+
+
+def _split_call(label):
+    """"服务商/接口" 拆分为(服务商, 接口)"""
+    provider, _, endpoint = label.partition("/")
+    return provider, endpoint
+
+
+class MetricsRegistry:
+    """保存最近的trace，按接口统计各阶段耗时的分位数，并累计Prometheus导出的计数器
+
+    计数器按(服务商, 接口, 节点类)分组，进程重启后清零。
+    """
+
+    _instance = None
+    max_recent = 100
+    max_samples = 200
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(MetricsRegistry, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=self.max_recent)
+        self._samples = {}
+        self._counters = {}
+        self._in_flight = {}
+
+    def _counter(self, labels):
+        counter = self._counters.get(labels)
+        if counter is None:
+            counter = self._counters[labels] = {
+                "requests": {},
+                "polls": 0,
+                "upload_bytes": 0,
+                "download_bytes": 0,
+                "phases": {},
+                "buckets": [0] * len(LATENCY_BUCKETS),
+                "duration_sum": 0.0,
+                "duration_count": 0,
+            }
+        return counter
+
+    def _count(self, trace):
+        """累计trace的请求数、耗时、轮询次数和传输字节数，计入第一个接口调用"""
+        if not trace.calls:
+            return
+        failed = trace.error is not None or trace.last_status == FAILED_STATUS
+        status = "error" if failed else "ok"
+        for call in trace.calls:
+            requests = self._counter(_split_call(call) + (trace.node,))["requests"]
+            requests[status] = requests.get(status, 0) + 1
+        counter = self._counter(_split_call(trace.calls[0]) + (trace.node,))
+        total = trace.total
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if total <= bound:
+                counter["buckets"][index] += 1
+        counter["duration_sum"] += total
+        counter["duration_count"] += 1
+        counter["polls"] += trace.polls
+        counter["upload_bytes"] += trace.bytes.get("upload", 0)
+        counter["download_bytes"] += trace.bytes.get("download", 0)
+        for phase, seconds in trace.phases.items():
+            counter["phases"][phase] = counter["phases"].get(phase, 0.0) + seconds
+
+    def record(self, trace):
+        """记录已结束的trace；包含子trace时分别统计子trace的接口"""
+        if not trace.calls and not trace.children:
+            # 没有调用服务商接口的节点不统计
+            return
+        summary = trace.summary()
+        with trace._lock:
+            children = list(trace.children)
+        with self._lock:
+            self._recent.append(summary)
+            for item in [summary] + summary.get("children", []):
+                label = item["calls"][0] if item["calls"] else item["name"]
+                phases = self._samples.setdefault(label, {})
+                for phase, seconds in list(item["phases"].items()) + [("total", item["total"])]:
+                    phases.setdefault(phase, deque(maxlen=self.max_samples)).append(seconds)
+            for item in [trace] + children:
+                self._count(item)
+
+    def begin_call(self, labels):
+        """接口调用开始（持有调度槽位期间计为运行中）"""
+        with self._lock:
+            self._in_flight[labels] = self._in_flight.get(labels, 0) + 1
+
+    def end_call(self, labels):
+        with self._lock:
+            self._in_flight[labels] = max(0, self._in_flight.get(labels, 0) - 1)
+
+    def counters(self):
+        """计数器和运行中请求数的副本，供导出使用"""
+        with self._lock:
+            counters = {
+                labels: {
+                    key: dict(value) if isinstance(value, dict) else list(value) if isinstance(value, list) else value
+                    for key, value in counter.items()
+                }
+                for labels, counter in self._counters.items()
+            }
+            return counters, dict(self._in_flight)
+
+    def snapshot(self, recent=20):
+        """按接口统计各阶段耗时（count/mean/p50/p95）及最近的trace"""
+        with self._lock:
+            samples = {label: {phase: sorted(values) for phase, values in phases.items()}
+                       for label, phases in self._samples.items()}
+            traces = list(self._recent)[-recent:]
+        stats = {}
+        for label, phases in samples.items():
+            stats[label] = {
+                phase: {
+                    "count": len(values),
+                    "mean": round(sum(values) / len(values), 4),
+                    "p50": percentile(values, 0.5),
+                    "p95": percentile(values, 0.95),
+                }
+                for phase, values in phases.items()
+            }
+        return {"endpoints": stats, "recent": traces}
+
+    def reset(self):
+        with self._lock:
+            self._recent.clear()
+            self._samples = {}
+            self._counters = {}
+
+
+@contextmanager
+def _activate(trace, parent=None):
+    """在当前线程中记录trace，结束后交给父trace或全局统计"""
+    stack = _stack()
+    stack.append(trace)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.error = str(e)[:200]
+        raise
+    finally:
+        stack.pop()
+        trace.finish()
+        if parent is not None:
+            with parent._lock:
+                parent.children.append(trace)
+        else:
+            MetricsRegistry().record(trace)
+
+
+@contextmanager
+def trace_call(provider, endpoint, parent=None):
+    """记录一次接口调用；当前线程已有trace时并入该trace，否则单独记录"""
+    label = f"{provider}/{endpoint}"
+    registry = MetricsRegistry()
+    trace = current_trace()
+    if trace is not None:
+        trace.calls.append(label)
+        labels = (provider, endpoint, trace.node)
+        registry.begin_call(labels)
+        try:
+            yield trace
+        finally:
+            registry.end_call(labels)
+        return
+    trace = Trace(label, node="")
+    trace.calls.append(label)
+    labels = (provider, endpoint, "")
+    registry.begin_call(labels)
+    try:
+        with _activate(trace, parent):
+            yield trace
+    finally:
+        registry.end_call(labels)
+
+
+@contextmanager
+def phase(name):
+    """在当前trace中记录阶段耗时，没有trace时不记录"""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    with trace.phase(name):
+        yield
+
+
+@contextmanager
+def polling():
+    """在当前trace中记录异步任务的等待时间"""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    with trace.polling():
+        yield
+
+
+def observe_status(status, trace=None):
+    """记录轮询到的任务状态"""
+    trace = trace or current_trace()
+    if trace is not None and status:
+        trace.observe_status(status)
+
+
+def count_bytes(direction, data, trace=None):
+    """记录上传（upload）或下载（download）的字节数，原样返回data
+
+    data可以是bytes、str或带content属性的HTTP响应，无法计算长度时不记录。
+    """
+    trace = trace or current_trace()
+    if trace is None or data is None:
+        return data
+    payload = getattr(data, "content", data)
+    if isinstance(payload, str):
+        size = len(payload.encode("utf-8"))
+    elif isinstance(payload, (bytes, bytearray)):
+        size = len(payload)
+    else:
+        return data
+    trace.add_bytes(direction, size)
+    return data
+
+
+def timed_phase(name, upload=False):
+    """装饰器：把函数的执行时间记录为当前trace的阶段；upload=True时返回值的长度计为上传字节数"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                result = func(*args, **kwargs)
+            if upload:
+                count_bytes("upload", result)
+            return result
+        return wrapper
+    return decorator
+
+
+def traced_polling(func):
+    """装饰节点的poll_task_result方法"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with polling():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def traced_task_query(func):
+    """装饰节点的query_task_result方法，从返回结果中记录任务状态"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        if isinstance(result, dict):
+            observe_status((result.get("task") or {}).get("status"))
+        return result
+    return wrapper
+
+
+def in_child_trace(func, name):
+    """包装在其他线程中执行的函数：记录为当前trace的子trace"""
+    parent = current_trace()
+    if parent is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _activate(Trace(name, node=parent.node), parent):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def traced_node_class(node_class):
+    """创建节点类的子类，执行时记录trace并把耗时分解附加到UI输出
+
+    只有执行过程中调用过服务商接口的节点才附加UI输出。其他代码直接使用原始类时不受影响。
+    """
+    function_name = node_class.FUNCTION
+    original = getattr(node_class, function_name)
+
+    @functools.wraps(original)
+    def run(self, *args, **kwargs):
+        if current_trace() is not None:
+            return original(self, *args, **kwargs)
+        trace = Trace(node_class.__name__)
+        with _activate(trace):
+            result = original(self, *args, **kwargs)
+        if not trace.calls and not trace.children:
+            return result
+        ui = {"cc_timing": [trace.summary()]}
+        if isinstance(result, dict):
+            result = dict(result)
+            result["ui"] = {**result.get("ui", {}), **ui}
+            return result
+        return {"ui": ui, "result": result}
+
+    return type(node_class.__name__, (node_class,), {
+        function_name: run,
+        "__module__": node_class.__module__,
+        "__doc__": node_class.__doc__,
+    })
+
+
+# 导出统计的缓存：(缓存名, 节点类) -> 返回get_cache_info格式字典的函数
+_caches = {}
+
+
+def register_cache(name, info_func, node=""):
+    """登记需要导出命中统计的缓存
+
+    info_func返回包含hits、misses、evictions、total_entries（可选total_bytes）的字典。
+    同名缓存重复登记时替换。
+    """
+    _caches[(name, node)] = info_func
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+class PrometheusWriter:
+    """生成Prometheus文本格式（0.0.4）"""
+
+    def __init__(self, prefix="cc_api_"):
+        self.prefix = prefix
+        self.lines = []
+
+    def metric(self, name, kind, description, samples):
+        """写入一个指标，samples为(后缀, 标签字典, 值)列表；没有样本时不输出"""
+        if not samples:
+            return
+        name = self.prefix + name
+        self.lines.append(f"# HELP {name} {description}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            self.lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def _write_request_metrics(writer):
+    counters, in_flight = MetricsRegistry().counters()
+    labels = {key: dict(zip(("provider", "endpoint", "node"), key)) for key in set(counters) | set(in_flight)}
+    writer.metric("requests_total", "counter", "Provider API calls by result.", [
+        ("", {**labels[key], "status": status}, count)
+        for key, counter in counters.items() for status, count in sorted(counter["requests"].items())
+    ])
+    histogram = []
+    for key, counter in counters.items():
+        if not counter["duration_count"]:
+            continue
+        for bound, count in zip(LATENCY_BUCKETS, counter["buckets"]):
+            histogram.append(("_bucket", {**labels[key], "le": _format_value(float(bound))}, count))
+        histogram.append(("_bucket", {**labels[key], "le": "+Inf"}, counter["duration_count"]))
+        histogram.append(("_sum", labels[key], counter["duration_sum"]))
+        histogram.append(("_count", labels[key], counter["duration_count"]))
+    writer.metric("request_duration_seconds", "histogram",
+                  "End-to-end duration of node executions, labelled by their first provider call.", histogram)
+    writer.metric("phase_seconds_total", "counter", "Time spent in each phase of provider calls.", [
+        ("", {**labels[key], "phase": phase}, seconds)
+        for key, counter in counters.items() for phase, seconds in sorted(counter["phases"].items())
+    ])
+    writer.metric("in_flight_requests", "gauge", "Provider calls currently holding a scheduler slot.", [
+        ("", labels[key], count) for key, count in in_flight.items()
+    ])
+    writer.metric("polls_total", "counter", "Async task status queries.", [
+        ("", labels[key], counter["polls"]) for key, counter in counters.items() if counter["duration_count"]
+    ])
+    for direction, description in (("upload", "Request bytes sent to providers."),
+                                   ("download", "Response and result bytes received from providers.")):
+        writer.metric(f"{direction}_bytes_total", "counter", description, [
+            ("", labels[key], counter[f"{direction}_bytes"])
+            for key, counter in counters.items() if counter["duration_count"]
+        ])
+
+
+def _write_cache_metrics(writer):
+    infos = []
+    for (name, node), info_func in list(_caches.items()):
+        try:
+            infos.append(({"cache": name, "node": node}, info_func()))
+        except Exception as e:
+            print(f"Error reading {name} cache stats: {e}")
+    for field, kind, description in (
+        ("hits", "counter", "Cache hits."),
+        ("misses", "counter", "Cache misses."),
+        ("evictions", "counter", "Cache evictions."),
+        ("total_entries", "gauge", "Entries currently cached."),
+        ("total_bytes", "gauge", "Bytes currently cached."),
+    ):
+        name = "cache_" + (field + "_total" if kind == "counter" else field.replace("total_", ""))
+        writer.metric(name, kind, description, [
+            ("", labels, info[field]) for labels, info in infos if field in info
+        ])
+
+
+def _write_scheduler_metrics(writer):
+    # 只读取已加载的调度器，导出指标时不导入节点依赖
+    scheduler = sys.modules.get(f"{__package__}.scheduler")
+    if scheduler is None:
+        return
+    providers = scheduler.JobScheduler().snapshot().get("providers", {})
+    writer.metric("scheduler_queue_depth", "gauge", "Jobs waiting for a scheduler slot.", [
+        ("", {"provider": provider, "priority": priority}, count)
+        for provider, info in providers.items() for priority, count in info["queued"].items()
+    ])
+    writer.metric("scheduler_running", "gauge", "Jobs holding a scheduler slot.", [
+        ("", {"provider": provider, "endpoint": endpoint}, count)
+        for provider, info in providers.items() for endpoint, count in info["endpoints"].items()
+    ])
+    writer.metric("scheduler_limit", "gauge", "Concurrent job limit per provider.", [
+        ("", {"provider": provider}, info["limit"]) for provider, info in providers.items() if info["limit"] is not None
+    ])
+    for stat, description in (
+        ("submitted", "Jobs that acquired a scheduler slot."),
+        ("completed", "Jobs that released a scheduler slot."),
+        ("rate_limited", "Rate limit responses from providers."),
+        ("wait_seconds", "Time spent waiting for scheduler slots."),
+    ):
+        writer.metric(f"scheduler_{stat}_total", "counter", description, [
+            ("", {"provider": provider}, info["stats"][stat])
+            for provider, info in providers.items() if stat in info["stats"]
+        ])
+
+
+def render_prometheus():
+    """生成全部指标的Prometheus文本"""
+    writer = PrometheusWriter()
+    _write_request_metrics(writer)
+    _write_cache_metrics(writer)
+    _write_scheduler_metrics(writer)
+    return writer.text()
+
+
+async def metrics_snapshot(request):
+    """请求耗时分解查询接口，?recent=N 指定返回的最近trace数量"""
+    from aiohttp import web
+    try:
+        recent = int(request.query.get("recent", 20))
+    except ValueError:
+        recent = 20
+    return web.json_response(MetricsRegistry().snapshot(recent))
+
+
+# Prometheus文本格式（exposition format）0.0.4
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+async def prometheus_metrics(request):
+    """Prometheus抓取接口（读取磁盘缓存状态，在线程池中生成）"""
+    from aiohttp import web
+    from .async_utils import run_blocking
+    text = await run_blocking(render_prometheus)
+    # aiohttp的content_type参数不接受附加参数，直接设置完整的Content-Type以声明文本格式版本
+    return web.Response(body=text.encode("utf-8"), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+
+# API路由，由节点加载器注册
+ROUTES = [
+    ("GET", "/cc_api/metrics", metrics_snapshot),
+    ("GET", "/cc_api/metrics/prometheus", prometheus_metrics),
+]
@@ -1,10 +1,12 @@
 import requests
-import os
 import time
 import io
 import base64
 from typing import Tuple, Dict, Any
-from .cc_utils import ImageUtils
+from .cc_utils import CCConfig, ImageUtils
+from .ppio_utils import parse_prompt_list, parse_seed_list, split_image_batch, expand_batch_jobs, run_batch_video_tasks, detach_task
+from .scheduler import JobScheduler
+from .metrics import count_bytes, phase, timed_phase, traced_polling, traced_task_query
 
 # 尝试导入ComfyUI的视频处理模块
 try:
@@ -33,50 +35,21 @@ class MinimaxHailuoPPIONode:
             "optional": {
                 "image": ("IMAGE",),  # 首帧图片
                 "end_image": ("IMAGE",),  # 结束帧图片
+                "detach": ("BOOLEAN", {"default": False, "tooltip": "提交任务后立即返回task_id，不等待视频生成；用“派欧云收集视频任务”节点获取视频"}),
             }
         }
 
-    RETURN_TYPES = ("VIDEO",) if HAS_COMFY_VIDEO else ("STRING",)
-    RETURN_NAMES = ("video",) if HAS_COMFY_VIDEO else ("video_url",)
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("video", "task_id") if HAS_COMFY_VIDEO else ("video_url", "task_id")
     FUNCTION = "generate_video"
     CATEGORY = "CC-API/Video"
     OUTPUT_NODE = False
 
     def get_api_key(self, provided_key=""):
-        """获取API密钥，优先级：参数 > 环境变量 > 配置文件"""
-        # 首先检查传入的参数
-        if provided_key:
-            return provided_key
-        
-        # 然后检查环境变量
-        env_var_name = "PPIO_API_KEY"
-        if os.environ.get(env_var_name) is not None:
-            return os.environ[env_var_name]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            # 在Windows系统上明确指定使用UTF-8编码读取配置文件
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config.read_file(f)
-            except UnicodeDecodeError:
-                # 如果UTF-8失败，尝试使用系统默认编码
-                config.read(config_path)
-            
-            try:
-                if "ppio" in config and "API_KEY" in config["ppio"]:
-                    return config["ppio"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        """获取API密钥，优先级：参数 > 密钥池 > 环境变量 > 配置文件"""
+        return CCConfig().get_api_key("ppio", provided_key)
 
+    @timed_phase("encode", upload=True)
     def tensor_to_base64(self, image_tensor):
         """将ComfyUI图像张量转换为base64字符串"""
         try:
@@ -148,6 +121,7 @@ class MinimaxHailuoPPIONode:
         except Exception as e:
             raise Exception(f"Error calling Minimax Hailuo-02 API: {str(e)}")
 
+    @traced_task_query
     def query_task_result(self, api_key, task_id):
         """查询任务结果"""
         try:
@@ -175,6 +149,7 @@ class MinimaxHailuoPPIONode:
         except Exception as e:
             raise Exception(f"Error querying task result: {str(e)}")
 
+    @traced_polling
     def poll_task_result(self, api_key, task_id, poll_interval=5, max_attempts=120):
         """轮询任务结果直到完成或失败"""
         for attempt in range(max_attempts):
@@ -240,7 +215,8 @@ class MinimaxHailuoPPIONode:
         seed,
         api_key="",
         image=None,
-        end_image=None
+        end_image=None,
+        detach=False
     ):
         """生成视频"""
         # 获取API密钥
@@ -259,22 +235,27 @@ class MinimaxHailuoPPIONode:
         try:
             # 调用API生成视频
             print("Calling Minimax Hailuo-02 API...")
-            task_id = self.call_minimax_hailuo_api(
-                api_key=api_key,
-                prompt=prompt,
-                image=image,
-                end_image=end_image,
-                duration=duration,
-                resolution=resolution,
-                enable_prompt_expansion=enable_prompt_expansion,
-                seed=seed if seed != -1 else None
-            )
+            # 通过全局调度器限制并发任务数，任务完成后释放槽位
+            with JobScheduler().slot("ppio", "minimax-hailuo-02", api_key) as slot:
+                task_id = slot.call(
+                    self.call_minimax_hailuo_api,
+                    api_key=api_key,
+                    prompt=prompt,
+                    image=image,
+                    end_image=end_image,
+                    duration=duration,
+                    resolution=resolution,
+                    enable_prompt_expansion=enable_prompt_expansion,
+                    seed=seed if seed != -1 else None
+                )
             
-            print(f"Task submitted with ID: {task_id}")
+                print(f"Task submitted with ID: {task_id}")
+                if detach:
+                    return detach_task(api_key, task_id, self.__class__.__name__, "minimax-hailuo-02")
             
-            # 轮询任务结果
-            print("Waiting for video generation to complete...")
-            video_url = self.poll_task_result(api_key, task_id)
+                # 轮询任务结果
+                print("Waiting for video generation to complete...")
+                video_url = self.poll_task_result(api_key, task_id)
             
             print(f"Video generated successfully: {video_url}")
             
@@ -283,28 +264,89 @@ class MinimaxHailuoPPIONode:
                 # 使用同步方式下载视频，避免事件循环冲突
                 try:
                     import urllib.request
-                    video_io = io.BytesIO(urllib.request.urlopen(video_url).read())
-                    video_output = VideoFromFile(video_io)
-                    return (video_output,)
+                    with phase("download"):
+                        video_io = io.BytesIO(count_bytes("download", urllib.request.urlopen(video_url).read()))
+                    with phase("decode"):
+                        video_output = VideoFromFile(video_io)
+                    return (video_output, task_id)
                 except Exception as e:
                     print(f"Error downloading video synchronously: {str(e)}")
                     # 如果同步下载失败，回退到返回URL
-                    return (video_url,)
+                    return (video_url, task_id)
             else:
                 # 否则返回URL字符串
-                return (video_url,)
+                return (video_url, task_id)
             
         except Exception as e:
             print(f"Error generating video: {str(e)}")
             raise ValueError(f"Video generation failed: {str(e)}")
 
 
+class MinimaxHailuoPPIOBatchNode:
+    """Minimax Hailuo-02 批量视频节点 (派欧云)，提供图像时为图生视频，否则为文生视频"""
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "prompts": ("STRING", {"default": "", "multiline": True, "tooltip": "每行一个提示词，每行生成一个视频"}),
+                "duration": ([6, 10], {"default": 6}),
+                "resolution": (["768P", "1080P"], {"default": "1080P"}),
+                "enable_prompt_expansion": ("BOOLEAN", {"default": True, "label_on": "启用", "label_off": "禁用"}),
+                "seeds": ("STRING", {"default": "", "tooltip": "种子列表，用逗号分隔；为空表示随机，只填一个则所有任务共用"}),
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 16, "tooltip": "同时提交的最大任务数"}),
+                "api_key": ("STRING", {"default": ""}),
+            },
+            "optional": {
+                "images": ("IMAGE", {"tooltip": "可选的首帧图像批次，提供时使用图生视频；单张图像会用于所有任务"}),
+            }
+        }
+
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("videos", "task_ids") if HAS_COMFY_VIDEO else ("video_urls", "task_ids")
+    OUTPUT_IS_LIST = (True, True)
+    FUNCTION = "generate_videos"
+    CATEGORY = "CC-API/Video"
+    OUTPUT_NODE = False
+
+    def generate_videos(
+        self,
+        prompts,
+        duration,
+        resolution,
+        enable_prompt_expansion,
+        seeds,
+        max_concurrency,
+        api_key="",
+        images=None
+    ):
+        """批量生成视频"""
+        node = MinimaxHailuoPPIONode()
+        
+        # 获取API密钥
+        api_key = node.get_api_key(api_key)
+        if not api_key:
+            raise ValueError("API key is required")
+        
+        jobs = expand_batch_jobs(parse_prompt_list(prompts), parse_seed_list(seeds), split_image_batch(images))
+        
+        def submit(job):
+            return node.call_minimax_hailuo_api(
+                job["api_key"], job["prompt"], job["image"], None, duration, resolution, enable_prompt_expansion, job["seed"]
+            )
+        
+        videos, task_ids = run_batch_video_tasks(api_key, jobs, submit, max_concurrency, lambda job: "minimax-hailuo-02")
+        return (videos, task_ids)
+
+
 # Node class mappings
 NODE_CLASS_MAPPINGS = {
-    "MinimaxHailuoPPIONode": MinimaxHailuoPPIONode
+    "MinimaxHailuoPPIONode": MinimaxHailuoPPIONode,
+    "MinimaxHailuoPPIOBatchNode": MinimaxHailuoPPIOBatchNode
 }
 
 # Node display name mappings
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "MinimaxHailuoPPIONode": "Minimax Hailuo-02 (派欧云)"
+    "MinimaxHailuoPPIONode": "Minimax Hailuo-02 (派欧云)",
+    "MinimaxHailuoPPIOBatchNode": "Minimax Hailuo-02 批量视频 (派欧云)"
 }
\ No newline at end of file
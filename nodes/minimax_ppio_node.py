@@ -7,7 +7,11 @@ import numpy as np
 import torch
 from scipy.io import wavfile
 from .cc_utils import CCConfig
-from .audio_utils import process_audio_for_minimax
+from .audio_utils import encode_audio_for_minimax, VoiceCloneRegistry, TTSCache, UploadCache
+from .cache_utils import account_fingerprint
+from .scheduler import JobScheduler
+from .voice_catalog import minimax_voice_catalog
+from .metrics import count_bytes, timed_phase
 
 # 尝试导入音频处理库
 try:
@@ -230,6 +234,7 @@ class MiniMaxPPIOTTS:
                 "emotion": (["happy", "sad", "angry", "fearful", "disgusted", "surprised", "neutral"], {"default": "neutral", "tooltip": "选择语音情绪，影响语音的情感表达。"}),
                 "text_normalization": ("BOOLEAN", {"default": True, "tooltip": "是否对文本进行规范化处理，如数字、日期等的转换。"}),
                 "voice_id": ("STRING", {"default": "", "tooltip": "音色ID输入端口。当连接此端口时，将忽略'音色'选择器的选择。"}),
+                "use_cache": ("BOOLEAN", {"default": True, "tooltip": "相同文本和参数时直接使用本地缓存的合成结果，不再重复请求API"}),
             }
         }
     
@@ -240,38 +245,8 @@ class MiniMaxPPIOTTS:
     
     def get_api_key(self, provided_key=""):
         """获取API密钥，优先级：参数 > 环境变量 > 配置文件"""
-        # 首先检查传入的参数
-        if provided_key:
-            return provided_key
-        
-        # 然后检查环境变量
-        env_var_name = "PPIO_API_KEY"
-        if os.environ.get(env_var_name) is not None:
-            return os.environ[env_var_name]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            # 在Windows系统上明确指定使用UTF-8编码读取配置文件
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config.read_file(f)
-            except UnicodeDecodeError:
-                # 如果UTF-8失败，尝试使用系统默认编码
-                config.read(config_path)
-            
-            try:
-                if "ppio" in config and "API_KEY" in config["ppio"]:
-                    return config["ppio"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        # 克隆音色归属于单个账号，不使用密钥池
+        return CCConfig().get_api_key("ppio", provided_key, pooled=False)
     
     def generate_speech(
         self,
@@ -288,7 +263,8 @@ class MiniMaxPPIOTTS:
         api_key="",
         emotion="calm",
         text_normalization=True,
-        voice_id=""
+        voice_id="",
+        use_cache=True
     ):
         """生成语音"""
         
@@ -303,12 +279,26 @@ class MiniMaxPPIOTTS:
         
         # 确定使用的音色ID
         if voice_id and voice_id.strip():
-            # 如果提供了voice_id，使用它
-            selected_voice_id = voice_id.strip()
+            # 如果提供了voice_id，使用它（也可以是已刷新音色列表中的音色名称）
+            selected_voice_id = minimax_voice_catalog().resolve(voice_id.strip())
         else:
             # 否则使用选择的音色名称映射到ID
             selected_voice_id = self.VOICE_NAME_TO_ID.get(voice, "male-qn-jingying")
         
+        # 检查TTS缓存，自定义音色ID属于账号级资源，需要区分账号
+        cache_key = TTSCache.make_key(
+            "minimax_ppio", model, selected_voice_id, text,
+            speed=speed, vol=vol, pitch=pitch, emotion=emotion,
+            text_normalization=text_normalization, format=format,
+            sample_rate=sample_rate, bitrate=bitrate, channel=channel,
+            account=account_fingerprint(api_key) if voice_id and voice_id.strip() else ""
+        )
+        if use_cache:
+            cached_audio = TTSCache.get(cache_key)
+            if cached_audio is not None:
+                print(f"Using cached TTS result: {cache_key[:12]}")
+                return (cached_audio,)
+        
         try:
             # 调用MiniMax TTS API
             audio_data = self._call_tts_api(
@@ -327,6 +317,10 @@ class MiniMaxPPIOTTS:
                 text_normalization
             )
             
+            # 写入TTS缓存
+            if use_cache:
+                TTSCache.put(cache_key, audio_data)
+            
             return (audio_data,)
             
         except Exception as e:
@@ -388,7 +382,8 @@ class MiniMaxPPIOTTS:
             }
             
             # 发送请求
-            response = requests.post(url, headers=headers, json=payload)
+            with JobScheduler().slot("ppio", url.rsplit("/", 1)[-1], api_key) as slot:
+                response = slot.request(requests.post, url, headers=headers, json=payload)
             
             if response.status_code == 200:
                 result = response.json()
@@ -505,6 +500,8 @@ class MiniMaxPPIOVoiceClone:
                 "model": (["speech-2.5-hd-preview", "speech-2.5-turbo-preview", "speech-02-hd", "speech-02-turbo"], {"default": "speech-2.5-hd-preview", "tooltip": "指定合成试听音频使用的语音模型"}),
                 "need_noise_reduction": ("BOOLEAN", {"default": False, "tooltip": "音频复刻参数，表示是否开启降噪"}),
                 "need_volume_normalization": ("BOOLEAN", {"default": False, "tooltip": "音频复刻参数，是否开启音量归一化"}),
+                "upload_format": (["wav", "mp3"], {"default": "wav", "tooltip": "上传音频的编码格式，默认wav无损上传；mp3为320kbps高码率编码，体积更小、上传更快，缺少编码器时自动回退为wav"}),
+                "force_refresh": ("BOOLEAN", {"default": False, "tooltip": "相同音频和参数已克隆过时默认直接返回已登记的音色，开启后强制重新克隆"}),
                 "api_key": ("STRING", {"default": "", "tooltip": "派欧云API的访问密钥。如果未提供，将使用配置文件中的密钥。"}),
             }
         }
@@ -516,38 +513,8 @@ class MiniMaxPPIOVoiceClone:
     
     def get_api_key(self, provided_key=""):
         """获取API密钥，优先级：参数 > 环境变量 > 配置文件"""
-        # 首先检查传入的参数
-        if provided_key:
-            return provided_key
-        
-        # 然后检查环境变量
-        env_var_name = "PPIO_API_KEY"
-        if os.environ.get(env_var_name) is not None:
-            return os.environ[env_var_name]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            # 在Windows系统上明确指定使用UTF-8编码读取配置文件
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config.read_file(f)
-            except UnicodeDecodeError:
-                # 如果UTF-8失败，尝试使用系统默认编码
-                config.read(config_path)
-            
-            try:
-                if "ppio" in config and "API_KEY" in config["ppio"]:
-                    return config["ppio"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        # 克隆音色归属于单个账号，不使用密钥池
+        return CCConfig().get_api_key("ppio", provided_key, pooled=False)
     
     def clone_voice(
         self,
@@ -559,7 +526,9 @@ class MiniMaxPPIOVoiceClone:
         model="speech-2.5-hd-preview",
         api_key="",
         need_noise_reduction=False,
-        need_volume_normalization=False
+        need_volume_normalization=False,
+        upload_format="wav",
+        force_refresh=False
     ):
         """执行音色克隆"""
         
@@ -569,31 +538,65 @@ class MiniMaxPPIOVoiceClone:
             raise ValueError("Error: No PPIO API key provided")
         
         try:
-            # 1. 上传待克隆音频文件
-            clone_audio_url = self._upload_audio_file(clone_audio, api_key, "voice_clone")
+            # 相同样本和参数已克隆过时直接返回登记的音色，不再重复提交克隆任务
+            registry_key = VoiceCloneRegistry.make_key(
+                "minimax_ppio",
+                api_key,
+                clone_audio,
+                prompt_audio,
+                voice_id=voice_id,
+                prompt_text=prompt_text,
+                test_text=test_text,
+                model=model,
+                need_noise_reduction=need_noise_reduction,
+                need_volume_normalization=need_volume_normalization
+            )
+            if not force_refresh:
+                registered = VoiceCloneRegistry.get(registry_key)
+                if registered is not None:
+                    registered_voice_id, registered_demo = registered
+                    print(f"Using registered cloned voice: {registered_voice_id}")
+                    if registered_demo is None:
+                        registered_demo = self._create_blank_audio()
+                    return (registered_demo, registered_voice_id)
+            
+            # 1. 上传待克隆音频文件（相同音频在有效期内复用已上传的文件）
+            clone_audio_url, clone_reused = self._upload_audio_file(clone_audio, api_key, "voice_clone", upload_format=upload_format)
             if not clone_audio_url:
                 raise ValueError("Error: Failed to upload clone audio file")
             
             # 2. 如果提供了示例音频，上传示例音频文件
-            prompt_audio_url = None
+            prompt_audio_url, prompt_reused = None, False
             if prompt_audio is not None:
-                prompt_audio_url = self._upload_audio_file(prompt_audio, api_key, "prompt_audio")
+                prompt_audio_url, prompt_reused = self._upload_audio_file(prompt_audio, api_key, "prompt_audio", upload_format=upload_format)
                 if not prompt_audio_url:
                     # print("Warning: Failed to upload prompt audio file, continuing without it")
                     pass
             
             # 3. 调用音色克隆接口
-            cloned_voice_id, demo_audio_url = self._call_voice_clone_api(
-                clone_audio_url,
-                voice_id,
-                prompt_audio_url,
-                prompt_text,
-                test_text,
-                model,
-                api_key,
-                need_noise_reduction,
-                need_volume_normalization
+            clone_options = dict(
+                prompt_text=prompt_text,
+                test_text=test_text,
+                model=model,
+                api_key=api_key,
+                need_noise_reduction=need_noise_reduction,
+                need_volume_normalization=need_volume_normalization
             )
+            try:
+                cloned_voice_id, demo_audio_url = self._call_voice_clone_api(
+                    clone_audio_url, voice_id, prompt_audio_url, **clone_options
+                )
+            except ValueError as e:
+                if not (clone_reused or prompt_reused):
+                    raise
+                # 复用的文件URL可能已在服务端失效，重新上传后重试一次
+                print(f"Voice clone failed with reused upload, re-uploading: {e}")
+                clone_audio_url, _ = self._upload_audio_file(clone_audio, api_key, "voice_clone", use_cache=False, upload_format=upload_format)
+                if prompt_audio is not None:
+                    prompt_audio_url, _ = self._upload_audio_file(prompt_audio, api_key, "prompt_audio", use_cache=False, upload_format=upload_format)
+                cloned_voice_id, demo_audio_url = self._call_voice_clone_api(
+                    clone_audio_url, voice_id, prompt_audio_url, **clone_options
+                )
             
             if not cloned_voice_id:
                 raise ValueError("Error: Failed to clone voice")
@@ -603,18 +606,37 @@ class MiniMaxPPIOVoiceClone:
             if demo_audio_url:
                 demo_audio = self._download_audio(demo_audio_url)
             
+            # 5. 登记克隆结果，供后续相同输入直接复用
+            VoiceCloneRegistry.put(registry_key, cloned_voice_id, demo_audio if demo_audio_url else None)
+            
             # 返回试听音频和克隆的音色ID
             return (demo_audio, cloned_voice_id)
             
         except Exception as e:
             raise ValueError(f"Error cloning voice: {str(e)}")
     
-    def _upload_audio_file(self, audio_data, api_key, purpose):
-        """上传音频文件到派欧云"""
-        temp_filename = None
+    def _upload_audio_file(self, audio_data, api_key, purpose, use_cache=True, upload_format="wav"):
+        """上传音频文件到派欧云，返回(file_url, 是否复用已上传文件)"""
+        # 相同账号、相同音频内容和用途的文件在有效期内直接复用，跳过音频处理和上传
+        cache_key = UploadCache.make_key("minimax_ppio", api_key, audio_data, purpose, upload_format)
+        if use_cache:
+            cached_ref = UploadCache.get(cache_key)
+            if cached_ref:
+                print(f"Reusing uploaded {purpose} audio: {cache_key[:12]}")
+                return cached_ref, True
+        else:
+            UploadCache.invalidate(cache_key)
+
         try:
-            # 使用新的音频处理工具处理音频
-            temp_filename, file_size = process_audio_for_minimax(audio_data)
+            # 在内存中处理并编码音频，不再写入临时WAV文件
+            audio_bytes, filename, mime_type, encoding = encode_audio_for_minimax(audio_data, upload_format)
+            if encoding != upload_format:
+                # 编码回退后按实际格式记录缓存，避免回退的WAV文件被记在MP3的缓存键下
+                cache_key = UploadCache.make_key("minimax_ppio", api_key, audio_data, purpose, encoding)
+                cached_ref = UploadCache.get(cache_key) if use_cache else None
+                if cached_ref:
+                    print(f"Reusing uploaded {purpose} audio: {cache_key[:12]}")
+                    return cached_ref, True
             
             # 上传文件
             url = "https://api.ppinfra.com/v3/files/upload"
@@ -625,19 +647,17 @@ class MiniMaxPPIOVoiceClone:
                 "purpose": purpose
             }
             
-            # 使用上下文管理器确保文件正确关闭
-            with open(temp_filename, "rb") as f:
-                files = {"file": f}
-                response = requests.post(url, headers=headers, data=data, files=files)
-            
-            # 删除临时文件
-            os.unlink(temp_filename)
+            files = {"file": (filename, audio_bytes, mime_type)}
+            with JobScheduler().slot("ppio", "files/upload", api_key) as slot:
+                response = slot.request(requests.post, url, headers=headers, data=data, files=files)
             
             if response.status_code == 200:
                 result = response.json()
                 if result.get("base_resp", {}).get("status_code", -1) == 0:
                     file_url = result.get("file", {}).get("url")
-                    return file_url
+                    if file_url:
+                        UploadCache.put(cache_key, "minimax_ppio", file_url)
+                    return file_url, False
                 else:
                     status_msg = result.get("base_resp", {}).get("status_msg", "Unknown error")
                     raise ValueError(f"File upload failed: {status_msg}")
@@ -645,9 +665,6 @@ class MiniMaxPPIOVoiceClone:
                 raise ValueError(f"File upload failed with status {response.status_code}: {response.text}")
                 
         except Exception as e:
-            # 确保即使出错也删除临时文件
-            if temp_filename and os.path.exists(temp_filename):
-                os.unlink(temp_filename)
             raise ValueError(f"Error uploading audio file: {str(e)}")
     
     def _call_voice_clone_api(
@@ -690,7 +707,8 @@ class MiniMaxPPIOVoiceClone:
                 payload["text"] = test_text
                 payload["model"] = model
             
-            response = requests.post(url, headers=headers, json=payload)
+            with JobScheduler().slot("ppio", url.rsplit("/", 1)[-1], api_key) as slot:
+                response = slot.request(requests.post, url, headers=headers, json=payload)
             
             if response.status_code == 200:
                 result = response.json()
@@ -703,11 +721,12 @@ class MiniMaxPPIOVoiceClone:
         except Exception as e:
             raise ValueError(f"Error calling voice clone API: {str(e)}")
     
+    @timed_phase("download")
     def _download_audio(self, audio_url):
         """下载音频文件并返回AUDIO类型数据"""
         try:
             # 下载音频文件
-            response = requests.get(audio_url)
+            response = count_bytes("download", requests.get(audio_url))
             if response.status_code != 200:
                 raise ValueError(f"Failed to download audio file: {response.status_code}")
             
@@ -1,14 +1,18 @@
 import os
-import json
 import base64
 import tempfile
 import requests
 import numpy as np
 import torch
 from scipy.io import wavfile
-import server
 from aiohttp import web
 from .cc_utils import CCConfig
+from .audio_utils import TTSCache
+from .cache_utils import account_fingerprint
+from .async_utils import AsyncCoalescer
+from .scheduler import JobScheduler
+from .voice_catalog import MINIMAX_VOICES_FILE, minimax_voice_catalog
+from .voice_refresher import fetch_minimax_voices, save_minimax_voices
 
 class MiniMaxTTS:
     """MiniMax TTS节点"""
@@ -399,6 +403,7 @@ class MiniMaxTTS:
                 "bitrate": (cls.BITRATE_LIST, {"default": 128000}),
                 "channel": (cls.CHANNEL_LIST, {"default": 1}),
                 "api_key": ("STRING", {"default": ""}),
+                "use_cache": ("BOOLEAN", {"default": True, "tooltip": "相同文本和参数时直接使用本地缓存的合成结果，不再重复请求API"}),
             }
         }
     
@@ -421,7 +426,8 @@ class MiniMaxTTS:
         sample_rate=24000,
         bitrate=128000,
         channel=1,
-        api_key=""
+        api_key="",
+        use_cache=True
     ):
         """生成语音"""
         
@@ -440,8 +446,8 @@ class MiniMaxTTS:
         
         # 如果提供了voice_id，则使用它；否则使用voice参数转换的音色ID
         if voice_id:
-            # 使用直接提供的音色ID
-            selected_voice_id = voice_id
+            # 使用直接提供的音色ID（也可以是已刷新音色列表中的音色名称）
+            selected_voice_id = minimax_voice_catalog().resolve(voice_id)
         else:
             # 将中文显示名称转换为API所需的音色ID
             selected_voice_id = self.VOICE_NAME_TO_ID.get(voice, voice)
@@ -470,6 +476,20 @@ class MiniMaxTTS:
         if format == "mp3":
             request_data["audio_setting"]["bitrate"] = bitrate
         
+        # 检查TTS缓存，自定义音色ID属于账号级资源，需要区分账号
+        cache_key = TTSCache.make_key(
+            "minimax", model, selected_voice_id, text,
+            speed=speed, vol=vol, pitch=pitch, emotion=emotion,
+            text_normalization=text_normalization, format=format,
+            sample_rate=sample_rate, bitrate=bitrate if format == "mp3" else None,
+            channel=channel, account=account_fingerprint(api_key) if voice_id else ""
+        )
+        if use_cache:
+            cached_audio = TTSCache.get(cache_key)
+            if cached_audio is not None:
+                print(f"Using cached TTS result: {cache_key[:12]}")
+                return (cached_audio,)
+        
         try:
             # 发送请求
             headers = {
@@ -477,11 +497,13 @@ class MiniMaxTTS:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
-                "https://api.minimaxi.com/v1/t2a_v2",
-                headers=headers,
-                json=request_data
-            )
+            with JobScheduler().slot("minimax", "t2a_v2", api_key) as slot:
+                response = slot.request(
+                    requests.post,
+                    "https://api.minimaxi.com/v1/t2a_v2",
+                    headers=headers,
+                    json=request_data
+                )
             
             if response.status_code == 200:
                 result = response.json()
@@ -538,11 +560,17 @@ class MiniMaxTTS:
                     # 删除临时文件
                     os.unlink(temp_file_path)
                     
-                    # 返回ComfyUI期望的音频格式
-                    return ({
+                    audio_data = {
                         "waveform": waveform_tensor,
                         "sample_rate": audio_sample_rate
-                    },)
+                    }
+                    
+                    # 写入TTS缓存
+                    if use_cache:
+                        TTSCache.put(cache_key, audio_data)
+                    
+                    # 返回ComfyUI期望的音频格式
+                    return (audio_data,)
                 else:
                     print("Error: No audio data in response")
                     return self._create_blank_audio(sample_rate)
@@ -578,45 +606,13 @@ class MiniMaxVoiceSelector:
     """MiniMax音色选择器节点"""
     
     # 音色数据文件路径
-    VOICE_DATA_FILE = os.path.join(os.path.dirname(__file__), "minimax_voices.json")
-    
-    # 类变量存储音色数据
-    voice_mapping = {}
-    voice_names = []
-    
-    @classmethod
-    def _load_voice_data(cls):
-        """从本地JSON文件加载音色数据"""
-        try:
-            if os.path.exists(cls.VOICE_DATA_FILE):
-                with open(cls.VOICE_DATA_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    cls.voice_mapping = data.get('voice_mapping', {})
-                    cls.voice_names = list(cls.voice_mapping.keys()) if cls.voice_mapping else []
-            else:
-                # 如果文件不存在，初始化为空数据
-                cls.voice_mapping = {}
-                cls.voice_names = []
-        except Exception as e:
-            print(f"Error loading voice data: {e}")
-            cls.voice_mapping = {}
-            cls.voice_names = []
+    VOICE_DATA_FILE = MINIMAX_VOICES_FILE
     
     @classmethod
     def _save_voice_data(cls, voice_data):
-        """保存音色数据到本地JSON文件"""
+        """原子写入音色数据到本地JSON文件，并刷新共享的音色目录"""
         try:
-            # 重新组织数据结构以便保存
-            data = {
-                'voice_mapping': voice_data,
-                'updated_at': np.datetime_as_string(np.datetime64('now'))
-            }
-            
-            with open(cls.VOICE_DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-                
-            # 重新加载数据
-            cls._load_voice_data()
+            save_minimax_voices(voice_data)
         except Exception as e:
             print(f"Error saving voice data: {e}")
     
@@ -630,79 +626,21 @@ class MiniMaxVoiceSelector:
                 print("Error: No MiniMax API key provided")
                 return {}
         
-        try:
-            # 准备请求数据
-            request_data = {
-                "voice_type": voice_type
-            }
-            
-            # 发送请求
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(
-                "https://api.minimaxi.com/v1/get_voice",
-                headers=headers,
-                json=request_data
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                # 检查响应状态
-                if result.get("base_resp", {}).get("status_code", -1) == 0:
-                    # 解析音色数据
-                    voice_mapping = {}
-                    
-                    # 处理系统音色
-                    system_voices = result.get("system_voice", [])
-                    for voice in system_voices:
-                        voice_name = voice.get("voice_name", "")
-                        voice_id = voice.get("voice_id", "")
-                        if voice_name and voice_id:
-                            voice_mapping[voice_name] = voice_id
-                    
-                    # 处理快速复刻音色
-                    cloning_voices = result.get("voice_cloning", [])
-                    for voice in cloning_voices:
-                        voice_id = voice.get("voice_id", "")
-                        # 使用voice_id作为名称，因为可能没有voice_name
-                        if voice_id:
-                            voice_mapping[f"快速复刻 - {voice_id}"] = voice_id
-                    
-                    # 处理文生音色
-                    generation_voices = result.get("voice_generation", [])
-                    for voice in generation_voices:
-                        voice_id = voice.get("voice_id", "")
-                        # 使用voice_id作为名称，因为可能没有voice_name
-                        if voice_id:
-                            voice_mapping[f"文生音色 - {voice_id}"] = voice_id
-                    
-                    # 保存数据到本地
-                    cls._save_voice_data(voice_mapping)
-                    return voice_mapping
-                else:
-                    status_msg = result.get("base_resp", {}).get("status_msg", "Unknown error")
-                    print(f"API request failed: {status_msg}")
-                    return {}
-            else:
-                print(f"API request failed with status {response.status_code}: {response.text}")
-                return {}
-        except Exception as e:
-            print(f"Error fetching voice data: {str(e)}")
-            return {}
+        voice_mapping = fetch_minimax_voices(api_key, voice_type)
+        if voice_mapping:
+            # 保存数据到本地
+            cls._save_voice_data(voice_mapping)
+        return voice_mapping
     
     @classmethod
     def INPUT_TYPES(cls):
         """定义节点输入类型"""
-        # 加载音色数据
-        cls._load_voice_data()
+        # 从共享的音色目录获取音色列表
+        voice_names = minimax_voice_catalog().names
         
         return {
             "required": {
-                "voice_name": (cls.voice_names if cls.voice_names else ["无可用音色"], {"default": cls.voice_names[0] if cls.voice_names else "无可用音色"}),
+                "voice_name": (voice_names if voice_names else ["无可用音色"], {"default": voice_names[0] if voice_names else "无可用音色"}),
             },
             "optional": {
                 "voice_type": (["all", "system", "voice_cloning", "voice_generation"], {"default": "all"}),
@@ -723,7 +661,7 @@ class MiniMaxVoiceSelector:
     def select_voice(self, voice_name, api_key="", voice_type="all", prompt=None, extra_pnginfo=None, unique_id=None):
         """选择音色并返回音色ID"""
         # 获取选中音色的ID
-        voice_id = MiniMaxVoiceSelector.voice_mapping.get(voice_name, "")
+        voice_id = minimax_voice_catalog().voice_ids.get(voice_name, "")
         
         if not voice_id:
             print(f"Warning: Voice ID not found for '{voice_name}'")
@@ -734,8 +672,11 @@ class MiniMaxVoiceSelector:
         return (voice_id,)
 
 
+# 合并同时发起的刷新请求，相同密钥和音色类型只请求一次上游接口
+_voice_refresh_coalescer = AsyncCoalescer()
+
+
 # 添加API端点用于刷新音色列表
-@server.PromptServer.instance.routes.post("/minimax_refresh_voices")
 async def refresh_minimax_voices(request):
     """处理刷新MiniMax音色列表的请求"""
     try:
@@ -751,8 +692,13 @@ async def refresh_minimax_voices(request):
                 "error": "API密钥不能为空"
             })
         
-        # 调用MiniMaxVoiceSelector类方法获取音色数据
-        voice_mapping = MiniMaxVoiceSelector._fetch_voice_data(api_key, voice_type)
+        # 在线程池中获取音色数据，避免阻塞事件循环
+        voice_mapping = await _voice_refresh_coalescer.run(
+            (account_fingerprint(api_key), voice_type),
+            MiniMaxVoiceSelector._fetch_voice_data,
+            api_key,
+            voice_type
+        )
         
         if not voice_mapping:
             # 返回错误响应
@@ -778,6 +724,12 @@ async def refresh_minimax_voices(request):
         })
 
 
+# API路由，由节点加载器注册
+ROUTES = [
+    ("POST", "/minimax_refresh_voices", refresh_minimax_voices),
+]
+
+
 # 注册节点
 NODE_CLASS_MAPPINGS = {
     "MiniMaxTTS": MiniMaxTTS,
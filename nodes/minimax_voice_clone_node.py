@@ -6,7 +6,9 @@ import torch
 import numpy as np
 from scipy.io import wavfile
 from .cc_utils import CCConfig
-from .audio_utils import process_audio_for_minimax
+from .audio_utils import encode_audio_for_minimax, VoiceCloneRegistry, UploadCache
+from .scheduler import JobScheduler
+from .metrics import count_bytes, timed_phase
 
 # 尝试导入音频处理库
 try:
@@ -39,6 +41,8 @@ class MiniMaxVoiceClone:
                 "model": (["speech-2.5-hd-preview", "speech-2.5-turbo-preview", "speech-02-hd", "speech-02-turbo", "speech-01-hd", "speech-01-turbo"], {"default": "speech-2.5-hd-preview", "tooltip": "指定合成试听音频使用的语音模型"}),
                 "need_noise_reduction": ("BOOLEAN", {"default": False, "tooltip": "音频复刻参数，表示是否开启降噪"}),
                 "need_volume_normalization": ("BOOLEAN", {"default": False, "tooltip": "音频复刻参数，是否开启音量归一化"}),
+                "upload_format": (["wav", "mp3"], {"default": "wav", "tooltip": "上传音频的编码格式，默认wav无损上传；mp3为320kbps高码率编码，体积更小、上传更快，缺少编码器时自动回退为wav"}),
+                "force_refresh": ("BOOLEAN", {"default": False, "tooltip": "相同音频和参数已克隆过时默认直接返回已登记的音色，开启后强制重新克隆"}),
                 "api_key": ("STRING", {"default": "", "tooltip": "MiniMax API的访问密钥。如果未提供，将使用配置文件中的密钥。"}),
             }
         }
@@ -58,7 +62,9 @@ class MiniMaxVoiceClone:
         model="speech-2.5-hd-preview",
         api_key="",
         need_noise_reduction=False,
-        need_volume_normalization=False
+        need_volume_normalization=False,
+        upload_format="wav",
+        force_refresh=False
     ):
         """执行音色克隆"""
         
@@ -71,32 +77,66 @@ class MiniMaxVoiceClone:
                 return (self._create_blank_audio(), "")
         
         try:
-            # 1. 上传待克隆音频文件
-            clone_file_id = self._upload_audio_file(clone_audio, api_key, "voice_clone")
+            # 相同样本和参数已克隆过时直接返回登记的音色，不再重复提交克隆任务
+            registry_key = VoiceCloneRegistry.make_key(
+                "minimax",
+                api_key,
+                clone_audio,
+                prompt_audio,
+                voice_id=voice_id,
+                prompt_text=prompt_text,
+                test_text=test_text,
+                model=model,
+                need_noise_reduction=need_noise_reduction,
+                need_volume_normalization=need_volume_normalization
+            )
+            if not force_refresh:
+                registered = VoiceCloneRegistry.get(registry_key)
+                if registered is not None:
+                    registered_voice_id, registered_demo = registered
+                    print(f"Using registered cloned voice: {registered_voice_id}")
+                    if registered_demo is None:
+                        registered_demo = self._create_blank_audio()
+                    return (registered_demo, registered_voice_id)
+            
+            # 1. 上传待克隆音频文件（相同音频在有效期内复用已上传的文件）
+            clone_file_id, clone_reused = self._upload_audio_file(clone_audio, api_key, "voice_clone", upload_format=upload_format)
             if not clone_file_id:
                 raise ValueError("Error: Failed to upload clone audio file")
                 return (self._create_blank_audio(), "")
             
             # 2. 如果提供了示例音频，上传示例音频文件
-            prompt_file_id = None
+            prompt_file_id, prompt_reused = None, False
             if prompt_audio is not None:
-                prompt_file_id = self._upload_audio_file(prompt_audio, api_key, "prompt_audio")
+                prompt_file_id, prompt_reused = self._upload_audio_file(prompt_audio, api_key, "prompt_audio", upload_format=upload_format)
                 if not prompt_file_id:
                     # print("Warning: Failed to upload prompt audio file, continuing without it")
                     pass
             
             # 3. 调用音色克隆接口
-            cloned_voice_id, demo_audio_url = self._call_voice_clone_api(
-                clone_file_id,
-                voice_id,
-                prompt_file_id,
-                prompt_text,
-                test_text,
-                model,
-                api_key,
-                need_noise_reduction,
-                need_volume_normalization
+            clone_options = dict(
+                prompt_text=prompt_text,
+                test_text=test_text,
+                model=model,
+                api_key=api_key,
+                need_noise_reduction=need_noise_reduction,
+                need_volume_normalization=need_volume_normalization
             )
+            try:
+                cloned_voice_id, demo_audio_url = self._call_voice_clone_api(
+                    clone_file_id, voice_id, prompt_file_id, **clone_options
+                )
+            except ValueError as e:
+                if not (clone_reused or prompt_reused):
+                    raise
+                # 复用的文件可能已在服务端失效，重新上传后重试一次
+                print(f"Voice clone failed with reused upload, re-uploading: {e}")
+                clone_file_id, _ = self._upload_audio_file(clone_audio, api_key, "voice_clone", use_cache=False, upload_format=upload_format)
+                if prompt_audio is not None:
+                    prompt_file_id, _ = self._upload_audio_file(prompt_audio, api_key, "prompt_audio", use_cache=False, upload_format=upload_format)
+                cloned_voice_id, demo_audio_url = self._call_voice_clone_api(
+                    clone_file_id, voice_id, prompt_file_id, **clone_options
+                )
             
             if not cloned_voice_id:
                 raise ValueError("Error: Failed to clone voice")
@@ -106,18 +146,37 @@ class MiniMaxVoiceClone:
             if demo_audio_url:
                 demo_audio = self._download_audio(demo_audio_url)
             
+            # 5. 登记克隆结果，供后续相同输入直接复用
+            VoiceCloneRegistry.put(registry_key, cloned_voice_id, demo_audio if demo_audio_url else None)
+            
             # 返回试听音频和克隆的音色ID
             return (demo_audio, cloned_voice_id)
             
         except Exception as e:
             raise ValueError(f"Error cloning voice: {str(e)}")
     
-    def _upload_audio_file(self, audio_data, api_key, purpose):
-        """上传音频文件到MiniMax"""
-        temp_filename = None
+    def _upload_audio_file(self, audio_data, api_key, purpose, use_cache=True, upload_format="wav"):
+        """上传音频文件到MiniMax，返回(file_id, 是否复用已上传文件)"""
+        # 相同账号、相同音频内容和用途的文件在有效期内直接复用，跳过音频处理和上传
+        cache_key = UploadCache.make_key("minimax", api_key, audio_data, purpose, upload_format)
+        if use_cache:
+            cached_ref = UploadCache.get(cache_key)
+            if cached_ref:
+                print(f"Reusing uploaded {purpose} audio: {cache_key[:12]}")
+                return cached_ref, True
+        else:
+            UploadCache.invalidate(cache_key)
+
         try:
-            # 使用新的音频处理工具处理音频
-            temp_filename, file_size = process_audio_for_minimax(audio_data)
+            # 在内存中处理并编码音频，不再写入临时WAV文件
+            audio_bytes, filename, mime_type, encoding = encode_audio_for_minimax(audio_data, upload_format)
+            if encoding != upload_format:
+                # 编码回退后按实际格式记录缓存，避免回退的WAV文件被记在MP3的缓存键下
+                cache_key = UploadCache.make_key("minimax", api_key, audio_data, purpose, encoding)
+                cached_ref = UploadCache.get(cache_key) if use_cache else None
+                if cached_ref:
+                    print(f"Reusing uploaded {purpose} audio: {cache_key[:12]}")
+                    return cached_ref, True
             
             # 上传文件
             url = "https://api.minimaxi.com/v1/files/upload"
@@ -128,19 +187,17 @@ class MiniMaxVoiceClone:
                 "purpose": purpose
             }
             
-            # 使用上下文管理器确保文件正确关闭
-            with open(temp_filename, "rb") as f:
-                files = {"file": f}
-                response = requests.post(url, headers=headers, data=data, files=files)
-            
-            # 删除临时文件
-            os.unlink(temp_filename)
+            files = {"file": (filename, audio_bytes, mime_type)}
+            with JobScheduler().slot("minimax", "files/upload", api_key) as slot:
+                response = slot.request(requests.post, url, headers=headers, data=data, files=files)
             
             if response.status_code == 200:
                 result = response.json()
                 if result.get("base_resp", {}).get("status_code", -1) == 0:
                     file_id = result.get("file", {}).get("file_id")
-                    return file_id
+                    if file_id:
+                        UploadCache.put(cache_key, "minimax", file_id)
+                    return file_id, False
                 else:
                     status_msg = result.get("base_resp", {}).get("status_msg", "Unknown error")
                     raise ValueError(f"File upload failed: {status_msg}")
@@ -148,9 +205,6 @@ class MiniMaxVoiceClone:
                 raise ValueError(f"File upload failed with status {response.status_code}: {response.text}")
                 
         except Exception as e:
-            # 确保即使出错也删除临时文件
-            if temp_filename and os.path.exists(temp_filename):
-                os.unlink(temp_filename)
             raise ValueError(f"Error uploading audio file: {str(e)}")
     
     def _call_voice_clone_api(
@@ -197,7 +251,8 @@ class MiniMaxVoiceClone:
             # 打印调试信息
             print(f"Voice clone API request payload: {json.dumps(payload, indent=2, ensure_ascii=False)}")
             
-            response = requests.post(url, headers=headers, json=payload)
+            with JobScheduler().slot("minimax", "voice_clone", api_key) as slot:
+                response = slot.request(requests.post, url, headers=headers, json=payload)
             
             print(f"Voice clone API response status: {response.status_code}")
             print(f"Voice clone API response content: {response.text}")
@@ -219,10 +274,11 @@ class MiniMaxVoiceClone:
         except Exception as e:
             raise ValueError(f"Error calling voice clone API: {str(e)}")
     
+    @timed_phase("download")
     def _download_audio(self, audio_url):
         """下载音频文件并转换为ComfyUI格式"""
         try:
-            response = requests.get(audio_url)
+            response = count_bytes("download", requests.get(audio_url))
             if response.status_code == 200:
                 # 保存为临时文件
                 with tempfile.NamedTemporaryFile(suffix=".tmp", delete=False) as temp_file:
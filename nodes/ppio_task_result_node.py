@@ -1,7 +1,16 @@
 import requests
-import os
+import re
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple, Dict, Any
+from requests.adapters import HTTPAdapter
+from .cc_utils import CCConfig
+from .key_pool import KeyPool
+from .metrics import in_child_trace
+from .ppio_utils import (
+    PPIO_TASK_RESULT_URL, PPIOTaskPoller, TaskJournal, TaskResultCache, HAS_COMFY_VIDEO, blocked_output, download_video
+)
 
 class PPIOQueryTaskResultNode:
     """派欧云查询任务结果节点"""
@@ -12,6 +21,9 @@ class PPIOQueryTaskResultNode:
             "required": {
                 "task_id": ("STRING", {"default": "", "multiline": False}),
                 "api_key": ("STRING", {"default": ""}),
+            },
+            "optional": {
+                "use_cache": ("BOOLEAN", {"default": True, "tooltip": "已结束（成功或失败）的任务直接使用本地缓存的结果，只有未结束的任务会重新查询"}),
             }
         }
 
@@ -21,34 +33,25 @@ class PPIOQueryTaskResultNode:
     CATEGORY = "CC-API/Tools"
     OUTPUT_NODE = False
 
+    # 复用的查询会话（连接池），密钥在每次请求时单独传入
+    _session = None
+    _session_lock = threading.Lock()
+
+    @classmethod
+    def _get_session(cls):
+        with cls._session_lock:
+            if cls._session is None:
+                # 连接池大小使用[transport]设置，批量查询时并发复用连接
+                transport = CCConfig().get_transport_settings()
+                adapter = HTTPAdapter(pool_connections=transport["pool_connections"], pool_maxsize=transport["pool_maxsize"])
+                cls._session = requests.Session()
+                cls._session.mount("https://", adapter)
+            return cls._session
+
     def get_api_key(self, provided_key=""):
-        """获取API密钥，优先级：参数 > 环境变量 > 配置文件"""
-        # 首先检查传入的参数
-        if provided_key:
-            return provided_key
-        
-        # 然后检查环境变量
-        env_var_name = "PPIO_API_KEY"
-        if os.environ.get(env_var_name) is not None:
-            return os.environ[env_var_name]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            config.read(config_path)
-            
-            try:
-                if "ppio" in config and "API_KEY" in config["ppio"]:
-                    return config["ppio"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        """获取API密钥，优先级：参数 > 环境变量 > 配置文件 > 密钥池中的第一个密钥"""
+        # 任务只能用提交时的账号查询，不按负载从密钥池中选择；分离模式登记过的任务由TaskJournal找回提交时的密钥
+        return CCConfig().get_api_key("ppio", provided_key, pooled=False) or KeyPool.first_key("ppio")
 
     def extract_video_url(self, response_dict: Dict[str, Any]) -> str:
         """从响应字典中提取视频链接"""
@@ -64,7 +67,44 @@ class PPIOQueryTaskResultNode:
             print(f"Error extracting video URL: {str(e)}")
             return ""
 
-    def query_task_result(self, task_id: str, api_key: str = "") -> Tuple[str, str]:
+    def fetch_task_result(self, api_key: str, task_id: str, use_cache: bool = True) -> Tuple[str, Dict[str, Any]]:
+        """查询单个任务，返回(原始响应字符串, 解析后的字典)，已结束的任务优先使用缓存"""
+        if use_cache:
+            cached_text = TaskResultCache.get(api_key, task_id)
+            if cached_text is not None:
+                print(f"Using cached result of finished task {task_id}")
+                return cached_text, json.loads(cached_text)
+
+        # 准备请求，明确禁用缓存
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}",
+            "Cache-Control": "no-cache",
+            "Pragma": "no-cache"
+        }
+        
+        params = {
+            "task_id": task_id
+        }
+        
+        # 发送请求
+        response = self._get_session().get(
+            PPIO_TASK_RESULT_URL,
+            params=params,
+            headers=headers,
+            timeout=30
+        )
+        
+        # 检查响应状态
+        if response.status_code != 200:
+            raise Exception(f"API request failed with status {response.status_code}: {response.text}")
+        result_str = response.text
+        result_dict = response.json()
+        # 任务已结束时保存结果，之后的查询不再请求API
+        TaskResultCache.put(api_key, task_id, result_str, result_dict)
+        return result_str, result_dict
+
+    def query_task_result(self, task_id: str, api_key: str = "", use_cache: bool = True) -> Tuple[str, str]:
         """查询派欧云任务结果"""
         # 获取API密钥
         actual_api_key = self.get_api_key(api_key)
@@ -76,49 +116,181 @@ class PPIOQueryTaskResultNode:
             raise ValueError("Task ID is required")
         
         try:
-            # 准备请求，明确禁用缓存
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {actual_api_key}",
-                "Cache-Control": "no-cache",
-                "Pragma": "no-cache"
+            # 返回原始响应字符串和提取的视频链接
+            task_id = task_id.strip()
+            task_key = TaskJournal.resolve_key(TaskJournal.get(task_id), actual_api_key)
+            result_str, result_dict = self.fetch_task_result(task_key, task_id, use_cache)
+            return (result_str, self.extract_video_url(result_dict))
+        except Exception as e:
+            raise Exception(f"Error querying task result: {str(e)}")
+
+
+class PPIOBulkQueryTaskResultNode:
+    """派欧云批量查询任务结果节点，并发查询多个任务并可下载已完成的视频"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "task_ids": ("STRING", {"default": "", "multiline": True, "tooltip": "要查询的任务ID，每行一个，也可用逗号或空格分隔；重复的ID只查询一次，输出中也只出现一次"}),
+                "max_concurrency": ("INT", {"default": 8, "min": 1, "max": 32, "tooltip": "同时查询的最大任务数"}),
+                "download_videos": ("BOOLEAN", {"default": False, "tooltip": "并发下载所有已完成任务的视频；videos与其他输出按任务一一对应，未完成或未下载的任务位置为阻断占位，其下游节点不会执行"}),
+                "api_key": ("STRING", {"default": ""}),
+            },
+            "optional": {
+                "use_cache": ("BOOLEAN", {"default": True, "tooltip": "已结束（成功或失败）的任务直接使用本地缓存的结果，只有未结束的任务会重新查询"}),
             }
-            
-            params = {
-                "task_id": task_id
+        }
+
+    RETURN_TYPES = ("STRING", "STRING", "STRING", "VIDEO") if HAS_COMFY_VIDEO else ("STRING", "STRING", "STRING", "STRING")
+    RETURN_NAMES = ("responses", "statuses", "video_urls", "videos")
+    OUTPUT_IS_LIST = (True, True, True, True)
+    FUNCTION = "query_task_results"
+    CATEGORY = "CC-API/Tools"
+    OUTPUT_NODE = False
+
+    @staticmethod
+    def parse_task_ids(text):
+        """解析任务ID列表，去掉重复项并保持顺序"""
+        task_ids = [item for item in re.split(r"[,\s]+", (text or "").strip()) if item]
+        return list(dict.fromkeys(task_ids))
+
+    def query_task_results(self, task_ids, max_concurrency, download_videos, api_key="", use_cache=True):
+        """并发查询任务结果，按输入顺序返回响应、状态、视频链接和视频，四个输出按任务下标一一对应"""
+        query_node = PPIOQueryTaskResultNode()
+        actual_api_key = query_node.get_api_key(api_key)
+        if not actual_api_key:
+            raise ValueError("API key is required")
+
+        task_ids = self.parse_task_ids(task_ids)
+        if not task_ids:
+            raise ValueError("At least one task ID is required")
+
+        def query(task_id):
+            try:
+                # 使用密钥池提交的任务按登记的账号找回提交时的密钥
+                task_key = TaskJournal.resolve_key(TaskJournal.get(task_id), actual_api_key)
+                result_str, result_dict = query_node.fetch_task_result(task_key, task_id, use_cache)
+            except Exception as e:
+                print(f"Error querying task {task_id}: {str(e)}")
+                return json.dumps({"task_id": task_id, "error": str(e)}, ensure_ascii=False), "ERROR", ""
+            status = (result_dict.get("task") or {}).get("status", "")
+            return result_str, status, query_node.extract_video_url(result_dict)
+
+        workers = max(1, min(max_concurrency, len(task_ids)))
+        print(f"Querying {len(task_ids)} task(s) with concurrency {workers}...")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(in_child_trace(query, "query_task"), task_ids))
+
+            responses = [response for response, _, _ in outcomes]
+            statuses = [status for _, status, _ in outcomes]
+            video_urls = [video_url for _, _, video_url in outcomes]
+
+            # 未完成或不下载的任务用阻断占位，保持videos与其他输出下标对齐
+            videos = [blocked_output() for _ in task_ids]
+            if download_videos:
+                finished = [(index, video_url) for index, video_url in enumerate(video_urls) if video_url]
+                print(f"Downloading {len(finished)} video(s)...")
+                downloaded = executor.map(in_child_trace(download_video, "download_video"), [url for _, url in finished])
+                for (index, _), video in zip(finished, downloaded):
+                    videos[index] = video
+
+        return (responses, statuses, video_urls, videos)
+
+
+class PPIOCollectVideoTasksNode:
+    """派欧云收集视频任务节点，等待分离模式提交的一个或多个视频任务并下载结果"""
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "task_ids": ("STRING", {"default": "", "multiline": True, "tooltip": "视频节点分离模式输出的task_id，每行一个，也可用逗号或空格分隔；重复的ID只收集一次"}),
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 16, "tooltip": "同时下载的最大视频数"}),
+                "api_key": ("STRING", {"default": ""}),
             }
-            
-            # 创建一个不使用缓存的会话
-            session = requests.Session()
-            session.headers.update(headers)
-            
-            # 发送请求
-            response = session.get(
-                "https://api.ppinfra.com/v3/async/task-result",
-                params=params,
-                timeout=30
-            )
-            
-            # 检查响应状态
-            if response.status_code == 200:
-                # 返回原始响应字符串和提取的视频链接
-                result_str = response.text
-                result_dict = response.json()
-                video_url = self.extract_video_url(result_dict)
-                return (result_str, video_url)
+        }
+
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("videos", "task_ids") if HAS_COMFY_VIDEO else ("video_urls", "task_ids")
+    OUTPUT_IS_LIST = (True, True)
+    FUNCTION = "collect_videos"
+    CATEGORY = "CC-API/Video"
+    OUTPUT_NODE = False
+
+    def collect_videos(self, task_ids, max_concurrency, api_key=""):
+        """等待任务结束并下载视频，按输入顺序返回成功的任务；全部失败时抛出异常"""
+        actual_api_key = PPIOQueryTaskResultNode().get_api_key(api_key)
+        if not actual_api_key:
+            raise ValueError("API key is required")
+
+        task_ids = PPIOBulkQueryTaskResultNode.parse_task_ids(task_ids)
+        if not task_ids:
+            raise ValueError("At least one task ID is required")
+
+        # 已结束的任务直接使用缓存的结果，其余任务按提交账号交给共享轮询器
+        outcomes = {}
+        waiting = {}
+        for task_id in task_ids:
+            task_key = TaskJournal.resolve_key(TaskJournal.get(task_id), actual_api_key)
+            cached_text = TaskResultCache.get(task_key, task_id)
+            if cached_text is not None:
+                outcomes[task_id] = PPIOTaskPoller.parse_result(json.loads(cached_text))
             else:
-                raise Exception(f"API request failed with status {response.status_code}: {response.text}")
-                
-        except Exception as e:
-            raise Exception(f"Error querying task result: {str(e)}")
+                waiting.setdefault(task_key, []).append(task_id)
+
+        # 先把所有账号的任务登记到各自的轮询器，各账号的轮询循环同时运行，再统一等待
+        entries = {}
+        for task_key, ids in waiting.items():
+            entries.update(PPIOTaskPoller.shared(task_key).register_all(ids))
+        if entries:
+            print(f"Waiting for {len(entries)} video task(s)...")
+        outcomes.update(PPIOTaskPoller.wait_entries(entries))
+
+        errors = []
+        finished = []
+        for task_id in task_ids:
+            video_url, error = outcomes[task_id]
+            if error:
+                errors.append(f"{task_id}: {error}")
+                TaskJournal.update(task_id, status="failed", error=error)
+            else:
+                finished.append((task_id, video_url))
+                TaskJournal.update(task_id, status="collected", video_url=video_url)
+        for error in errors:
+            print(f"Video task failed: {error}")
+        if not finished:
+            raise ValueError("All video tasks failed: " + "; ".join(errors))
+
+        workers = max(1, min(max_concurrency, len(finished)))
+        print(f"Downloading {len(finished)} video(s)...")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            videos = list(executor.map(in_child_trace(download_video, "download_video"), [url for _, url in finished]))
+        return (videos, [task_id for task_id, _ in finished])
+
+
+async def task_journal(request):
+    """分离模式提交的任务记录查询接口"""
+    from aiohttp import web
+    from .async_utils import run_blocking
+    return web.json_response({"tasks": await run_blocking(TaskJournal.entries)})
 
 
 # Node class mappings
 NODE_CLASS_MAPPINGS = {
-    "PPIOQueryTaskResultNode": PPIOQueryTaskResultNode
+    "PPIOQueryTaskResultNode": PPIOQueryTaskResultNode,
+    "PPIOBulkQueryTaskResultNode": PPIOBulkQueryTaskResultNode,
+    "PPIOCollectVideoTasksNode": PPIOCollectVideoTasksNode
 }
 
 # Node display name mappings
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "PPIOQueryTaskResultNode": "派欧云查询任务结果"
-}
\ No newline at end of file
+    "PPIOQueryTaskResultNode": "派欧云查询任务结果",
+    "PPIOBulkQueryTaskResultNode": "派欧云批量查询任务结果",
+    "PPIOCollectVideoTasksNode": "派欧云收集视频任务"
+}
+
+# API路由，由节点加载器注册
+ROUTES = [
+    ("GET", "/cc_api/tasks", task_journal),
+]
\ No newline at end of file
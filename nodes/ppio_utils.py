@@ -0,0 +1,429 @@
+import io
+import json
+import re
+import time
+import threading
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cc_utils import CCConfig
+from .scheduler import JobScheduler
+from .key_pool import KeyPool
+from .cache_utils import JsonRecordStore, account_fingerprint, make_cache_key, signed_url_expires_at
+from .metrics import count_bytes, current_trace, in_child_trace, observe_status, phase, polling
+
+# 尝试导入ComfyUI的视频处理模块
+try:
+    from comfy_api.input_impl import VideoFromFile
+    HAS_COMFY_VIDEO = True
+except ImportError:
+    HAS_COMFY_VIDEO = False
+    VideoFromFile = None  # 定义为None以避免未绑定变量错误
+
+# 分离模式下视频输出使用ExecutionBlocker，阻止下游节点拿到空视频后继续执行
+try:
+    from comfy_execution.graph import ExecutionBlocker
+except ImportError:
+    ExecutionBlocker = None
+
+
+PPIO_TASK_RESULT_URL = "https://api.ppinfra.com/v3/async/task-result"
+
+# 派欧云异步任务的成功状态（API会返回两种写法）
+SUCCESS_STATUSES = ("TASK_STATUS_SUCCEEDED", "TASK_STATUS_SUCCEED")
+FAILED_STATUS = "TASK_STATUS_FAILED"
+
+
+class TaskResultCache:
+    """已结束任务（成功或失败）的查询结果缓存，按账号和task_id保存在内存和磁盘中
+
+    结束的任务结果不会再变化，但结果中的视频、图片链接是有时效的签名URL，记录在最早的链接过期前失效。
+    """
+
+    _store = None
+    # 在签名URL过期前提前失效的安全余量（秒）
+    _expiry_margin = 600
+
+    @classmethod
+    def _get_store(cls):
+        if cls._store is None:
+            cls._store = JsonRecordStore("ppio_task_results", max_entries=5000)
+        return cls._store
+
+    @staticmethod
+    def make_key(api_key, task_id):
+        return make_cache_key(account=account_fingerprint(api_key), task_id=task_id)
+
+    @staticmethod
+    def is_terminal(result):
+        status = (result.get("task") or {}).get("status")
+        return status in SUCCESS_STATUSES or status == FAILED_STATUS
+
+    @staticmethod
+    def _media_urls(value):
+        """递归收集结果中 *_url 字段的链接"""
+        if isinstance(value, dict):
+            for name, item in value.items():
+                if name.endswith("_url") and isinstance(item, str) and item.startswith("http"):
+                    yield item
+                else:
+                    yield from TaskResultCache._media_urls(item)
+        elif isinstance(value, list):
+            for item in value:
+                yield from TaskResultCache._media_urls(item)
+
+    @classmethod
+    def get(cls, api_key, task_id):
+        """获取缓存的原始响应文本，未命中返回None"""
+        try:
+            return cls._get_store().get(cls.make_key(api_key, task_id))
+        except Exception as e:
+            print(f"Error reading task result cache: {e}")
+            return None
+
+    @classmethod
+    def put(cls, api_key, task_id, result_text, result=None):
+        """保存已结束任务的原始响应文本，未结束的任务不保存"""
+        try:
+            if result is None:
+                result = json.loads(result_text)
+            if not cls.is_terminal(result):
+                return
+            expirations = [signed_url_expires_at(url) for url in cls._media_urls(result)]
+            expirations = [expires_at - cls._expiry_margin for expires_at in expirations if expires_at is not None]
+            expires_at = min(expirations) if expirations else None
+            if expires_at is not None and expires_at <= time.time():
+                return
+            cls._get_store().put(cls.make_key(api_key, task_id), result_text, expires_at=expires_at)
+        except Exception as e:
+            print(f"Error saving task result cache: {e}")
+
+    @classmethod
+    def clear(cls):
+        cls._get_store().clear()
+
+    @classmethod
+    def get_cache_info(cls):
+        return cls._get_store().get_cache_info()
+
+
+class TaskJournal:
+    """分离模式提交的任务记录，保存在磁盘中，ComfyUI重启后仍可收集结果
+
+    每条记录包含task_id、提交的节点和接口、账号指纹（不保存密钥）、提交时间和收集状态。
+    """
+
+    _store = None
+    # 记录保留时间（秒）
+    _retention = 7 * 24 * 3600
+
+    @classmethod
+    def _get_store(cls):
+        if cls._store is None:
+            cls._store = JsonRecordStore("ppio_task_journal", max_entries=2000)
+        return cls._store
+
+    @classmethod
+    def record(cls, api_key, task_id, node, endpoint):
+        """登记已提交的任务，返回记录"""
+        entry = {
+            "task_id": task_id,
+            "node": node,
+            "endpoint": endpoint,
+            "account": account_fingerprint(api_key),
+            "submitted_at": time.time(),
+            "status": "submitted",
+        }
+        cls._get_store().put(task_id, entry, ttl=cls._retention)
+        return entry
+
+    @classmethod
+    def get(cls, task_id):
+        return cls._get_store().get(task_id)
+
+    @classmethod
+    def update(cls, task_id, **fields):
+        """更新任务记录（例如收集结果后的状态），不存在的任务忽略"""
+        entry = cls.get(task_id)
+        if entry is None:
+            return None
+        entry = dict(entry, **fields)
+        cls._get_store().put(task_id, entry, expires_at=entry["submitted_at"] + cls._retention)
+        return entry
+
+    @classmethod
+    def entries(cls):
+        """返回全部任务记录，最近提交的在前"""
+        entries = [entry for _, entry in cls._get_store().items()]
+        return sorted(entries, key=lambda entry: entry["submitted_at"], reverse=True)
+
+    @staticmethod
+    def resolve_key(entry, api_key):
+        """选择查询任务使用的密钥：任务只能用提交时的密钥查询，使用密钥池时按账号指纹找回密钥"""
+        if entry is None or not entry.get("account") or entry["account"] == account_fingerprint(api_key):
+            return api_key
+        return KeyPool.find_key("ppio", entry["account"]) or api_key
+
+
+def blocked_output():
+    """返回阻断下游执行的占位输出；ComfyUI不支持ExecutionBlocker时返回None"""
+    return ExecutionBlocker(None) if ExecutionBlocker is not None else None
+
+
+def detach_task(api_key, task_id, node, endpoint):
+    """分离模式：登记已提交的任务后立即返回(被阻断的视频, task_id)，由收集节点稍后等待结果"""
+    TaskJournal.record(api_key, task_id, node, endpoint)
+    print(f"Task {task_id} detached, collect the video later with the PPIO collect video tasks node")
+    return (blocked_output(), task_id)
+
+
+def parse_prompt_list(text):
+    """解析多行提示词，每行一个，忽略空行"""
+    return [line.strip() for line in (text or "").splitlines() if line.strip()]
+
+
+def parse_seed_list(text):
+    """解析种子列表，支持逗号、空格或换行分隔；为空时返回空列表"""
+    seeds = []
+    for item in re.split(r"[,\s]+", (text or "").strip()):
+        if not item:
+            continue
+        try:
+            seeds.append(int(item))
+        except ValueError:
+            raise ValueError(f"Invalid seed value: {item}")
+    return seeds
+
+
+def split_image_batch(images):
+    """将IMAGE批次[N, H, W, C]拆分为单张图像列表"""
+    if images is None:
+        return []
+    return [images[i:i + 1] for i in range(images.shape[0])]
+
+
+def expand_batch_jobs(prompts, seeds=None, images=None):
+    """组合提示词、种子和图像列表为任务列表
+
+    各列表长度须为1或相同的N，长度为1的列表会广播到全部任务；
+    未提供种子时使用-1（随机）。
+    """
+    seeds = seeds or [-1]
+    images = images or [None]
+    lists = {"prompts": prompts, "seeds": seeds, "images": images}
+
+    if not prompts:
+        raise ValueError("At least one prompt is required")
+
+    count = max(len(items) for items in lists.values())
+    for name, items in lists.items():
+        if len(items) not in (1, count):
+            raise ValueError(f"Length of {name} ({len(items)}) must be 1 or {count}")
+
+    def pick(items, index):
+        return items[0] if len(items) == 1 else items[index]
+
+    return [
+        {"prompt": pick(prompts, i), "seed": pick(seeds, i), "image": pick(images, i)}
+        for i in range(count)
+    ]
+
+
+class PPIOTaskPoller:
+    """派欧云异步任务轮询器，后台线程在一个循环中查询所有等待中的任务并复用连接"""
+
+    # 按账号共享的轮询器，收集节点等待的任务在同一个轮询循环中查询
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, api_key, poll_interval=5, max_attempts=120):
+        self.api_key = api_key
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.session = requests.Session()
+        # 连接池大小使用[transport]设置，批量任务并发查询时复用连接
+        transport = CCConfig().get_transport_settings()
+        adapter = HTTPAdapter(pool_connections=transport["pool_connections"], pool_maxsize=transport["pool_maxsize"])
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        })
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+
+    @classmethod
+    def shared(cls, api_key):
+        """获取账号共享的轮询器"""
+        key_id = account_fingerprint(api_key)
+        with cls._shared_lock:
+            if key_id not in cls._shared:
+                cls._shared[key_id] = cls(api_key)
+            return cls._shared[key_id]
+
+    def query(self, task_id):
+        """查询单个任务结果"""
+        response = self.session.get(PPIO_TASK_RESULT_URL, params={"task_id": task_id}, timeout=30)
+        if response.status_code != 200:
+            raise Exception(f"Query task result failed with status {response.status_code}: {response.text}")
+        result = response.json()
+        TaskResultCache.put(self.api_key, task_id, response.text, result)
+        return result
+
+    def _register(self, task_id):
+        """登记等待中的任务，必要时启动轮询线程"""
+        with self._lock:
+            entry = self._pending.get(task_id)
+            if entry is None:
+                entry = {"event": threading.Event(), "attempts": 0, "result": None, "last_error": None, "traces": []}
+                self._pending[task_id] = entry
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            return entry
+
+    @staticmethod
+    def parse_result(result):
+        """解析任务结果，任务结束时返回(video_url, 错误信息)，否则返回None"""
+        task = result.get("task", {})
+        status = task.get("status")
+        if status in SUCCESS_STATUSES:
+            videos = result.get("videos") or []
+            if videos:
+                return videos[0]["video_url"], None
+            return None, "Task succeeded but no video found in result"
+        if status == FAILED_STATUS:
+            return None, f"Task failed: {task.get('reason', 'Unknown error')}"
+        return None
+
+    def _check(self, task_id, entry):
+        """查询一次任务状态，任务结束时返回(video_url, 错误信息)，否则返回None"""
+        entry["attempts"] += 1
+        try:
+            result = self.query(task_id)
+        except Exception as e:
+            # 查询失败时保留任务，下一轮继续查询
+            entry["last_error"] = str(e)
+            result = {}
+
+        status = result.get("task", {}).get("status")
+        for trace in entry["traces"]:
+            observe_status(status, trace)
+        outcome = self.parse_result(result)
+        if outcome is not None:
+            return outcome
+        if entry["attempts"] >= self.max_attempts:
+            return None, entry["last_error"] or f"Task timeout after {self.max_attempts} attempts"
+        return None
+
+    def _run(self):
+        """轮询循环：每轮查询全部等待中的任务，没有等待任务时退出"""
+        while True:
+            with self._lock:
+                pending = list(self._pending.items())
+                if not pending:
+                    self._thread = None
+                    return
+            print(f"Polling {len(pending)} pending task(s)")
+            for task_id, entry in pending:
+                outcome = self._check(task_id, entry)
+                if outcome is not None:
+                    with self._lock:
+                        self._pending.pop(task_id, None)
+                    entry["result"] = outcome
+                    entry["event"].set()
+            time.sleep(self.poll_interval)
+
+    def wait(self, task_id):
+        """等待任务结束，返回(video_url, 错误信息)；轮询到的状态记录到当前线程的trace"""
+        trace = current_trace()
+        with polling():
+            entry = self._register(task_id)
+            if trace is not None:
+                entry["traces"].append(trace)
+            entry["event"].wait()
+        return entry["result"]
+
+    def register_all(self, task_ids):
+        """登记多个等待中的任务并立即返回{task_id: 等待条目}，配合wait_entries使用"""
+        return {task_id: self._register(task_id) for task_id in task_ids if task_id}
+
+    @staticmethod
+    def wait_entries(entries):
+        """等待已登记的任务结束，返回{task_id: (video_url, 错误信息)}；条目可来自多个轮询器"""
+        results = {}
+        for task_id, entry in entries.items():
+            entry["event"].wait()
+            results[task_id] = entry["result"]
+        return results
+
+    def wait_all(self, task_ids):
+        """等待所有任务结束，返回{task_id: (video_url, 错误信息)}"""
+        return self.wait_entries(self.register_all(task_ids))
+
+
+def download_video(video_url):
+    """下载视频并返回VIDEO对象；不支持ComfyUI视频或下载失败时返回URL"""
+    if HAS_COMFY_VIDEO and VideoFromFile is not None:
+        # 使用同步方式下载视频，避免事件循环冲突
+        try:
+            with phase("download"):
+                video_io = io.BytesIO(count_bytes("download", urllib.request.urlopen(video_url).read()))
+            with phase("decode"):
+                return VideoFromFile(video_io)
+        except Exception as e:
+            print(f"Error downloading video synchronously: {str(e)}")
+    return video_url
+
+
+def run_batch_video_tasks(api_key, jobs, submit_fn, max_concurrency=4, endpoint_fn=None):
+    """批量生成视频：并发提交任务，统一轮询，任务完成后立即下载
+
+    每个任务通过全局调度器以批量优先级获取槽位，任务结束即释放；
+    endpoint_fn(job)返回任务对应的接口名，用于按接口限制并发。
+    api_key属于密钥池时每个任务单独选择密钥，submit_fn通过job["api_key"]获取本任务的密钥。
+    返回(视频列表, task_id列表)，与输入任务按下标一一对应：失败任务的视频为阻断占位，
+    task_id为空（提交失败时）或失败任务的ID；全部失败时抛出异常。
+    """
+    scheduler = JobScheduler()
+    pool = KeyPool.lookup(account_fingerprint(api_key))
+    owner = f"batch-{uuid.uuid4().hex[:8]}"
+
+    def run_job(indexed_job):
+        index, job = indexed_job
+        job_key = pool.select() if pool is not None and index > 0 else api_key
+        job = dict(job, api_key=job_key)
+        endpoint = endpoint_fn(job) if endpoint_fn else "batch"
+        with scheduler.slot("ppio", endpoint, job_key, priority="batch", owner=owner) as slot:
+            try:
+                task_id = slot.call(submit_fn, job)
+            except Exception as e:
+                return None, None, f"#{index + 1} submit: {e}"
+            print(f"Task #{index + 1} submitted with ID: {task_id}")
+            # 任务只能用提交时的密钥查询，使用该密钥的共享轮询器
+            video_url, error = PPIOTaskPoller.shared(job_key).wait(task_id)
+        if error:
+            return task_id, None, f"#{index + 1} {task_id}: {error}"
+        print(f"Video #{index + 1} generated successfully: {video_url}")
+        return task_id, download_video(video_url), None
+
+    print(f"Submitting {len(jobs)} video task(s) with concurrency {max_concurrency}...")
+    workers = max(1, min(max_concurrency, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 每个任务在工作线程中记录为节点trace的子trace
+        outcomes = list(executor.map(in_child_trace(run_job, "batch_job"), enumerate(jobs)))
+
+    errors = [error for _, _, error in outcomes if error]
+    for error in errors:
+        print(f"Batch video task failed: {error}")
+    if len(errors) == len(outcomes):
+        raise ValueError("All video tasks failed: " + "; ".join(errors))
+    # 失败的任务保留位置，避免后续结果与输入的提示词、种子错位
+    videos = [blocked_output() if error else video for _, video, error in outcomes]
+    task_ids = [task_id or "" for task_id, _, _ in outcomes]
+    return videos, task_ids
@@ -12,9 +12,14 @@ import io
 import random
 import hashlib
 import time
-import server
 from aiohttp import web
 from .cc_utils import CCConfig
+from .audio_utils import TTSCache
+from .async_utils import AsyncCoalescer
+from .cache_utils import atomic_write_bytes
+from .scheduler import JobScheduler
+from .voice_refresher import VoiceCatalogRefresher
+from .metrics import count_bytes, phase
 
 
 class Qwen3TTS:
@@ -87,6 +92,7 @@ class Qwen3TTS:
             },
             "optional": {
                 "api_key": ("STRING", {"default": ""}),
+                "use_cache": ("BOOLEAN", {"default": True, "tooltip": "相同文本和参数时直接使用本地缓存的合成结果，不再重复请求API"}),
             },
         }
 
@@ -97,64 +103,62 @@ class Qwen3TTS:
 
     def get_dashscope_api_key(self, api_key=""):
         """获取DashScope API密钥"""
-        # 首先检查传入的参数
-        if api_key:
-            return api_key
-        
-        # 然后检查环境变量
-        if os.environ.get("DASHSCOPE_API_KEY") is not None:
-            return os.environ["DASHSCOPE_API_KEY"]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            config.read(config_path)
-            
-            try:
-                if "dashscope" in config and "API_KEY" in config["dashscope"]:
-                    return config["dashscope"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        return CCConfig().get_api_key("dashscope", api_key)
     
-    def load_preview_audio(self, voice):
-        """加载音色预览音频"""
-        if voice not in self.VOICE_PREVIEW_URLS:
+    @classmethod
+    def get_preview_path(cls, voice):
+        """获取音色预览音频的本地缓存路径，未知音色返回None"""
+        url = cls.VOICE_PREVIEW_URLS.get(voice)
+        if url is None:
+            return None
+        temp_dir = os.path.join(tempfile.gettempdir(), "comfyui_qwen3_tts")
+        file_hash = hashlib.md5(url.encode()).hexdigest()
+        return os.path.join(temp_dir, f"preview_{file_hash}.wav")
+    
+    @classmethod
+    def get_preview_file(cls, voice):
+        """确保音色预览音频已缓存到本地并返回文件路径，失败返回None"""
+        preview_path = cls.get_preview_path(voice)
+        if preview_path is None:
             return None
         
-        url = self.VOICE_PREVIEW_URLS[voice]
+        # 如果文件已存在，直接返回
+        if os.path.exists(preview_path):
+            return preview_path
         
         try:
-            # 创建临时目录
-            temp_dir = os.path.join(tempfile.gettempdir(), "comfyui_qwen3_tts")
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # 生成唯一文件名
-            file_hash = hashlib.md5(url.encode()).hexdigest()
-            preview_path = os.path.join(temp_dir, f"preview_{file_hash}.wav")
-            
-            # 如果文件已存在，直接返回
-            if os.path.exists(preview_path):
-                return self._load_audio_file(preview_path)
-            
             # 下载音频文件
-            response = requests.get(url, timeout=30)
+            response = requests.get(cls.VOICE_PREVIEW_URLS[voice], timeout=30)
             if response.status_code == 200:
-                with open(preview_path, "wb") as f:
-                    f.write(response.content)
-                
-                # 加载音频文件
-                return self._load_audio_file(preview_path)
+                # 原子写入，避免并发读取到不完整的文件
+                atomic_write_bytes(preview_path, response.content)
+                return preview_path
             else:
                 print(f"下载预览音频失败: {response.status_code}")
                 return None
-                
+        except Exception as e:
+            print(f"下载预览音频失败: {e}")
+            return None
+    
+    @classmethod
+    def prefetch_previews(cls):
+        """后台预下载所有音色的预览音频"""
+        missing = [voice for voice in cls.VOICE_PREVIEW_URLS if not os.path.exists(cls.get_preview_path(voice))]
+        if not missing:
+            return
+        print(f"Prefetching {len(missing)} Qwen3-TTS voice previews...")
+        for voice in missing:
+            cls.get_preview_file(voice)
+    
+    def load_preview_audio(self, voice):
+        """加载音色预览音频"""
+        try:
+            preview_path = self.get_preview_file(voice)
+            if preview_path is None:
+                return None
+            
+            # 加载音频文件
+            return self._load_audio_file(preview_path)
         except Exception as e:
             print(f"加载预览音频失败: {e}")
             return None
@@ -213,6 +217,7 @@ class Qwen3TTS:
         voice,
         language_type="Auto",
         api_key="",
+        use_cache=True,
     ):
         """生成语音"""
         
@@ -241,6 +246,17 @@ class Qwen3TTS:
             }
         }
         
+        # 检查TTS缓存
+        cache_key = TTSCache.make_key(
+            "dashscope", "qwen3-tts-flash", voice_param, text,
+            language_type=language_type
+        )
+        if use_cache:
+            cached_audio = TTSCache.get(cache_key)
+            if cached_audio is not None:
+                print(f"Using cached TTS result: {cache_key[:12]}")
+                return (cached_audio,)
+        
         try:
             # 发送请求
             headers = {
@@ -248,11 +264,13 @@ class Qwen3TTS:
                 "Content-Type": "application/json"
             }
             
-            response = requests.post(
-                "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation",
-                headers=headers,
-                json=request_data
-            )
+            with JobScheduler().slot("dashscope", "qwen3-tts-flash", api_key) as slot:
+                response = slot.request(
+                    requests.post,
+                    "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation",
+                    headers=headers,
+                    json=request_data
+                )
             
             if response.status_code == 200:
                 result = response.json()
@@ -262,7 +280,8 @@ class Qwen3TTS:
                     audio_url = result["output"]["audio"]["url"]
                     
                     # 下载音频文件
-                    audio_response = requests.get(audio_url)
+                    with phase("download"):
+                        audio_response = count_bytes("download", requests.get(audio_url))
                     
                     if audio_response.status_code == 200:
                         # 将音频数据保存到临时文件
@@ -314,11 +333,17 @@ class Qwen3TTS:
                         # 转换为PyTorch张量
                         waveform_tensor = torch.from_numpy(waveform)
                         
-                        # 返回ComfyUI期望的音频格式
-                        return ({
+                        audio_data = {
                             "waveform": waveform_tensor,
                             "sample_rate": sample_rate
-                        },)
+                        }
+                        
+                        # 写入TTS缓存
+                        if use_cache:
+                            TTSCache.put(cache_key, audio_data)
+                        
+                        # 返回ComfyUI期望的音频格式
+                        return (audio_data,)
                     else:
                         print(f"Error downloading audio: {audio_response.status_code}")
                         return self._create_blank_audio()
@@ -373,80 +398,125 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "Qwen3TTS": "Qwen3-TTS",
 }
 
-# 注册API路由
-def setup_routes():
-    """注册Qwen3-TTS音色预览API路由"""
-    @server.PromptServer.instance.routes.post("/qwen3_tts_preview")
-    async def qwen3_tts_preview(request):
-        """处理Qwen3-TTS音色预览请求"""
-        try:
-            # 获取请求数据
-            data = await request.json()
-            voice = data.get("voice", "")
-            
-            if not voice:
-                return web.json_response({"error": "Missing voice parameter"}, status=400)
-            
-            # 创建Qwen3TTS实例
-            tts = Qwen3TTS()
-            
-            # 加载预览音频
-            preview_audio = tts.load_preview_audio(voice)
-            
-            if preview_audio is None:
-                return web.json_response({"error": "Failed to load preview audio"}, status=500)
-            
-            # 获取波形数据
-            waveform = preview_audio["waveform"]
-            sample_rate = preview_audio["sample_rate"]
-            
-            # 转换为numpy数组
-            if isinstance(waveform, torch.Tensor):
-                waveform = waveform.numpy()
-            
-            # 确保波形形状正确 [T, C]
-            if waveform.ndim == 3:
-                # 从 [B, C, T] 转换为 [C, T]
-                waveform = waveform[0]  # 取第一个批次
-                # 然后转置为 [T, C]
-                waveform = waveform.T
-            elif waveform.ndim == 1:
-                # 单声道，添加通道维度并转置 [T, 1]
-                waveform = waveform.reshape(-1, 1)
-            
-            # 确保数据类型是int16
-            if waveform.dtype != np.int16:
-                # 检查数据范围并归一化
-                if np.max(np.abs(waveform)) > 1.0:
-                    # 如果数据已经不在[-1.0, 1.0]范围内，先归一化
-                    waveform = waveform / np.max(np.abs(waveform))
-                # 从float32 [-1.0, 1.0] 转换为 int16 [-32768, 32767]
-                waveform = np.clip(waveform * 32767, -32768, 32767).astype(np.int16)
-            
-            # 创建临时文件
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_file_path = temp_file.name
-            
-            # 保存为WAV文件
-            wavfile.write(temp_file_path, sample_rate, waveform)
-            
-            # 读取文件并编码为Base64
-            with open(temp_file_path, "rb") as audio_file:
-                audio_data = audio_file.read()
-                audio_base64 = base64.b64encode(audio_data).decode('utf-8')
-            
-            # 删除临时文件
-            os.unlink(temp_file_path)
-            
-            # 返回Base64编码的音频数据
-            return web.json_response({
-                "audio": audio_base64,
-                "sample_rate": sample_rate
-            })
-            
-        except Exception as e:
-            print(f"Error in qwen3_tts_preview: {str(e)}")
-            return web.json_response({"error": str(e)}, status=500)
+def _encode_preview_audio(voice):
+    """加载音色预览音频并编码为Base64 WAV，失败返回None（阻塞调用，在线程池中执行）"""
+    # 创建Qwen3TTS实例
+    tts = Qwen3TTS()
+
+    # 加载预览音频
+    preview_audio = tts.load_preview_audio(voice)
+
+    if preview_audio is None:
+        return None
+
+    # 获取波形数据
+    waveform = preview_audio["waveform"]
+    sample_rate = preview_audio["sample_rate"]
+
+    # 转换为numpy数组
+    if isinstance(waveform, torch.Tensor):
+        waveform = waveform.numpy()
+
+    # 确保波形形状正确 [T, C]
+    if waveform.ndim == 3:
+        # 从 [B, C, T] 转换为 [C, T]
+        waveform = waveform[0]  # 取第一个批次
+        # 然后转置为 [T, C]
+        waveform = waveform.T
+    elif waveform.ndim == 1:
+        # 单声道，添加通道维度并转置 [T, 1]
+        waveform = waveform.reshape(-1, 1)
+
+    # 确保数据类型是int16
+    if waveform.dtype != np.int16:
+        # 检查数据范围并归一化
+        if np.max(np.abs(waveform)) > 1.0:
+            # 如果数据已经不在[-1.0, 1.0]范围内，先归一化
+            waveform = waveform / np.max(np.abs(waveform))
+        # 从float32 [-1.0, 1.0] 转换为 int16 [-32768, 32767]
+        waveform = np.clip(waveform * 32767, -32768, 32767).astype(np.int16)
+
+    # 创建临时文件
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
+        temp_file_path = temp_file.name
+
+    # 保存为WAV文件
+    wavfile.write(temp_file_path, sample_rate, waveform)
+
+    # 读取文件并编码为Base64
+    with open(temp_file_path, "rb") as audio_file:
+        audio_data = audio_file.read()
+        audio_base64 = base64.b64encode(audio_data).decode('utf-8')
+
+    # 删除临时文件
+    os.unlink(temp_file_path)
+
+    return {
+        "audio": audio_base64,
+        "sample_rate": sample_rate
+    }
+
+
+# 合并同时发起的相同音色预览请求
+_preview_coalescer = AsyncCoalescer()
+
+
+# Qwen3-TTS音色预览API路由处理函数
+async def qwen3_tts_preview_file(request):
+    """直接返回缓存的预览WAV文件
+
+    FileResponse支持Range请求，并根据文件修改时间和大小返回ETag/Last-Modified，
+    浏览器可以缓存并用条件请求复用。
+    """
+    voice = request.query.get("voice", "")
+    if not voice:
+        return web.json_response({"error": "Missing voice parameter"}, status=400)
+    if voice not in Qwen3TTS.VOICE_PREVIEW_URLS:
+        return web.json_response({"error": f"Unknown voice: {voice}"}, status=404)
+    
+    # 未缓存时在线程池中下载，相同音色的并发请求只下载一次
+    preview_path = Qwen3TTS.get_preview_path(voice)
+    if not os.path.exists(preview_path):
+        preview_path = await _preview_coalescer.run(("file", voice), Qwen3TTS.get_preview_file, voice)
+    if preview_path is None:
+        return web.json_response({"error": "Failed to load preview audio"}, status=502)
+    
+    return web.FileResponse(preview_path, headers={
+        "Content-Type": "audio/wav",
+        "Cache-Control": "public, max-age=86400",
+    })
+
+
+async def qwen3_tts_preview(request):
+    """处理Qwen3-TTS音色预览请求"""
+    try:
+        # 获取请求数据
+        data = await request.json()
+        voice = data.get("voice", "")
+        
+        if not voice:
+            return web.json_response({"error": "Missing voice parameter"}, status=400)
+        
+        # 在线程池中下载和编码预览音频，避免阻塞事件循环
+        payload = await _preview_coalescer.run(voice, _encode_preview_audio, voice)
+        
+        if payload is None:
+            return web.json_response({"error": "Failed to load preview audio"}, status=500)
+        
+        # 返回Base64编码的音频数据
+        return web.json_response(payload)
+        
+    except Exception as e:
+        print(f"Error in qwen3_tts_preview: {str(e)}")
+        return web.json_response({"error": str(e)}, status=500)
+
+
+# API路由，由节点加载器注册
+ROUTES = [
+    ("GET", "/qwen3_tts_preview", qwen3_tts_preview_file),
+    ("POST", "/qwen3_tts_preview", qwen3_tts_preview),
+]
+
 
-# 立即注册路由
-setup_routes()
\ No newline at end of file
+# 后台预下载所有预览音频并定期补全缺失的文件，首次点击时无需等待下载
+VoiceCatalogRefresher().register("qwen3_previews", Qwen3TTS.prefetch_previews)
\ No newline at end of file
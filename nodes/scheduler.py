@@ -0,0 +1,325 @@
+import json
+import re
+import threading
+import time
+import itertools
+from contextlib import contextmanager
+
+from .config import CCConfig
+from .cache_utils import account_fingerprint
+from .key_pool import KeyPool
+from .metrics import count_bytes, current_trace, phase, trace_call
+
+
+# 任务优先级：交互式运行优先于批量任务
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_NAMES = {"interactive": PRIORITY_INTERACTIVE, "batch": PRIORITY_BATCH}
+
+# 识别服务商限流或队列已满的错误信息
+RATE_LIMIT_PATTERN = re.compile(
+    r"status 429|too many requests|rate limit|ratelimit|concurrency limit|queue is full|exceeded.*(quota|limit)",
+    re.IGNORECASE
+)
+
+
+def is_rate_limit_error(error):
+    """判断异常是否为限流或并发超限错误"""
+    return bool(RATE_LIMIT_PATTERN.search(str(error)))
+
+
+def request_body_size(kwargs):
+    """估算requests调用的请求体字节数（json、data和files参数）"""
+    size = 0
+    if kwargs.get("json") is not None:
+        size += len(json.dumps(kwargs["json"], ensure_ascii=False).encode("utf-8"))
+    data = kwargs.get("data")
+    if isinstance(data, (bytes, bytearray)):
+        size += len(data)
+    elif isinstance(data, str):
+        size += len(data.encode("utf-8"))
+    elif isinstance(data, dict):
+        size += sum(len(str(key)) + len(str(value)) for key, value in data.items())
+    for value in (kwargs.get("files") or {}).values():
+        content = value[1] if isinstance(value, tuple) else value
+        if isinstance(content, (bytes, bytearray)):
+            size += len(content)
+        elif hasattr(content, "seek") and hasattr(content, "tell"):
+            try:
+                position = content.tell()
+                content.seek(0, 2)
+                size += content.tell() - position
+                content.seek(position)
+            except (OSError, ValueError):
+                pass
+    return size
+
+
+class SchedulerSlot:
+    """已获取的调度槽位，在with块结束时释放"""
+
+    def __init__(self, scheduler, provider, endpoint, key_id, owner):
+        self.scheduler = scheduler
+        self.provider = provider
+        self.endpoint = endpoint
+        self.key_id = key_id
+        self.owner = owner
+        self.acquired_at = time.time()
+
+    def call(self, func, *args, **kwargs):
+        """调用提交接口，遇到限流错误时按指数退避重试"""
+        with phase("request"):
+            return self.scheduler.call_with_backoff(self, func, *args, **kwargs)
+
+    def request(self, func, *args, **kwargs):
+        """发送HTTP请求（如requests.post），响应为429时按Retry-After或指数退避重试"""
+        trace = current_trace()
+        if trace is not None:
+            trace.add_bytes("upload", request_body_size(kwargs))
+        with phase("request"):
+            response = self.scheduler.request_with_backoff(self, func, *args, **kwargs)
+        if kwargs.get("stream"):
+            # 流式响应由调用方读取，不在这里读取响应体
+            return response
+        return count_bytes("download", response)
+
+
+class JobScheduler:
+    """全局任务调度器，按服务商、接口和API密钥限制并发任务数
+
+    所有提交请求先获取槽位：等待中的任务按优先级排序，同优先级下
+    优先调度正在运行任务最少的调用方，保证多个批量任务之间公平共享配额。
+    """
+
+    _instance = None
+    _max_retries = 5
+    _base_backoff = 2.0
+    _max_backoff = 60.0
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(JobScheduler, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self._waiters = []
+        self._running_provider = {}
+        self._running_endpoint = {}
+        self._running_key = {}
+        self._running_owner = {}
+        self._cooldown_until = {}
+        self._stats = {}
+        self._load_limits()
+        CCConfig().add_reload_listener(self._reload_limits)
+
+    def _load_limits(self):
+        """从config.ini的[scheduler]读取并发限制，只有配置了的限制才生效，未配置时不限制"""
+        settings = CCConfig().get_section("scheduler")
+        self._limits = {}
+        for option, value in settings.items():
+            try:
+                self._limits[option.strip().lower()] = int(value)
+            except ValueError:
+                print(f"Invalid scheduler setting {option} = {value}")
+        self._default_limit = self._limits.pop("default_concurrency", None)
+
+    def _reload_limits(self):
+        """config.ini修改后重新读取并发限制并唤醒等待中的任务"""
+        with self._condition:
+            self._load_limits()
+            self._condition.notify_all()
+
+    def _provider_limit(self, provider):
+        return self._limits.get(provider, self._default_limit)
+
+    def _key_limit(self, provider):
+        # 单个密钥的限制与服务商总限制相互独立，密钥池中的多个密钥可以分别用满各自的并发数
+        return self._limits.get(f"{provider}_per_key")
+
+    def _endpoint_limit(self, provider, endpoint):
+        return self._limits.get(f"{provider}/{endpoint}")
+
+    def _is_available(self, provider, endpoint, key_id):
+        """检查服务商、接口和密钥三级槽位是否都有空闲，且密钥不在限流冷却中"""
+        if self._cooldown_until.get((provider, key_id), 0) > time.time():
+            return False
+        provider_limit = self._provider_limit(provider)
+        if provider_limit is not None and self._running_provider.get(provider, 0) >= provider_limit:
+            return False
+        key_limit = self._key_limit(provider)
+        if key_limit is not None and self._running_key.get((provider, key_id), 0) >= key_limit:
+            return False
+        endpoint_limit = self._endpoint_limit(provider, endpoint)
+        if endpoint_limit is not None and self._running_endpoint.get((provider, endpoint), 0) >= endpoint_limit:
+            return False
+        return True
+
+    def _next_waiter(self):
+        """选出下一个可以运行的等待任务：优先级 > 调用方当前运行数 > 入队顺序"""
+        candidates = [w for w in self._waiters if self._is_available(w["provider"], w["endpoint"], w["key_id"])]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda w: (w["priority"], self._running_owner.get(w["owner"], 0), w["seq"]))
+
+    def _next_wakeup(self):
+        """计算最近的冷却结束时间，用于等待超时"""
+        now = time.time()
+        pending = [until - now for until in self._cooldown_until.values() if until > now]
+        return min(pending) if pending else None
+
+    def _provider_stats(self, provider):
+        return self._stats.setdefault(provider, {"submitted": 0, "completed": 0, "rate_limited": 0, "wait_seconds": 0.0})
+
+    def acquire(self, provider, endpoint, api_key, priority="interactive", owner=None):
+        """阻塞直到获取槽位，返回SchedulerSlot"""
+        priority = PRIORITY_NAMES.get(priority, priority)
+        key_id = account_fingerprint(api_key)
+        owner = owner or "default"
+        waiter = {
+            "provider": provider,
+            "endpoint": endpoint,
+            "key_id": key_id,
+            "priority": priority,
+            "owner": owner,
+            "seq": next(self._sequence),
+            "queued_at": time.time(),
+        }
+        with self._condition:
+            self._waiters.append(waiter)
+            try:
+                while self._next_waiter() is not waiter:
+                    self._condition.wait(timeout=self._next_wakeup())
+            finally:
+                self._waiters.remove(waiter)
+
+            self._running_provider[provider] = self._running_provider.get(provider, 0) + 1
+            self._running_endpoint[(provider, endpoint)] = self._running_endpoint.get((provider, endpoint), 0) + 1
+            self._running_key[(provider, key_id)] = self._running_key.get((provider, key_id), 0) + 1
+            self._running_owner[owner] = self._running_owner.get(owner, 0) + 1
+            stats = self._provider_stats(provider)
+            stats["submitted"] += 1
+            stats["wait_seconds"] += time.time() - waiter["queued_at"]
+            # 其他等待者可能因公平排序变化而可以运行
+            self._condition.notify_all()
+        KeyPool.notify_start(key_id)
+        return SchedulerSlot(self, provider, endpoint, key_id, owner)
+
+    def release(self, slot):
+        """释放槽位并唤醒等待中的任务"""
+        with self._condition:
+            for counter, key in (
+                (self._running_provider, slot.provider),
+                (self._running_endpoint, (slot.provider, slot.endpoint)),
+                (self._running_key, (slot.provider, slot.key_id)),
+                (self._running_owner, slot.owner),
+            ):
+                counter[key] = counter.get(key, 1) - 1
+                if counter[key] <= 0:
+                    del counter[key]
+            self._provider_stats(slot.provider)["completed"] += 1
+            self._condition.notify_all()
+        KeyPool.notify_finish(slot.key_id)
+
+    @contextmanager
+    def slot(self, provider, endpoint, api_key, priority="interactive", owner=None):
+        """获取槽位的上下文管理器，并记录本次接口调用的耗时分解"""
+        with trace_call(provider, endpoint):
+            with phase("queue_wait"):
+                slot = self.acquire(provider, endpoint, api_key, priority, owner)
+            try:
+                yield slot
+            finally:
+                self.release(slot)
+
+    def report_rate_limited(self, provider, key_id, delay):
+        """记录限流，在冷却期内不再为该密钥调度新任务"""
+        with self._condition:
+            until = time.time() + delay
+            self._cooldown_until[(provider, key_id)] = max(self._cooldown_until.get((provider, key_id), 0), until)
+            self._provider_stats(provider)["rate_limited"] += 1
+            self._condition.notify_all()
+        KeyPool.notify_rate_limited(key_id)
+
+    def call_with_backoff(self, slot, func, *args, **kwargs):
+        """在槽位内调用提交接口，遇到限流错误时冷却密钥并按指数退避重试"""
+        for attempt in range(self._max_retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self._max_retries:
+                    KeyPool.notify_error(slot.key_id, e)
+                    raise
+                delay = min(self._base_backoff * (2 ** attempt), self._max_backoff)
+                print(f"{slot.provider} rate limited on {slot.endpoint}, retrying in {delay:.0f}s: {e}")
+                self.report_rate_limited(slot.provider, slot.key_id, delay)
+                time.sleep(delay)
+
+    def request_with_backoff(self, slot, func, *args, **kwargs):
+        """在槽位内发送HTTP请求，响应为429时冷却密钥并重试，返回最后一次响应"""
+        if "timeout" not in kwargs:
+            # 未指定超时时使用[transport]中的连接和读取超时
+            transport = CCConfig().get_transport_settings()
+            kwargs["timeout"] = (transport["connect_timeout"], transport["read_timeout"])
+        for attempt in range(self._max_retries + 1):
+            response = func(*args, **kwargs)
+            if response.status_code in (401, 402, 403):
+                KeyPool.notify_error(slot.key_id, f"status {response.status_code}: {response.text[:200]}")
+            if response.status_code != 429 or attempt == self._max_retries:
+                return response
+            delay = min(self._base_backoff * (2 ** attempt), self._max_backoff)
+            try:
+                delay = max(delay, float(response.headers.get("Retry-After", 0)))
+            except ValueError:
+                pass
+            print(f"{slot.provider} rate limited on {slot.endpoint}, retrying in {delay:.0f}s")
+            self.report_rate_limited(slot.provider, slot.key_id, delay)
+            time.sleep(delay)
+
+    def snapshot(self):
+        """获取调度器当前状态：运行数、排队数、冷却中的密钥和累计统计"""
+        with self._condition:
+            now = time.time()
+            providers = {}
+            for provider in set(self._running_provider) | {w["provider"] for w in self._waiters} | set(self._stats):
+                providers[provider] = {
+                    "limit": self._provider_limit(provider),
+                    "per_key_limit": self._key_limit(provider),
+                    "running": self._running_provider.get(provider, 0),
+                    "queued": {
+                        name: sum(1 for w in self._waiters if w["provider"] == provider and w["priority"] == value)
+                        for name, value in PRIORITY_NAMES.items()
+                    },
+                    "endpoints": {
+                        endpoint: count for (p, endpoint), count in self._running_endpoint.items() if p == provider
+                    },
+                    "keys": {
+                        key_id: count for (p, key_id), count in self._running_key.items() if p == provider
+                    },
+                    "cooldown": {
+                        key_id: round(until - now, 1)
+                        for (p, key_id), until in self._cooldown_until.items() if p == provider and until > now
+                    },
+                    "stats": dict(self._stats.get(provider, {})),
+                }
+            snapshot = {
+                "providers": providers,
+                "owners": dict(self._running_owner),
+                "queued_total": len(self._waiters),
+            }
+        snapshot["key_pools"] = KeyPool.snapshot_all()
+        return snapshot
+
+
+async def scheduler_snapshot(request):
+    """调度器状态查询接口"""
+    from aiohttp import web
+    return web.json_response(JobScheduler().snapshot())
+
+
+# API路由，由节点加载器注册
+ROUTES = [
+    ("GET", "/cc_api/scheduler", scheduler_snapshot),
+]
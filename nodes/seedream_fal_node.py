@@ -1,9 +1,12 @@
-from .cc_utils import ImageUtils, ResultProcessor
+from .cc_utils import ImageUtils, ResultProcessor, CCConfig
+from .scheduler import JobScheduler
+from .latency_tracker import LatencyTracker
+from .cache_utils import RequestCache
+from .metrics import count_bytes, phase
 import math
+import time
 import requests
 import json
-import os
-import configparser
 import io
 import numpy as np
 import torch
@@ -12,7 +15,7 @@ from PIL import Image
 
 class Seedream4Fal:
     # 用于存储请求缓存，防止重复请求
-    _request_cache = {}
+    _request_cache = RequestCache("Seedream4Fal")
     
     @classmethod
     def INPUT_TYPES(cls):
@@ -212,9 +215,10 @@ class Seedream4Fal:
         )
         
         # 检查缓存中是否已有相同请求的结果
-        if request_key in self._request_cache:
+        cached_result = self._request_cache.lookup(request_key)
+        if cached_result is not None:
             print(f"Using cached result for request with seed: {seed}")
-            return self._request_cache[request_key]
+            return cached_result
         
         # Convert image_size to the format expected by the API
         size = None
@@ -319,39 +323,12 @@ class Seedream4Fal:
             return error_result
     
     def get_fal_api_key(self):
-        """Get the FAL API key from config or environment variable."""
-        # 首先尝试从环境变量获取
-        if os.environ.get("FAL_API_KEY") is not None:
-            return os.environ["FAL_API_KEY"]
-        
-        # 然后尝试从配置文件获取
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-
-        config = configparser.ConfigParser()
-        config.read(config_path)
-
-        try:
-            if "fal" in config:
-                api_key = config["fal"]["API_KEY"]
-                # 检查是否是默认占位符
-                if api_key == "<your_fal_api_key_here>":
-                    print("WARNING: You are using the default FAL API key placeholder!")
-                    print("Please set your actual FAL API key in either:")
-                    print("1. The config.ini file under [fal] section")
-                    print("2. Or as an environment variable named FAL_API_KEY")
-                    return ""
-                return api_key
-            else:
-                print("FAL API key not found in config.ini")
-                return ""
-        except KeyError:
-            print("Error: FAL API_KEY not found in config.ini or environment variables")
-            return ""
+        """Get the FAL API key from the key pool, environment variable or config."""
+        return CCConfig().get_api_key("fal") or ""
     
     def call_fal_api(self, api_key, endpoint, payload):
         """Call FAL API and return result."""
+        start_time = time.time()
         try:
             # Make the API request
             headers = {
@@ -359,18 +336,23 @@ class Seedream4Fal:
                 "Authorization": f"Key {api_key}"
             }
             
-            response = requests.post(
-                endpoint,
-                headers=headers,
-                json=payload
-            )
+            with JobScheduler().slot("fal", endpoint.split("fal.run/")[-1], api_key) as slot:
+                response = slot.request(
+                    requests.post,
+                    endpoint,
+                    headers=headers,
+                    json=payload
+                )
             
             if response.status_code == 200:
+                LatencyTracker().record("seedream/fal", time.time() - start_time)
                 return response.json()
             else:
+                LatencyTracker().record("seedream/fal", time.time() - start_time, ok=False)
                 print(f"FAL API request failed with status {response.status_code}: {response.text}")
                 return None
         except Exception as e:
+            LatencyTracker().record("seedream/fal", time.time() - start_time, ok=False)
             print(f"Error calling FAL API: {str(e)}")
             return None
     
@@ -380,9 +362,11 @@ class Seedream4Fal:
             images = []
             for img_info in result["images"]:
                 if "url" in img_info:
-                    img_response = requests.get(img_info["url"])
-                    img = Image.open(io.BytesIO(img_response.content))
-                    img_array = np.array(img).astype(np.float32) / 255.0
+                    with phase("download"):
+                        img_response = count_bytes("download", requests.get(img_info["url"]))
+                    with phase("decode"):
+                        img = Image.open(io.BytesIO(img_response.content))
+                        img_array = np.array(img).astype(np.float32) / 255.0
                     images.append(img_array)
 
             if not images:
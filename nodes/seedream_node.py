@@ -1,10 +1,11 @@
 from .cc_utils import ApiHandler, ImageUtils, ResultProcessor, CCConfig
+from .cache_utils import RequestCache
 import math
 
 
 class Seedream4:
     # 用于存储请求缓存，防止重复请求
-    _request_cache = {}
+    _request_cache = RequestCache("Seedream4")
     
     @classmethod
     def INPUT_TYPES(cls):
@@ -229,9 +230,10 @@ class Seedream4:
         )
         
         # 检查缓存中是否已有相同请求的结果
-        if request_key in self._request_cache:
+        cached_result = self._request_cache.lookup(request_key)
+        if cached_result is not None:
             print(f"Using cached result for request with seed: {seed}")
-            return self._request_cache[request_key]
+            return cached_result
         
         # Convert image_size to the format expected by the API
         size = None
@@ -1,18 +1,23 @@
 import requests
 import json
-import os
-import configparser
 import io
 import numpy as np
 import torch
 from PIL import Image
 import math
+import time
 from .cc_utils import ImageUtils, ResultProcessor, CCConfig
+from .scheduler import JobScheduler
+from .latency_tracker import LatencyTracker
+from .cache_utils import RequestCache, SingleFlight, account_fingerprint, make_cache_key
+from .metrics import count_bytes, phase
 
 
 class Seedream4PPIO:
     # 用于存储请求缓存，防止重复请求
-    _request_cache = {}
+    _request_cache = RequestCache("Seedream4PPIO")
+    # 合并正在进行的相同请求，重复排队的提示词共享同一次提交
+    _single_flight = SingleFlight("Seedream4PPIO")
     
     @classmethod
     def INPUT_TYPES(cls):
@@ -138,38 +143,11 @@ class Seedream4PPIO:
     
     def get_ppio_api_key(self):
         """获取派欧云API密钥"""
-        # 首先尝试从环境变量获取
-        if os.environ.get("PPIO_API_KEY") is not None:
-            return os.environ["PPIO_API_KEY"]
-        
-        # 然后尝试从配置文件获取
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-
-        config = configparser.ConfigParser()
-        config.read(config_path)
-
-        try:
-            if "ppio" in config:
-                api_key = config["ppio"]["API_KEY"]
-                # 检查是否是默认占位符
-                if api_key == "<your_ppio_api_key_here>":
-                    print("WARNING: You are using the default PPIO API key placeholder!")
-                    print("Please set your actual PPIO API key in either:")
-                    print("1. The config.ini file under [ppio] section")
-                    print("2. Or as an environment variable named PPIO_API_KEY")
-                    return ""
-                return api_key
-            else:
-                print("PPIO API key not found in config.ini")
-                return ""
-        except KeyError:
-            print("Error: PPIO API_KEY not found in config.ini or environment variables")
-            return ""
+        return CCConfig().get_api_key("ppio") or ""
     
     def call_ppio_seedream_api(self, api_key, prompt, images, size, sequential_image_generation, max_images, watermark):
         """调用派欧云即梦4.0 API"""
+        start_time = time.time()
         try:
             # 准备请求数据
             payload = {
@@ -203,19 +181,24 @@ class Seedream4PPIO:
                 "Authorization": f"Bearer {api_key}"
             }
             
-            response = requests.post(
-                "https://api.ppinfra.com/v3/seedream-4.0",
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
+            with JobScheduler().slot("ppio", "seedream-4.0", api_key) as slot:
+                response = slot.request(
+                    requests.post,
+                    "https://api.ppinfra.com/v3/seedream-4.0",
+                    headers=headers,
+                    json=payload,
+                    timeout=60
+                )
             
             if response.status_code == 200:
+                LatencyTracker().record("seedream/ppio", time.time() - start_time)
                 return response.json()
             else:
+                LatencyTracker().record("seedream/ppio", time.time() - start_time, ok=False)
                 print(f"PPIO Seedream API request failed with status {response.status_code}: {response.text}")
                 return None
         except Exception as e:
+            LatencyTracker().record("seedream/ppio", time.time() - start_time, ok=False)
             print(f"Error calling PPIO Seedream API: {str(e)}")
             return None
 
@@ -242,14 +225,6 @@ class Seedream4PPIO:
         watermark=False,
         api_key=""
     ):
-        # 获取API密钥
-        if not api_key:
-            api_key = self.get_ppio_api_key()
-        
-        if not api_key:
-            print("Error: No PPIO API key provided")
-            return ResultProcessor.create_blank_image()
-        
         # 处理所有提供的图像
         image_urls = []
         reference_image = None
@@ -275,9 +250,10 @@ class Seedream4PPIO:
         )
         
         # 检查缓存中是否已有相同请求的结果
-        if request_key in self._request_cache:
+        cached_result = self._request_cache.lookup(request_key)
+        if cached_result is not None:
             print(f"Using cached result for request with seed: {seed}")
-            return self._request_cache[request_key]
+            return cached_result
         
         # 转换image_size为API期望的格式
         size = None
@@ -311,6 +287,29 @@ class Seedream4PPIO:
             }
             size = size_mapping.get(image_size, {"width": 2048, "height": 2048})
         
+        # 相同请求参数的请求正在进行时，等待并共享其结果。只有显式传入的密钥参与键计算，
+        # 密钥池中的密钥在执行请求时才选择，否则相同请求会因分到不同密钥而无法合并
+        flight_key = make_cache_key(account=account_fingerprint(api_key), request=request_key)
+        return self._single_flight.run(
+            flight_key, self._run_request, request_key, api_key, prompt, image_urls, size,
+            sequential_image_generation, max_images, watermark
+        )
+
+    def _run_request(self, request_key, api_key, prompt, image_urls, size, sequential_image_generation, max_images, watermark):
+        """提交请求并处理结果，结果写入请求缓存"""
+        # 等待槽位期间相同请求可能刚刚完成
+        cached_result = self._request_cache.get(request_key)
+        if cached_result is not None:
+            return cached_result
+
+        # 获取API密钥
+        if not api_key:
+            api_key = self.get_ppio_api_key()
+
+        if not api_key:
+            print("Error: No PPIO API key provided")
+            return ResultProcessor.create_blank_image()
+
         try:
             result = self.call_ppio_seedream_api(
                 api_key=api_key,
@@ -344,9 +343,11 @@ class Seedream4PPIO:
         try:
             images = []
             for img_url in result["images"]:
-                img_response = requests.get(img_url)
-                img = Image.open(io.BytesIO(img_response.content))
-                img_array = np.array(img).astype(np.float32) / 255.0
+                with phase("download"):
+                    img_response = count_bytes("download", requests.get(img_url))
+                with phase("decode"):
+                    img = Image.open(io.BytesIO(img_response.content))
+                    img_array = np.array(img).astype(np.float32) / 255.0
                 images.append(img_array)
 
             if not images:
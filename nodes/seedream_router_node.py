@@ -0,0 +1,353 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .cc_utils import ApiHandler, ImageUtils, ResultProcessor, CCConfig
+from .latency_tracker import LatencyTracker
+from .cache_utils import RequestCache
+from .metrics import in_child_trace
+from .seedream_node import Seedream4
+from .seedream_ppio_node import Seedream4PPIO
+from .seedream_fal_node import Seedream4Fal
+
+
+# 可路由的服务商，对应各节点记录耗时使用的名称
+PROVIDERS = {
+    "ark": "seedream/ark",
+    "ppio": "seedream/ppio",
+    "fal": "seedream/fal",
+}
+
+# 没有耗时统计时的默认对冲等待时间（秒）
+DEFAULT_HEDGE_DELAY = 30.0
+
+
+class Seedream4Router:
+    """即梦4.0智能路由：在火山引擎、派欧云和fal之间选择当前最快的服务商
+
+    根据各服务商近期的p50/p95耗时和错误率排序；启用对冲时，主请求超过阈值仍未返回
+    会向下一个服务商发出相同请求，采用最先返回的结果。
+    """
+
+    # 用于存储请求缓存，防止重复请求
+    _request_cache = RequestCache("Seedream4Router")
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "prompt": ("STRING", {"default": "", "multiline": True}),
+                "image_size": (
+                    [
+                        "16:9 (2560x1440)",  # 16_9
+                        "3:2 (2496x1664)",   # 3_2
+                        "4:3 (2304x1728)",   # 4_3
+                        "1:1 (2048x2048)",   # 1_1
+                        "3:4 (1728x2304)",   # 3_4
+                        "2:3 (1664x2496)",   # 2_3
+                        "9:16 (1440x2560)",  # 9_16
+                        "跟随参考",  # follow_reference
+                        "自定义",  # custom
+                    ],
+                    {"default": "1:1 (2048x2048)"},
+                ),
+                "width": (
+                    "INT",
+                    {"default": 2048, "min": 1024, "max": 4096, "step": 16},
+                ),
+                "height": (
+                    "INT",
+                    {"default": 2048, "min": 1024, "max": 4096, "step": 16},
+                ),
+                "seed": (
+                    "INT",
+                    {"default": -1, "min": -1, "max": 2147483647},
+                ),
+                "max_images": ("INT", {"default": 1, "min": 1, "max": 6}),
+                "routing": (["fastest", "ark", "ppio", "fal"], {"default": "fastest"}),
+                "enable_hedging": ("BOOLEAN", {"default": True, "label_on": "启用", "label_off": "禁用"}),
+                "hedge_delay": ("FLOAT", {"default": 0.0, "min": 0.0, "max": 300.0, "step": 1.0}),
+            },
+            "optional": {
+                "image_1": ("IMAGE",),
+                "image_2": ("IMAGE",),
+                "image_3": ("IMAGE",),
+                "image_4": ("IMAGE",),
+                "image_5": ("IMAGE",),
+                "image_6": ("IMAGE",),
+                "image_7": ("IMAGE",),
+                "image_8": ("IMAGE",),
+                "image_9": ("IMAGE",),
+                "image_10": ("IMAGE",),
+                "sequential_image_generation": ("BOOLEAN", {"default": False, "label_on": "启用", "label_off": "禁用"}),
+                "use_ark": ("BOOLEAN", {"default": True, "label_on": "启用", "label_off": "禁用"}),
+                "use_ppio": ("BOOLEAN", {"default": True, "label_on": "启用", "label_off": "禁用"}),
+                "use_fal": ("BOOLEAN", {"default": True, "label_on": "启用", "label_off": "禁用"}),
+            },
+        }
+
+    RETURN_TYPES = ("IMAGE", "STRING")
+    RETURN_NAMES = ("image", "provider")
+    FUNCTION = "generate_image"
+    CATEGORY = "CC-API/Image"
+
+    # 预设尺寸映射
+    SIZE_MAPPING = {
+        "16:9 (2560x1440)": (2560, 1440),
+        "3:2 (2496x1664)": (2496, 1664),
+        "4:3 (2304x1728)": (2304, 1728),
+        "1:1 (2048x2048)": (2048, 2048),
+        "3:4 (1728x2304)": (1728, 2304),
+        "2:3 (1664x2496)": (1664, 2496),
+        "9:16 (1440x2560)": (1440, 2560),
+    }
+
+    @staticmethod
+    def get_provider_keys():
+        """获取各服务商的API密钥，未配置的服务商不参与路由"""
+        keys = {
+            "ark": CCConfig().get_key(),
+            "ppio": Seedream4PPIO().get_ppio_api_key(),
+            "fal": Seedream4Fal().get_fal_api_key(),
+        }
+        return {provider: key for provider, key in keys.items() if key and not key.startswith("<")}
+
+    def resolve_size(self, image_size, width, height, reference_image):
+        """将尺寸选项转换为(宽, 高)"""
+        if image_size == "自定义":
+            return width, height
+        if image_size == "跟随参考":
+            if reference_image is None:
+                print("No reference image found, using default size: 2048x2048")
+                return 2048, 2048
+            ref_width, ref_height = reference_image.size
+            size = Seedream4.calculate_optimal_size(ref_width, ref_height)
+            print(f"Following reference image size: {size} (original: {ref_width}x{ref_height})")
+            size_width, size_height = size.split("x")
+            return int(size_width), int(size_height)
+        return self.SIZE_MAPPING.get(image_size, (2048, 2048))
+
+    def build_attempt(self, provider, api_key, prompt, images, size, seed, sequential_image_generation, max_images):
+        """创建调用指定服务商的函数，成功时返回图像结果，失败时返回None"""
+        width, height = size
+
+        def call_ark():
+            result = ApiHandler.call_seedream_api(
+                api_key=api_key,
+                prompt=prompt,
+                images=images,
+                size=f"{width}x{height}",
+                sequential_image_generation="auto" if sequential_image_generation else "disabled",
+                max_images=max_images
+            )
+            return ResultProcessor.process_image_result(result) if result else None
+
+        def call_ppio():
+            node = Seedream4PPIO()
+            result = node.call_ppio_seedream_api(
+                api_key=api_key,
+                prompt=prompt,
+                images=images,
+                size={"width": width, "height": height},
+                sequential_image_generation=sequential_image_generation,
+                max_images=max_images,
+                watermark=False
+            )
+            return node.process_ppio_result(result) if result else None
+
+        def call_fal():
+            node = Seedream4Fal()
+            payload = {
+                "prompt": prompt,
+                "image_size": {"width": width, "height": height},
+                "num_images": 1,
+                "max_images": max_images if sequential_image_generation else 1,
+                "enable_safety_checker": False,
+                "sync_mode": False
+            }
+            if images:
+                payload["image_urls"] = images
+                endpoint = "https://fal.run/fal-ai/bytedance/seedream/v4/edit"
+            else:
+                endpoint = "https://fal.run/fal-ai/bytedance/seedream/v4/text-to-image"
+            if seed != -1:
+                payload["seed"] = seed
+            result = node.call_fal_api(api_key=api_key, endpoint=endpoint, payload=payload)
+            return node.process_fal_result(result) if result else None
+
+        return {"ark": call_ark, "ppio": call_ppio, "fal": call_fal}[provider]
+
+    def rank_providers(self, routing, providers):
+        """确定尝试顺序：fastest按近期耗时排序，指定服务商时优先使用该服务商"""
+        tracker = LatencyTracker()
+        names = tracker.rank([PROVIDERS[provider] for provider in providers])
+        ranked = [provider for name in names for provider in providers if PROVIDERS[provider] == name]
+        if routing in ranked:
+            ranked.remove(routing)
+            ranked.insert(0, routing)
+        return ranked
+
+    def get_hedge_delay(self, provider, hedge_delay):
+        """对冲等待时间：未设置时使用主服务商近期的p95耗时"""
+        if hedge_delay > 0:
+            return hedge_delay
+        p95 = LatencyTracker().stats(PROVIDERS[provider])["p95"]
+        return p95 if p95 is not None else DEFAULT_HEDGE_DELAY
+
+    def run_attempts(self, attempts, enable_hedging, hedge_delay):
+        """依次或对冲地执行请求，返回(结果, 服务商)；全部失败返回(None, None)
+
+        主请求失败时立即切换到下一个服务商；启用对冲时最多同时进行两个请求，
+        未被采用的请求在后台完成，其耗时仍会被记录。
+        """
+        queue = list(attempts)
+        pending = {}
+        executor = ThreadPoolExecutor(max_workers=len(queue))
+
+        def launch(reason):
+            provider, func = queue.pop(0)
+            print(f"Seedream router: sending request to {provider} ({reason})")
+            # 每个服务商的请求在工作线程中记录为节点trace的子trace
+            pending[executor.submit(in_child_trace(func, provider))] = provider
+
+        try:
+            launch("primary")
+            while pending:
+                timeout = None
+                if enable_hedging and queue and len(pending) < 2:
+                    timeout = self.get_hedge_delay(list(pending.values())[0], hedge_delay)
+                done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # 主请求超过阈值仍未返回，向下一个服务商发出对冲请求
+                    launch(f"hedge after {timeout:.1f}s")
+                    continue
+                for future in done:
+                    provider = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        print(f"Seedream router: {provider} raised an error: {str(e)}")
+                        result = None
+                    if result is not None:
+                        return result, provider
+                    print(f"Seedream router: {provider} failed")
+                if queue and not pending:
+                    launch("failover")
+            return None, None
+        finally:
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def _generate_request_key(prompt, image_size, width, height, seed, max_images,
+                              sequential_image_generation, providers, image_urls):
+        """生成请求的唯一键，用于缓存判断"""
+        key_parts = [
+            str(prompt),
+            str(image_size),
+            str(width),
+            str(height),
+            str(seed),
+            str(max_images),
+            str(sequential_image_generation),
+            ",".join(providers)
+        ]
+        if image_urls:
+            key_parts.extend(image_urls)
+        return "|".join(key_parts)
+
+    def generate_image(
+        self,
+        prompt,
+        image_size,
+        width,
+        height,
+        seed,
+        max_images,
+        routing,
+        enable_hedging,
+        hedge_delay,
+        image_1=None,
+        image_2=None,
+        image_3=None,
+        image_4=None,
+        image_5=None,
+        image_6=None,
+        image_7=None,
+        image_8=None,
+        image_9=None,
+        image_10=None,
+        sequential_image_generation=False,
+        use_ark=True,
+        use_ppio=True,
+        use_fal=True
+    ):
+        enabled = {"ark": use_ark, "ppio": use_ppio, "fal": use_fal}
+        keys = {provider: key for provider, key in self.get_provider_keys().items() if enabled[provider]}
+        if not keys:
+            print("Error: No API key configured for any enabled Seedream provider")
+            return ResultProcessor.create_blank_image() + ("",)
+
+        # 处理所有提供的图像
+        image_urls = []
+        reference_image = None
+        for i, img in enumerate([image_1, image_2, image_3, image_4, image_5,
+                                 image_6, image_7, image_8, image_9, image_10], 1):
+            if img is not None:
+                pil_image = ImageUtils.tensor_to_pil(img)
+                if pil_image:
+                    img_base64 = ImageUtils.pil_to_base64(pil_image)
+                    if img_base64:
+                        image_urls.append(img_base64)
+                        # 保存第一张图片作为参考
+                        if i == 1:
+                            reference_image = pil_image
+                else:
+                    print(f"Error: Failed to process image {i} for Seedream 4.0 (router)")
+
+        request_key = self._generate_request_key(
+            prompt, image_size, width, height, seed, max_images,
+            sequential_image_generation, sorted(keys), image_urls
+        )
+        cached_result = self._request_cache.lookup(request_key)
+        if cached_result is not None:
+            print(f"Using cached result for request with seed: {seed}")
+            return cached_result
+
+        size = self.resolve_size(image_size, width, height, reference_image)
+        providers = self.rank_providers(routing, list(keys))
+        attempts = [
+            (provider, self.build_attempt(
+                provider, keys[provider], prompt, image_urls or None, size, seed,
+                sequential_image_generation, max_images
+            ))
+            for provider in providers
+        ]
+
+        result, provider = self.run_attempts(attempts, enable_hedging, hedge_delay)
+        if result is None:
+            print("Error: All Seedream providers failed")
+            return ResultProcessor.create_blank_image() + ("",)
+
+        print(f"Seedream router: using result from {provider}")
+        output = result + (provider,)
+        self._request_cache[request_key] = output
+        return output
+
+
+async def latency_snapshot(request):
+    """服务商耗时统计查询接口"""
+    from aiohttp import web
+    return web.json_response(LatencyTracker().snapshot())
+
+
+# API路由，由节点加载器注册
+ROUTES = [
+    ("GET", "/cc_api/latency", latency_snapshot),
+]
+
+
+NODE_CLASS_MAPPINGS = {
+    "Seedream4Router": Seedream4Router,
+}
+
+NODE_DISPLAY_NAME_MAPPINGS = {
+    "Seedream4Router": "即梦4.0 (智能路由)",
+}
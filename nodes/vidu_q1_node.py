@@ -1,4 +1,3 @@
-import os
 import requests
 import time
 import torch
@@ -11,6 +10,9 @@ import asyncio
 import aiohttp
 from typing import List, Optional, Union
 from .cc_utils import CCConfig, ImageUtils, ResultProcessor
+from .ppio_utils import parse_prompt_list, parse_seed_list, split_image_batch, expand_batch_jobs, run_batch_video_tasks, detach_task
+from .scheduler import JobScheduler
+from .metrics import count_bytes, phase, timed_phase, traced_polling, traced_task_query
 
 # 尝试导入ComfyUI的视频处理模块
 try:
@@ -44,44 +46,21 @@ class ViduQ1Node:
                 "image_5": ("IMAGE",),
                 "image_6": ("IMAGE",),
                 "image_7": ("IMAGE",),
+                "detach": ("BOOLEAN", {"default": False, "tooltip": "提交任务后立即返回task_id，不等待视频生成；用“派欧云收集视频任务”节点获取视频"}),
             }
         }
 
-    RETURN_TYPES = ("VIDEO",) if HAS_COMFY_VIDEO else ("STRING",)
-    RETURN_NAMES = ("video",) if HAS_COMFY_VIDEO else ("video_url",)
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("video", "task_id") if HAS_COMFY_VIDEO else ("video_url", "task_id")
     FUNCTION = "generate_video"
     CATEGORY = "CC-API/Video"
     OUTPUT_NODE = False
 
     def get_api_key(self, provided_key=""):
-        """获取API密钥，优先级：参数 > 环境变量 > 配置文件"""
-        # 首先检查传入的参数
-        if provided_key:
-            return provided_key
-        
-        # 然后检查环境变量
-        env_var_name = "PIOYUN_API_KEY"
-        if os.environ.get(env_var_name) is not None:
-            return os.environ[env_var_name]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            config.read(config_path)
-            
-            try:
-                if "ppio" in config and "API_KEY" in config["ppio"]:
-                    return config["ppio"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        """获取API密钥，优先级：参数 > 密钥池 > 环境变量 > 配置文件"""
+        return CCConfig().get_api_key("ppio", provided_key)
 
+    @timed_phase("encode", upload=True)
     def tensor_to_base64(self, image_tensor):
         """将ComfyUI图像张量转换为base64字符串"""
         try:
@@ -145,6 +124,7 @@ class ViduQ1Node:
         except Exception as e:
             raise Exception(f"Error calling Vidu Q1 API: {str(e)}")
 
+    @traced_task_query
     def query_task_result(self, api_key, task_id):
         """查询任务结果"""
         try:
@@ -172,6 +152,7 @@ class ViduQ1Node:
         except Exception as e:
             raise Exception(f"Error querying task result: {str(e)}")
 
+    @traced_polling
     def poll_task_result(self, api_key, task_id, poll_interval=5, max_attempts=120):
         """轮询任务结果直到完成或失败"""
         for attempt in range(max_attempts):
@@ -265,7 +246,8 @@ class ViduQ1Node:
         image_4=None,
         image_5=None,
         image_6=None,
-        image_7=None
+        image_7=None,
+        detach=False
     ):
         """生成视频"""
         # 获取API密钥
@@ -303,21 +285,26 @@ class ViduQ1Node:
         try:
             # 调用API生成视频
             print("Calling Vidu Q1 API...")
-            task_id = self.call_vidu_q1_api(
-                api_key=api_key,
-                images=image_urls,
-                prompt=prompt,
-                aspect_ratio=aspect_ratio,
-                seed=seed if seed != -1 else None,
-                movement_amplitude=movement_amplitude,
-                bgm=bgm
-            )
+            # 通过全局调度器限制并发任务数，任务完成后释放槽位
+            with JobScheduler().slot("ppio", "vidu-q1-reference2video", api_key) as slot:
+                task_id = slot.call(
+                    self.call_vidu_q1_api,
+                    api_key=api_key,
+                    images=image_urls,
+                    prompt=prompt,
+                    aspect_ratio=aspect_ratio,
+                    seed=seed if seed != -1 else None,
+                    movement_amplitude=movement_amplitude,
+                    bgm=bgm
+                )
             
-            print(f"Task submitted with ID: {task_id}")
+                print(f"Task submitted with ID: {task_id}")
+                if detach:
+                    return detach_task(api_key, task_id, self.__class__.__name__, "vidu-q1-reference2video")
             
-            # 轮询任务结果
-            print("Waiting for video generation to complete...")
-            video_url = self.poll_task_result(api_key, task_id)
+                # 轮询任务结果
+                print("Waiting for video generation to complete...")
+                video_url = self.poll_task_result(api_key, task_id)
             
             print(f"Video generated successfully: {video_url}")
             
@@ -326,16 +313,18 @@ class ViduQ1Node:
                 # 使用同步方式下载视频，避免事件循环冲突
                 try:
                     import urllib.request
-                    video_io = io.BytesIO(urllib.request.urlopen(video_url).read())
-                    video_output = VideoFromFile(video_io)
-                    return (video_output,)
+                    with phase("download"):
+                        video_io = io.BytesIO(count_bytes("download", urllib.request.urlopen(video_url).read()))
+                    with phase("decode"):
+                        video_output = VideoFromFile(video_io)
+                    return (video_output, task_id)
                 except Exception as e:
                     print(f"Error downloading video synchronously: {str(e)}")
                     # 如果同步下载失败，回退到返回URL
-                    return (video_url,)
+                    return (video_url, task_id)
             else:
                 # 否则返回URL字符串
-                return (video_url,)
+                return (video_url, task_id)
             
         except Exception as e:
             print(f"Error generating video: {str(e)}")
@@ -356,44 +345,23 @@ class ViduQ1StartEndNode:
                 "movement_amplitude": (["auto", "small", "medium", "large"], {"default": "auto"}),
                 "bgm": ("BOOLEAN", {"default": False, "label_on": "启用", "label_off": "禁用"}),
                 "api_key": ("STRING", {"default": ""}),
+            },
+            "optional": {
+                "detach": ("BOOLEAN", {"default": False, "tooltip": "提交任务后立即返回task_id，不等待视频生成；用“派欧云收集视频任务”节点获取视频"}),
             }
         }
 
-    RETURN_TYPES = ("VIDEO",) if HAS_COMFY_VIDEO else ("STRING",)
-    RETURN_NAMES = ("video",) if HAS_COMFY_VIDEO else ("video_url",)
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("video", "task_id") if HAS_COMFY_VIDEO else ("video_url", "task_id")
     FUNCTION = "generate_video"
     CATEGORY = "CC-API/Video"
     OUTPUT_NODE = False
 
     def get_api_key(self, provided_key=""):
-        """获取API密钥，优先级：参数 > 环境变量 > 配置文件"""
-        # 首先检查传入的参数
-        if provided_key:
-            return provided_key
-        
-        # 然后检查环境变量
-        env_var_name = "PIOYUN_API_KEY"
-        if os.environ.get(env_var_name) is not None:
-            return os.environ[env_var_name]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            config.read(config_path)
-            
-            try:
-                if "ppio" in config and "API_KEY" in config["ppio"]:
-                    return config["ppio"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        """获取API密钥，优先级：参数 > 密钥池 > 环境变量 > 配置文件"""
+        return CCConfig().get_api_key("ppio", provided_key)
 
+    @timed_phase("encode", upload=True)
     def tensor_to_base64(self, image_tensor):
         """将ComfyUI图像张量转换为base64字符串"""
         try:
@@ -475,6 +443,7 @@ class ViduQ1StartEndNode:
         except Exception as e:
             raise Exception(f"Error calling Vidu Q1 Start-End API: {str(e)}")
 
+    @traced_task_query
     def query_task_result(self, api_key, task_id):
         """查询任务结果"""
         try:
@@ -502,6 +471,7 @@ class ViduQ1StartEndNode:
         except Exception as e:
             raise Exception(f"Error querying task result: {str(e)}")
 
+    @traced_polling
     def poll_task_result(self, api_key, task_id, poll_interval=5, max_attempts=120):
         """轮询任务结果直到完成或失败"""
         for attempt in range(max_attempts):
@@ -566,7 +536,8 @@ class ViduQ1StartEndNode:
         seed,
         movement_amplitude,
         bgm,
-        api_key=""
+        api_key="",
+        detach=False
     ):
         """生成首尾帧视频"""
         # 获取API密钥
@@ -601,20 +572,25 @@ class ViduQ1StartEndNode:
         try:
             # 调用API生成视频
             print("Calling Vidu Q1 Start-End API...")
-            task_id = self.call_vidu_q1_start_end_api(
-                api_key=api_key,
-                images=image_urls,
-                prompt=prompt,
-                seed=seed if seed != -1 else None,
-                movement_amplitude=movement_amplitude,
-                bgm=bgm
-            )
+            # 通过全局调度器限制并发任务数，任务完成后释放槽位
+            with JobScheduler().slot("ppio", "vidu-q1-startend2video", api_key) as slot:
+                task_id = slot.call(
+                    self.call_vidu_q1_start_end_api,
+                    api_key=api_key,
+                    images=image_urls,
+                    prompt=prompt,
+                    seed=seed if seed != -1 else None,
+                    movement_amplitude=movement_amplitude,
+                    bgm=bgm
+                )
             
-            print(f"Task submitted with ID: {task_id}")
+                print(f"Task submitted with ID: {task_id}")
+                if detach:
+                    return detach_task(api_key, task_id, self.__class__.__name__, "vidu-q1-startend2video")
             
-            # 轮询任务结果
-            print("Waiting for video generation to complete...")
-            video_url = self.poll_task_result(api_key, task_id)
+                # 轮询任务结果
+                print("Waiting for video generation to complete...")
+                video_url = self.poll_task_result(api_key, task_id)
             
             print(f"Video generated successfully: {video_url}")
             
@@ -623,16 +599,18 @@ class ViduQ1StartEndNode:
                 # 使用同步方式下载视频，避免事件循环冲突
                 try:
                     import urllib.request
-                    video_io = io.BytesIO(urllib.request.urlopen(video_url).read())
-                    video_output = VideoFromFile(video_io)
-                    return (video_output,)
+                    with phase("download"):
+                        video_io = io.BytesIO(count_bytes("download", urllib.request.urlopen(video_url).read()))
+                    with phase("decode"):
+                        video_output = VideoFromFile(video_io)
+                    return (video_output, task_id)
                 except Exception as e:
                     print(f"Error downloading video synchronously: {str(e)}")
                     # 如果同步下载失败，回退到返回URL
-                    return (video_url,)
+                    return (video_url, task_id)
             else:
                 # 否则返回URL字符串
-                return (video_url,)
+                return (video_url, task_id)
             
         except Exception as e:
             print(f"Error generating video: {str(e)}")
@@ -652,44 +630,23 @@ class ViduQ1Img2VideoNode:
                 "movement_amplitude": (["auto", "small", "medium", "large"], {"default": "auto"}),
                 "bgm": ("BOOLEAN", {"default": False, "label_on": "启用", "label_off": "禁用"}),
                 "api_key": ("STRING", {"default": ""}),
+            },
+            "optional": {
+                "detach": ("BOOLEAN", {"default": False, "tooltip": "提交任务后立即返回task_id，不等待视频生成；用“派欧云收集视频任务”节点获取视频"}),
             }
         }
 
-    RETURN_TYPES = ("VIDEO",) if HAS_COMFY_VIDEO else ("STRING",)
-    RETURN_NAMES = ("video",) if HAS_COMFY_VIDEO else ("video_url",)
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("video", "task_id") if HAS_COMFY_VIDEO else ("video_url", "task_id")
     FUNCTION = "generate_video"
     CATEGORY = "CC-API/Video"
     OUTPUT_NODE = False
 
     def get_api_key(self, provided_key=""):
-        """获取API密钥，优先级：参数 > 环境变量 > 配置文件"""
-        # 首先检查传入的参数
-        if provided_key:
-            return provided_key
-        
-        # 然后检查环境变量
-        env_var_name = "PIOYUN_API_KEY"
-        if os.environ.get(env_var_name) is not None:
-            return os.environ[env_var_name]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            config.read(config_path)
-            
-            try:
-                if "ppio" in config and "API_KEY" in config["ppio"]:
-                    return config["ppio"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        """获取API密钥，优先级：参数 > 密钥池 > 环境变量 > 配置文件"""
+        return CCConfig().get_api_key("ppio", provided_key)
 
+    @timed_phase("encode", upload=True)
     def tensor_to_base64(self, image_tensor):
         """将ComfyUI图像张量转换为base64字符串"""
         try:
@@ -769,6 +726,7 @@ class ViduQ1Img2VideoNode:
         except Exception as e:
             raise Exception(f"Error calling Vidu Q1 Img2Video API: {str(e)}")
 
+    @traced_task_query
     def query_task_result(self, api_key, task_id):
         """查询任务结果"""
         try:
@@ -796,6 +754,7 @@ class ViduQ1Img2VideoNode:
         except Exception as e:
             raise Exception(f"Error querying task result: {str(e)}")
 
+    @traced_polling
     def poll_task_result(self, api_key, task_id, poll_interval=5, max_attempts=120):
         """轮询任务结果直到完成或失败"""
         for attempt in range(max_attempts):
@@ -859,7 +818,8 @@ class ViduQ1Img2VideoNode:
         seed,
         movement_amplitude,
         bgm,
-        api_key=""
+        api_key="",
+        detach=False
     ):
         """生成图生视频"""
         # 获取API密钥
@@ -888,20 +848,25 @@ class ViduQ1Img2VideoNode:
         try:
             # 调用API生成视频
             print("Calling Vidu Q1 Img2Video API...")
-            task_id = self.call_vidu_q1_img2video_api(
-                api_key=api_key,
-                image=base64_img,
-                prompt=prompt,
-                seed=seed if seed != -1 else None,
-                movement_amplitude=movement_amplitude,
-                bgm=bgm
-            )
+            # 通过全局调度器限制并发任务数，任务完成后释放槽位
+            with JobScheduler().slot("ppio", "vidu-q1-img2video", api_key) as slot:
+                task_id = slot.call(
+                    self.call_vidu_q1_img2video_api,
+                    api_key=api_key,
+                    image=base64_img,
+                    prompt=prompt,
+                    seed=seed if seed != -1 else None,
+                    movement_amplitude=movement_amplitude,
+                    bgm=bgm
+                )
             
-            print(f"Task submitted with ID: {task_id}")
+                print(f"Task submitted with ID: {task_id}")
+                if detach:
+                    return detach_task(api_key, task_id, self.__class__.__name__, "vidu-q1-img2video")
             
-            # 轮询任务结果
-            print("Waiting for video generation to complete...")
-            video_url = self.poll_task_result(api_key, task_id)
+                # 轮询任务结果
+                print("Waiting for video generation to complete...")
+                video_url = self.poll_task_result(api_key, task_id)
             
             print(f"Video generated successfully: {video_url}")
             
@@ -910,16 +875,18 @@ class ViduQ1Img2VideoNode:
                 # 使用同步方式下载视频，避免事件循环冲突
                 try:
                     import urllib.request
-                    video_io = io.BytesIO(urllib.request.urlopen(video_url).read())
-                    video_output = VideoFromFile(video_io)
-                    return (video_output,)
+                    with phase("download"):
+                        video_io = io.BytesIO(count_bytes("download", urllib.request.urlopen(video_url).read()))
+                    with phase("decode"):
+                        video_output = VideoFromFile(video_io)
+                    return (video_output, task_id)
                 except Exception as e:
                     print(f"Error downloading video synchronously: {str(e)}")
                     # 如果同步下载失败，回退到返回URL
-                    return (video_url,)
+                    return (video_url, task_id)
             else:
                 # 否则返回URL字符串
-                return (video_url,)
+                return (video_url, task_id)
             
         except Exception as e:
             print(f"Error generating video: {str(e)}")
@@ -940,43 +907,21 @@ class ViduQ1Text2VideoNode:
                 "movement_amplitude": (["auto", "small", "medium", "large"], {"default": "auto"}),
                 "bgm": ("BOOLEAN", {"default": False, "label_on": "启用", "label_off": "禁用"}),
                 "api_key": ("STRING", {"default": ""}),
+            },
+            "optional": {
+                "detach": ("BOOLEAN", {"default": False, "tooltip": "提交任务后立即返回task_id，不等待视频生成；用“派欧云收集视频任务”节点获取视频"}),
             }
         }
 
-    RETURN_TYPES = ("VIDEO",) if HAS_COMFY_VIDEO else ("STRING",)
-    RETURN_NAMES = ("video",) if HAS_COMFY_VIDEO else ("video_url",)
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("video", "task_id") if HAS_COMFY_VIDEO else ("video_url", "task_id")
     FUNCTION = "generate_video"
     CATEGORY = "CC-API/Video"
     OUTPUT_NODE = False
 
     def get_api_key(self, provided_key=""):
-        """获取API密钥，优先级：参数 > 环境变量 > 配置文件"""
-        # 首先检查传入的参数
-        if provided_key:
-            return provided_key
-        
-        # 然后检查环境变量
-        env_var_name = "PIOYUN_API_KEY"
-        if os.environ.get(env_var_name) is not None:
-            return os.environ[env_var_name]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            config.read(config_path)
-            
-            try:
-                if "ppio" in config and "API_KEY" in config["ppio"]:
-                    return config["ppio"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        """获取API密钥，优先级：参数 > 密钥池 > 环境变量 > 配置文件"""
+        return CCConfig().get_api_key("ppio", provided_key)
 
     def call_vidu_q1_text2video_api(self, api_key, prompt, style, aspect_ratio, seed, movement_amplitude, bgm):
         """调用Vidu Q1文生视频API"""
@@ -1023,6 +968,7 @@ class ViduQ1Text2VideoNode:
         except Exception as e:
             raise Exception(f"Error calling Vidu Q1 Text2Video API: {str(e)}")
 
+    @traced_task_query
     def query_task_result(self, api_key, task_id):
         """查询任务结果"""
         try:
@@ -1050,6 +996,7 @@ class ViduQ1Text2VideoNode:
         except Exception as e:
             raise Exception(f"Error querying task result: {str(e)}")
 
+    @traced_polling
     def poll_task_result(self, api_key, task_id, poll_interval=5, max_attempts=120):
         """轮询任务结果直到完成或失败"""
         for attempt in range(max_attempts):
@@ -1114,7 +1061,8 @@ class ViduQ1Text2VideoNode:
         seed,
         movement_amplitude,
         bgm,
-        api_key=""
+        api_key="",
+        detach=False
     ):
         """生成文生视频"""
         # 获取API密钥
@@ -1129,21 +1077,26 @@ class ViduQ1Text2VideoNode:
         try:
             # 调用API生成视频
             print("Calling Vidu Q1 Text2Video API...")
-            task_id = self.call_vidu_q1_text2video_api(
-                api_key=api_key,
-                prompt=prompt,
-                style=style,
-                aspect_ratio=aspect_ratio,
-                seed=seed if seed != -1 else None,
-                movement_amplitude=movement_amplitude,
-                bgm=bgm
-            )
+            # 通过全局调度器限制并发任务数，任务完成后释放槽位
+            with JobScheduler().slot("ppio", "vidu-q1-text2video", api_key) as slot:
+                task_id = slot.call(
+                    self.call_vidu_q1_text2video_api,
+                    api_key=api_key,
+                    prompt=prompt,
+                    style=style,
+                    aspect_ratio=aspect_ratio,
+                    seed=seed if seed != -1 else None,
+                    movement_amplitude=movement_amplitude,
+                    bgm=bgm
+                )
             
-            print(f"Task submitted with ID: {task_id}")
+                print(f"Task submitted with ID: {task_id}")
+                if detach:
+                    return detach_task(api_key, task_id, self.__class__.__name__, "vidu-q1-text2video")
             
-            # 轮询任务结果
-            print("Waiting for video generation to complete...")
-            video_url = self.poll_task_result(api_key, task_id)
+                # 轮询任务结果
+                print("Waiting for video generation to complete...")
+                video_url = self.poll_task_result(api_key, task_id)
             
             print(f"Video generated successfully: {video_url}")
             
@@ -1152,27 +1105,103 @@ class ViduQ1Text2VideoNode:
                 # 使用同步方式下载视频，避免事件循环冲突
                 try:
                     import urllib.request
-                    video_io = io.BytesIO(urllib.request.urlopen(video_url).read())
-                    video_output = VideoFromFile(video_io)
-                    return (video_output,)
+                    with phase("download"):
+                        video_io = io.BytesIO(count_bytes("download", urllib.request.urlopen(video_url).read()))
+                    with phase("decode"):
+                        video_output = VideoFromFile(video_io)
+                    return (video_output, task_id)
                 except Exception as e:
                     print(f"Error downloading video synchronously: {str(e)}")
                     # 如果同步下载失败，回退到返回URL
-                    return (video_url,)
+                    return (video_url, task_id)
             else:
                 # 否则返回URL字符串
-                return (video_url,)
+                return (video_url, task_id)
             
         except Exception as e:
             print(f"Error generating video: {str(e)}")
             raise ValueError(f"Video generation failed: {str(e)}")
 
 
+class ViduQ1BatchVideoNode:
+    """Vidu Q1 批量视频节点 (派欧云)，提供图像时为图生视频，否则为文生视频"""
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "prompts": ("STRING", {"default": "", "multiline": True, "tooltip": "每行一个提示词，每行生成一个视频"}),
+                "style": (["general", "anime"], {"default": "general", "tooltip": "仅文生视频使用"}),
+                "aspect_ratio": (["16:9", "9:16", "1:1"], {"default": "16:9", "tooltip": "仅文生视频使用"}),
+                "movement_amplitude": (["auto", "small", "medium", "large"], {"default": "auto"}),
+                "bgm": ("BOOLEAN", {"default": False, "label_on": "启用", "label_off": "禁用"}),
+                "seeds": ("STRING", {"default": "", "tooltip": "种子列表，用逗号分隔；为空表示随机，只填一个则所有任务共用"}),
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 16, "tooltip": "同时提交的最大任务数"}),
+                "api_key": ("STRING", {"default": ""}),
+            },
+            "optional": {
+                "images": ("IMAGE", {"tooltip": "可选的首帧图像批次，提供时使用图生视频；单张图像会用于所有任务"}),
+            }
+        }
+
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("videos", "task_ids") if HAS_COMFY_VIDEO else ("video_urls", "task_ids")
+    OUTPUT_IS_LIST = (True, True)
+    FUNCTION = "generate_videos"
+    CATEGORY = "CC-API/Video"
+    OUTPUT_NODE = False
+
+    def generate_videos(
+        self,
+        prompts,
+        style,
+        aspect_ratio,
+        movement_amplitude,
+        bgm,
+        seeds,
+        max_concurrency,
+        api_key="",
+        images=None
+    ):
+        """批量生成视频"""
+        img2video = ViduQ1Img2VideoNode()
+        text2video = ViduQ1Text2VideoNode()
+        
+        # 获取API密钥
+        api_key = text2video.get_api_key(api_key)
+        if not api_key:
+            raise ValueError("API key is required")
+        
+        jobs = expand_batch_jobs(parse_prompt_list(prompts), parse_seed_list(seeds), split_image_batch(images))
+        
+        def submit(job):
+            if job["image"] is not None:
+                # 检查图像的宽高比是否符合要求
+                if not img2video.check_aspect_ratio(job["image"]):
+                    raise ValueError("Image aspect ratio must be less than 1:4 or 4:1")
+                base64_img = img2video.tensor_to_base64(job["image"])
+                if not base64_img:
+                    raise ValueError("Failed to process the image")
+                return img2video.call_vidu_q1_img2video_api(
+                    job["api_key"], base64_img, job["prompt"], job["seed"], movement_amplitude, bgm
+                )
+            return text2video.call_vidu_q1_text2video_api(
+                job["api_key"], job["prompt"], style, aspect_ratio, job["seed"], movement_amplitude, bgm
+            )
+        
+        def endpoint(job):
+            return "vidu-q1-img2video" if job["image"] is not None else "vidu-q1-text2video"
+        
+        videos, task_ids = run_batch_video_tasks(api_key, jobs, submit, max_concurrency, endpoint)
+        return (videos, task_ids)
+
+
 NODE_CLASS_MAPPINGS = {
     "ViduQ1Node": ViduQ1Node,
     "ViduQ1StartEndNode": ViduQ1StartEndNode,
     "ViduQ1Img2VideoNode": ViduQ1Img2VideoNode,
     "ViduQ1Text2VideoNode": ViduQ1Text2VideoNode,
+    "ViduQ1BatchVideoNode": ViduQ1BatchVideoNode,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
@@ -1180,4 +1209,5 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "ViduQ1StartEndNode": "Vidu Q1 首尾帧视频 (派欧云)",
     "ViduQ1Img2VideoNode": "Vidu Q1 图生视频 (派欧云)",
     "ViduQ1Text2VideoNode": "Vidu Q1 文生视频 (派欧云)",
+    "ViduQ1BatchVideoNode": "Vidu Q1 批量视频 (派欧云)",
 }
\ No newline at end of file
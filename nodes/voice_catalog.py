@@ -0,0 +1,159 @@
+"""
+共享的音色目录
+
+每个音色数据文件在进程内只解析一次，整理为按音色名称和分类查询的索引，供所有节点实例
+共用。文件修改（例如刷新MiniMax音色列表）后，下次访问时自动重新加载。
+"""
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+
+
+NODES_DIR = os.path.dirname(os.path.abspath(__file__))
+DOUBAO_VOICES_FILE = os.path.join(NODES_DIR, "doubao_voices.json")
+MINIMAX_VOICES_FILE = os.path.join(NODES_DIR, "minimax_voices.json")
+
+# MiniMax刷新接口返回的音色名称前缀，用于区分音色分类
+MINIMAX_CATEGORY_PREFIXES = (
+    ("voice_cloning", "快速复刻 - "),
+    ("voice_generation", "文生音色 - "),
+)
+
+
+class DoubaoVoiceIndex:
+    """豆包音色索引
+
+    voices: 音色名称 -> (voice_type, resource_id)
+    emotions: 音色名称 -> 支持的情感集合（只包含多情感音色）
+    categories: 分类名称 -> 音色名称元组
+    categorized_names: "分类名/音色名" 列表，用于节点的音色下拉框
+    """
+
+    def __init__(self, data):
+        voices = {}
+        emotions = {}
+        categories = {}
+        for category, voice_dict in data.get("voice_categories", {}).items():
+            categories[category] = tuple(voice_dict.keys())
+            for voice_name, voice_info in voice_dict.items():
+                voices[voice_name] = (voice_info[0], voice_info[1])
+                if len(voice_info) >= 3 and isinstance(voice_info[2], list):
+                    emotions[voice_name] = frozenset(voice_info[2])
+        self.voices = MappingProxyType(voices)
+        self.emotions = MappingProxyType(emotions)
+        self.categories = MappingProxyType(categories)
+        self.categorized_names = [
+            f"{category}/{voice_name}"
+            for category, names in categories.items()
+            for voice_name in names
+        ]
+
+
+class MiniMaxVoiceIndex:
+    """MiniMax音色索引（通过刷新接口保存的音色列表）
+
+    voice_ids: 音色名称 -> voice_id
+    categories: system/voice_cloning/voice_generation -> 音色名称元组
+    names: 全部音色名称
+    """
+
+    def __init__(self, data):
+        voice_ids = dict(data.get("voice_mapping", {}))
+        categories = {"system": [], "voice_cloning": [], "voice_generation": []}
+        for voice_name in voice_ids:
+            for category, prefix in MINIMAX_CATEGORY_PREFIXES:
+                if voice_name.startswith(prefix):
+                    categories[category].append(voice_name)
+                    break
+            else:
+                categories["system"].append(voice_name)
+        self.voice_ids = MappingProxyType(voice_ids)
+        self.categories = MappingProxyType({key: tuple(names) for key, names in categories.items()})
+        self.names = list(voice_ids.keys())
+
+    def resolve(self, voice):
+        """音色名称转换为voice_id，不是已知名称时原样返回"""
+        return self.voice_ids.get(voice, voice)
+
+
+class VoiceCatalog:
+    """按文件缓存的音色索引，文件修改时间或大小变化时重新加载"""
+
+    # 按文件路径缓存的目录实例
+    _catalogs = {}
+    _registry_lock = threading.Lock()
+    # 两次检查文件状态的最小间隔（秒）
+    check_interval = 1.0
+
+    def __init__(self, path, index_class):
+        self.path = path
+        self.index_class = index_class
+        self._lock = threading.Lock()
+        self._index = None
+        self._signature = None
+        self._checked_at = 0.0
+        self.loads = 0
+
+    @classmethod
+    def for_file(cls, path, index_class):
+        """获取文件对应的共享目录实例"""
+        with cls._registry_lock:
+            catalog = cls._catalogs.get(path)
+            if catalog is None:
+                catalog = cls(path, index_class)
+                cls._catalogs[path] = catalog
+            return catalog
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self):
+        """获取当前索引，文件不存在或无法解析时返回空索引"""
+        now = time.monotonic()
+        if self._index is not None and now - self._checked_at < self.check_interval:
+            return self._index
+        with self._lock:
+            signature = self._file_signature()
+            self._checked_at = now
+            if self._index is None or signature != self._signature:
+                self._index = self._load(signature)
+                self._signature = signature
+            return self._index
+
+    def _load(self, signature):
+        data = {}
+        if signature is not None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"Error loading voice catalog {os.path.basename(self.path)}: {e}")
+        self.loads += 1
+        return self.index_class(data)
+
+    def invalidate(self):
+        """立即失效，下次访问时重新检查文件"""
+        with self._lock:
+            self._checked_at = 0.0
+            self._signature = None
+
+
+def doubao_voice_catalog():
+    """豆包音色索引"""
+    return VoiceCatalog.for_file(DOUBAO_VOICES_FILE, DoubaoVoiceIndex).get()
+
+
+def minimax_voice_catalog():
+    """MiniMax音色索引"""
+    return VoiceCatalog.for_file(MINIMAX_VOICES_FILE, MiniMaxVoiceIndex).get()
+
+
+def invalidate_minimax_voice_catalog():
+    """刷新MiniMax音色列表后调用，下次访问时重新加载"""
+    VoiceCatalog.for_file(MINIMAX_VOICES_FILE, MiniMaxVoiceIndex).invalidate()
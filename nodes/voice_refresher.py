@@ -0,0 +1,194 @@
+"""
+远程音色列表的后台刷新
+
+启动时和之后按固定间隔在后台线程中获取远程音色数据，原子写入本地JSON缓存并使共享的
+音色目录失效。节点的INPUT_TYPES始终直接使用内存中的音色目录（先返回旧数据，后台再更新），
+不会等待网络请求。
+"""
+import threading
+import time
+
+import requests
+
+from .cache_utils import atomic_write_json
+from .config import CCConfig
+from .voice_catalog import MINIMAX_VOICES_FILE, minimax_voice_catalog, invalidate_minimax_voice_catalog
+
+
+MINIMAX_VOICE_URL = "https://api.minimaxi.com/v1/get_voice"
+
+# 默认刷新间隔（分钟）
+DEFAULT_INTERVAL_MINUTES = 360
+
+
+def fetch_minimax_voices(api_key, voice_type="all"):
+    """从MiniMax接口获取音色列表，返回 音色名称 -> voice_id，失败返回空字典"""
+    try:
+        response = requests.post(
+            MINIMAX_VOICE_URL,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            },
+            json={"voice_type": voice_type},
+            timeout=30
+        )
+        if response.status_code != 200:
+            print(f"API request failed with status {response.status_code}: {response.text}")
+            return {}
+
+        result = response.json()
+        if result.get("base_resp", {}).get("status_code", -1) != 0:
+            status_msg = result.get("base_resp", {}).get("status_msg", "Unknown error")
+            print(f"API request failed: {status_msg}")
+            return {}
+
+        voice_mapping = {}
+        # 系统音色
+        for voice in result.get("system_voice", None) or []:
+            voice_name = voice.get("voice_name", "")
+            voice_id = voice.get("voice_id", "")
+            if voice_name and voice_id:
+                voice_mapping[voice_name] = voice_id
+        # 快速复刻音色和文生音色可能没有voice_name，使用voice_id作为名称
+        for voice in result.get("voice_cloning", None) or []:
+            if voice.get("voice_id"):
+                voice_mapping[f"快速复刻 - {voice['voice_id']}"] = voice["voice_id"]
+        for voice in result.get("voice_generation", None) or []:
+            if voice.get("voice_id"):
+                voice_mapping[f"文生音色 - {voice['voice_id']}"] = voice["voice_id"]
+        return voice_mapping
+    except Exception as e:
+        print(f"Error fetching voice data: {str(e)}")
+        return {}
+
+
+def save_minimax_voices(voice_mapping):
+    """原子写入MiniMax音色缓存；内容未变化时不写文件，返回是否写入"""
+    if dict(minimax_voice_catalog().voice_ids) == voice_mapping:
+        return False
+    atomic_write_json(MINIMAX_VOICES_FILE, {
+        "voice_mapping": voice_mapping,
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+    invalidate_minimax_voice_catalog()
+    return True
+
+
+def refresh_minimax_catalog():
+    """使用配置文件中的MiniMax密钥刷新音色列表，未配置密钥时跳过"""
+    config = CCConfig()
+    api_key = config.get_api_key("minimax", pooled=False)
+    if not api_key:
+        return "skipped"
+    voice_type = config.get_setting("voice_refresh", "MINIMAX_VOICE_TYPE", "all") or "all"
+    voice_mapping = fetch_minimax_voices(api_key, voice_type)
+    if not voice_mapping:
+        raise RuntimeError("no voices returned")
+    return "updated" if save_minimax_voices(voice_mapping) else "unchanged"
+
+
+class VoiceCatalogRefresher:
+    """在后台线程中按计划执行音色刷新任务
+
+    任务在注册后立即执行一次，之后每隔interval秒执行；失败的任务按较短的间隔重试。
+    """
+
+    _instance = None
+    # 失败后的重试间隔（秒）
+    retry_interval = 300
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(VoiceCatalogRefresher, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._jobs = {}
+        self._thread = None
+
+    def _interval(self):
+        """读取[voice_refresh]刷新间隔，返回秒数；未启用时返回None"""
+        config = CCConfig()
+        enabled = (config.get_setting("voice_refresh", "ENABLED", "true") or "").strip().lower()
+        if enabled in ("0", "false", "no", "off"):
+            return None
+        try:
+            return float(config.get_setting("voice_refresh", "INTERVAL_MINUTES", DEFAULT_INTERVAL_MINUTES)) * 60
+        except ValueError:
+            print("Invalid [voice_refresh] INTERVAL_MINUTES, using default")
+            return DEFAULT_INTERVAL_MINUTES * 60
+
+    def register(self, name, func):
+        """注册刷新任务（重复注册时替换），并确保后台线程已启动"""
+        with self._lock:
+            self._jobs[name] = {
+                "func": func,
+                "next_run": 0.0,
+                "runs": 0,
+                "last_result": None,
+                "last_success": None,
+                "last_error": None,
+            }
+        self.start()
+        self._wakeup.set()
+
+    def trigger(self, name=None):
+        """立即在后台执行指定任务（或全部任务），不等待结果"""
+        with self._lock:
+            for job_name, job in self._jobs.items():
+                if name is None or job_name == name:
+                    job["next_run"] = 0.0
+        self._wakeup.set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="cc_api_voice_refresh", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            with self._lock:
+                due = [(name, job) for name, job in self._jobs.items() if job["next_run"] <= now]
+            if due:
+                interval = self._interval()
+                for name, job in due:
+                    self._run_job(name, job, interval)
+            with self._lock:
+                next_runs = [job["next_run"] for job in self._jobs.values()]
+            timeout = max(1.0, min(next_runs) - time.time()) if next_runs else None
+            self._wakeup.wait(timeout)
+
+    def _run_job(self, name, job, interval):
+        if interval is None:
+            # 未启用定时刷新时每小时重新检查一次配置
+            job["next_run"] = time.time() + 3600
+            return
+        try:
+            result = job["func"]()
+            job["last_result"] = result
+            job["last_success"] = time.time()
+            job["last_error"] = None
+            job["next_run"] = time.time() + interval
+            if result not in (None, "skipped", "unchanged"):
+                print(f"Voice catalog refresh ({name}): {result}")
+        except Exception as e:
+            job["last_error"] = str(e)
+            job["next_run"] = time.time() + min(interval, self.retry_interval)
+            print(f"Voice catalog refresh ({name}) failed: {e}")
+        job["runs"] += 1
+
+    def snapshot(self):
+        """获取各刷新任务的状态"""
+        with self._lock:
+            return {
+                name: {key: value for key, value in job.items() if key != "func"}
+                for name, job in self._jobs.items()
+            }
@@ -1,10 +1,13 @@
 import requests
-import os
 import time
 import io
 import base64
 from typing import Tuple, Dict, Any
-from .cc_utils import ImageUtils
+from .cc_utils import CCConfig, ImageUtils
+from .ppio_utils import parse_prompt_list, parse_seed_list, split_image_batch, expand_batch_jobs, run_batch_video_tasks, detach_task
+from .scheduler import JobScheduler
+from .cache_utils import SingleFlight, account_fingerprint, make_cache_key
+from .metrics import count_bytes, phase, timed_phase, traced_polling, traced_task_query
 
 # 尝试导入ComfyUI的视频处理模块
 try:
@@ -36,50 +39,24 @@ class WanPPIOImg2VideoNode:
             "optional": {
                 "negative_prompt": ("STRING", {"default": "", "multiline": True}),
                 "audio_url": ("STRING", {"default": ""}),
+                "detach": ("BOOLEAN", {"default": False, "tooltip": "提交任务后立即返回task_id，不等待视频生成；用“派欧云收集视频任务”节点获取视频"}),
             }
         }
 
-    RETURN_TYPES = ("VIDEO",) if HAS_COMFY_VIDEO else ("STRING",)
-    RETURN_NAMES = ("video",) if HAS_COMFY_VIDEO else ("video_url",)
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("video", "task_id") if HAS_COMFY_VIDEO else ("video_url", "task_id")
     FUNCTION = "generate_video"
     CATEGORY = "CC-API/Video"
     OUTPUT_NODE = False
 
+    # 合并正在进行的相同请求，重复排队的提示词共享同一个任务
+    _single_flight = SingleFlight("WanPPIOImg2VideoNode")
+
     def get_api_key(self, provided_key=""):
-        """获取API密钥，优先级：参数 > 环境变量 > 配置文件"""
-        # 首先检查传入的参数
-        if provided_key:
-            return provided_key
-        
-        # 然后检查环境变量
-        env_var_name = "PPIO_API_KEY"
-        if os.environ.get(env_var_name) is not None:
-            return os.environ[env_var_name]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            # 在Windows系统上明确指定使用UTF-8编码读取配置文件
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config.read_file(f)
-            except UnicodeDecodeError:
-                # 如果UTF-8失败，尝试使用系统默认编码
-                config.read(config_path)
-            
-            try:
-                if "ppio" in config and "API_KEY" in config["ppio"]:
-                    return config["ppio"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        """获取API密钥，优先级：参数 > 密钥池 > 环境变量 > 配置文件"""
+        return CCConfig().get_api_key("ppio", provided_key)
 
+    @timed_phase("encode", upload=True)
     def tensor_to_base64(self, image_tensor):
         """将图像张量转换为base64编码的字符串"""
         try:
@@ -149,6 +126,7 @@ class WanPPIOImg2VideoNode:
             print(f"调用万相图生视频API时出错: {e}")
             return None
 
+    @traced_task_query
     def query_task_result(self, api_key, task_id):
         """查询任务结果"""
         try:
@@ -176,6 +154,7 @@ class WanPPIOImg2VideoNode:
         except Exception as e:
             raise Exception(f"Error querying task result: {str(e)}")
 
+    @traced_polling
     def poll_task_result(self, api_key, task_id, poll_interval=5, max_attempts=120):
         """轮询任务结果直到完成或失败"""
         for attempt in range(max_attempts):
@@ -233,9 +212,46 @@ class WanPPIOImg2VideoNode:
         seed,
         api_key="",
         negative_prompt="",
-        audio_url=""
+        audio_url="",
+        detach=False
     ):
-        """生成视频的主函数"""
+        """生成视频的主函数；相同输入的请求正在进行时等待并共享其结果，不重复提交任务"""
+        # 只有显式传入的密钥参与键计算，密钥池中的密钥在执行任务时才选择
+        flight_key = make_cache_key(
+            account=account_fingerprint(api_key),
+            image=ImageUtils._get_image_hash(image),
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            audio_url=audio_url,
+            duration=duration,
+            resolution=resolution,
+            prompt_extend=prompt_extend,
+            watermark=watermark,
+            audio=audio,
+            seed=seed,
+            detach=detach
+        )
+        return self._single_flight.run(
+            flight_key, self._generate_video, prompt, image, duration, resolution, prompt_extend,
+            watermark, audio, seed, api_key, negative_prompt, audio_url, detach
+        )
+
+    def _generate_video(
+        self,
+        prompt,
+        image,
+        duration,
+        resolution,
+        prompt_extend,
+        watermark,
+        audio,
+        seed,
+        api_key="",
+        negative_prompt="",
+        audio_url="",
+        detach=False
+    ):
+        """提交任务、等待完成并下载视频"""
         try:
             # 获取API密钥
             api_key = self.get_api_key(api_key)
@@ -244,19 +260,24 @@ class WanPPIOImg2VideoNode:
             
             # 调用API
             print("Calling Wan 2.5 Preview Img2Video API...")
-            task_id = self.call_wan_i2v_api(
-                api_key, prompt, image, negative_prompt, audio_url, 
-                duration, resolution, prompt_extend, watermark, audio, seed
-            )
+            # 通过全局调度器限制并发任务数，任务完成后释放槽位
+            with JobScheduler().slot("ppio", "wan-2.5-i2v-preview", api_key) as slot:
+                task_id = slot.call(
+                    self.call_wan_i2v_api,
+                    api_key, prompt, image, negative_prompt, audio_url, 
+                    duration, resolution, prompt_extend, watermark, audio, seed
+                )
             
-            if not task_id:
-                raise Exception("API调用失败，未获取到任务ID")
+                if not task_id:
+                    raise Exception("API调用失败，未获取到任务ID")
             
-            print(f"Task submitted with ID: {task_id}")
+                print(f"Task submitted with ID: {task_id}")
+                if detach:
+                    return detach_task(api_key, task_id, self.__class__.__name__, "wan-2.5-i2v-preview")
             
-            # 轮询结果
-            print("Waiting for video generation to complete...")
-            video_url = self.poll_task_result(api_key, task_id)
+                # 轮询结果
+                print("Waiting for video generation to complete...")
+                video_url = self.poll_task_result(api_key, task_id)
             
             if not video_url:
                 raise Exception("视频生成失败或超时")
@@ -268,16 +289,18 @@ class WanPPIOImg2VideoNode:
                 # 使用同步方式下载视频，避免事件循环冲突
                 try:
                     import urllib.request
-                    video_io = io.BytesIO(urllib.request.urlopen(video_url).read())
-                    video_output = VideoFromFile(video_io)
-                    return (video_output,)
+                    with phase("download"):
+                        video_io = io.BytesIO(count_bytes("download", urllib.request.urlopen(video_url).read()))
+                    with phase("decode"):
+                        video_output = VideoFromFile(video_io)
+                    return (video_output, task_id)
                 except Exception as e:
                     print(f"Error downloading video synchronously: {str(e)}")
                     # 如果同步下载失败，回退到返回URL
-                    return (video_url,)
+                    return (video_url, task_id)
             else:
                 # 否则返回URL字符串
-                return (video_url,)
+                return (video_url, task_id)
                 
         except Exception as e:
             print(f"生成视频时出错: {e}")
@@ -306,49 +329,19 @@ class WanPPIOText2VideoNode:
             "optional": {
                 "negative_prompt": ("STRING", {"default": "", "multiline": True}),
                 "audio_url": ("STRING", {"default": ""}),
+                "detach": ("BOOLEAN", {"default": False, "tooltip": "提交任务后立即返回task_id，不等待视频生成；用“派欧云收集视频任务”节点获取视频"}),
             }
         }
 
-    RETURN_TYPES = ("VIDEO",) if HAS_COMFY_VIDEO else ("STRING",)
-    RETURN_NAMES = ("video",) if HAS_COMFY_VIDEO else ("video_url",)
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("video", "task_id") if HAS_COMFY_VIDEO else ("video_url", "task_id")
     FUNCTION = "generate_video"
     CATEGORY = "CC-API/Video"
     OUTPUT_NODE = False
 
     def get_api_key(self, provided_key=""):
-        """获取API密钥，优先级：参数 > 环境变量 > 配置文件"""
-        # 首先检查传入的参数
-        if provided_key:
-            return provided_key
-        
-        # 然后检查环境变量
-        env_var_name = "PPIO_API_KEY"
-        if os.environ.get(env_var_name) is not None:
-            return os.environ[env_var_name]
-        
-        # 最后检查配置文件
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)
-        config_path = os.path.join(parent_dir, "config.ini")
-        
-        if os.path.exists(config_path):
-            import configparser
-            config = configparser.ConfigParser()
-            # 在Windows系统上明确指定使用UTF-8编码读取配置文件
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    config.read_file(f)
-            except UnicodeDecodeError:
-                # 如果UTF-8失败，尝试使用系统默认编码
-                config.read(config_path)
-            
-            try:
-                if "ppio" in config and "API_KEY" in config["ppio"]:
-                    return config["ppio"]["API_KEY"]
-            except KeyError:
-                pass
-        
-        return None
+        """获取API密钥，优先级：参数 > 密钥池 > 环境变量 > 配置文件"""
+        return CCConfig().get_api_key("ppio", provided_key)
 
     def call_wan_t2v_api(self, api_key, prompt, negative_prompt, audio_url, size, duration, prompt_extend, watermark, audio, seed):
         """调用万相文生视频API"""
@@ -399,6 +392,7 @@ class WanPPIOText2VideoNode:
             print(f"调用万相文生视频API时出错: {e}")
             return None
 
+    @traced_task_query
     def query_task_result(self, api_key, task_id):
         """查询任务结果"""
         try:
@@ -426,6 +420,7 @@ class WanPPIOText2VideoNode:
         except Exception as e:
             raise Exception(f"Error querying task result: {str(e)}")
 
+    @traced_polling
     def poll_task_result(self, api_key, task_id, poll_interval=5, max_attempts=120):
         """轮询任务结果直到完成或失败"""
         for attempt in range(max_attempts):
@@ -482,7 +477,8 @@ class WanPPIOText2VideoNode:
         seed,
         api_key="",
         negative_prompt="",
-        audio_url=""
+        audio_url="",
+        detach=False
     ):
         """生成视频的主函数"""
         try:
@@ -493,19 +489,24 @@ class WanPPIOText2VideoNode:
             
             # 调用API
             print("Calling Wan 2.5 Preview Text2Video API...")
-            task_id = self.call_wan_t2v_api(
-                api_key, prompt, negative_prompt, audio_url, 
-                size, duration, prompt_extend, watermark, audio, seed
-            )
+            # 通过全局调度器限制并发任务数，任务完成后释放槽位
+            with JobScheduler().slot("ppio", "wan-2.5-t2v-preview", api_key) as slot:
+                task_id = slot.call(
+                    self.call_wan_t2v_api,
+                    api_key, prompt, negative_prompt, audio_url, 
+                    size, duration, prompt_extend, watermark, audio, seed
+                )
             
-            if not task_id:
-                raise Exception("API调用失败，未获取到任务ID")
+                if not task_id:
+                    raise Exception("API调用失败，未获取到任务ID")
             
-            print(f"Task submitted with ID: {task_id}")
+                print(f"Task submitted with ID: {task_id}")
+                if detach:
+                    return detach_task(api_key, task_id, self.__class__.__name__, "wan-2.5-t2v-preview")
             
-            # 轮询结果
-            print("Waiting for video generation to complete...")
-            video_url = self.poll_task_result(api_key, task_id)
+                # 轮询结果
+                print("Waiting for video generation to complete...")
+                video_url = self.poll_task_result(api_key, task_id)
             
             if not video_url:
                 raise Exception("视频生成失败或超时")
@@ -517,29 +518,110 @@ class WanPPIOText2VideoNode:
                 # 使用同步方式下载视频，避免事件循环冲突
                 try:
                     import urllib.request
-                    video_io = io.BytesIO(urllib.request.urlopen(video_url).read())
-                    video_output = VideoFromFile(video_io)
-                    return (video_output,)
+                    with phase("download"):
+                        video_io = io.BytesIO(count_bytes("download", urllib.request.urlopen(video_url).read()))
+                    with phase("decode"):
+                        video_output = VideoFromFile(video_io)
+                    return (video_output, task_id)
                 except Exception as e:
                     print(f"Error downloading video synchronously: {str(e)}")
                     # 如果同步下载失败，回退到返回URL
-                    return (video_url,)
+                    return (video_url, task_id)
             else:
                 # 否则返回URL字符串
-                return (video_url,)
+                return (video_url, task_id)
                 
         except Exception as e:
             print(f"生成视频时出错: {e}")
             raise ValueError(f"视频生成失败: {str(e)}")
 
 
+class WanPPIOBatchVideoNode:
+    """万相 Wan 2.5 批量视频节点 (派欧云)，提供图像时为图生视频，否则为文生视频"""
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "prompts": ("STRING", {"default": "", "multiline": True, "tooltip": "每行一个提示词，每行生成一个视频"}),
+                "size": (["832*480", "480*832", "624*624", "1280*720", "720*1280", "960*960", "1088*832", "832*1088", "1920*1080", "1080*1920", "1440*1440", "1632*1248", "1248*1632"], {"default": "1920*1080", "tooltip": "仅文生视频使用"}),
+                "resolution": (["480P", "720P", "1080P"], {"default": "1080P", "tooltip": "仅图生视频使用"}),
+                "duration": ([5, 10], {"default": 5}),
+                "prompt_extend": ("BOOLEAN", {"default": True, "label_on": "启用", "label_off": "禁用"}),
+                "watermark": ("BOOLEAN", {"default": False, "label_on": "添加", "label_off": "不添加"}),
+                "audio": ("BOOLEAN", {"default": True, "label_on": "启用", "label_off": "禁用"}),
+                "seeds": ("STRING", {"default": "", "tooltip": "种子列表，用逗号分隔；为空表示随机，只填一个则所有任务共用"}),
+                "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 16, "tooltip": "同时提交的最大任务数"}),
+                "api_key": ("STRING", {"default": ""}),
+            },
+            "optional": {
+                "images": ("IMAGE", {"tooltip": "可选的首帧图像批次，提供时使用图生视频；单张图像会用于所有任务"}),
+                "negative_prompt": ("STRING", {"default": "", "multiline": True}),
+                "audio_url": ("STRING", {"default": ""}),
+            }
+        }
+
+    RETURN_TYPES = ("VIDEO", "STRING") if HAS_COMFY_VIDEO else ("STRING", "STRING")
+    RETURN_NAMES = ("videos", "task_ids") if HAS_COMFY_VIDEO else ("video_urls", "task_ids")
+    OUTPUT_IS_LIST = (True, True)
+    FUNCTION = "generate_videos"
+    CATEGORY = "CC-API/Video"
+    OUTPUT_NODE = False
+
+    def generate_videos(
+        self,
+        prompts,
+        size,
+        resolution,
+        duration,
+        prompt_extend,
+        watermark,
+        audio,
+        seeds,
+        max_concurrency,
+        api_key="",
+        images=None,
+        negative_prompt="",
+        audio_url=""
+    ):
+        """批量生成视频"""
+        img2video = WanPPIOImg2VideoNode()
+        text2video = WanPPIOText2VideoNode()
+        
+        # 获取API密钥
+        api_key = text2video.get_api_key(api_key)
+        if not api_key:
+            raise ValueError("API key is required")
+        
+        jobs = expand_batch_jobs(parse_prompt_list(prompts), parse_seed_list(seeds), split_image_batch(images))
+        
+        def submit(job):
+            if job["image"] is not None:
+                return img2video.call_wan_i2v_api(
+                    job["api_key"], job["prompt"], job["image"], negative_prompt, audio_url,
+                    duration, resolution, prompt_extend, watermark, audio, job["seed"]
+                )
+            return text2video.call_wan_t2v_api(
+                job["api_key"], job["prompt"], negative_prompt, audio_url,
+                size, duration, prompt_extend, watermark, audio, job["seed"]
+            )
+        
+        def endpoint(job):
+            return "wan-2.5-i2v-preview" if job["image"] is not None else "wan-2.5-t2v-preview"
+        
+        videos, task_ids = run_batch_video_tasks(api_key, jobs, submit, max_concurrency, endpoint)
+        return (videos, task_ids)
+
+
 # 节点映射
 NODE_CLASS_MAPPINGS = {
     "WanPPIOImg2VideoNode": WanPPIOImg2VideoNode,
-    "WanPPIOText2VideoNode": WanPPIOText2VideoNode
+    "WanPPIOText2VideoNode": WanPPIOText2VideoNode,
+    "WanPPIOBatchVideoNode": WanPPIOBatchVideoNode
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "WanPPIOImg2VideoNode": "万相 Wan 2.5 图生视频 (派欧云)",
-    "WanPPIOText2VideoNode": "万相 Wan 2.5 文生视频 (派欧云)"
+    "WanPPIOText2VideoNode": "万相 Wan 2.5 文生视频 (派欧云)",
+    "WanPPIOBatchVideoNode": "万相 Wan 2.5 批量视频 (派欧云)"
 }
\ No newline at end of file
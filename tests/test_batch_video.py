@@ -0,0 +1,48 @@
+import pytest
+
+from nodes import ppio_utils
+from nodes.ppio_utils import run_batch_video_tasks
+
+
+class FakePoller:
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        self.keys = []
+
+    def wait(self, task_id):
+        return self.outcomes[task_id]
+
+
+@pytest.fixture
+def poller(monkeypatch):
+    fake = FakePoller({})
+    monkeypatch.setattr(ppio_utils.PPIOTaskPoller, "shared", classmethod(lambda cls, api_key: fake.keys.append(api_key) or fake))
+    monkeypatch.setattr(ppio_utils, "download_video", lambda url: f"video:{url}")
+    return fake
+
+
+def submit(job):
+    if job["prompt"] == "reject":
+        raise ValueError("status 400: bad prompt")
+    return f"task-{job['prompt']}"
+
+
+def test_results_stay_aligned_with_inputs(poller):
+    poller.outcomes = {
+        "task-a": ("https://cdn.example.com/a.mp4", None),
+        "task-b": (None, "Task failed: nsfw"),
+        "task-c": ("https://cdn.example.com/c.mp4", None),
+    }
+    jobs = [{"prompt": prompt} for prompt in ("a", "b", "reject", "c")]
+    videos, task_ids = run_batch_video_tasks("key", jobs, submit, max_concurrency=2)
+    assert task_ids == ["task-a", "task-b", "", "task-c"]
+    assert videos[0] == "video:https://cdn.example.com/a.mp4"
+    assert videos[3] == "video:https://cdn.example.com/c.mp4"
+    placeholder = type(ppio_utils.blocked_output())
+    assert type(videos[1]) is placeholder and type(videos[2]) is placeholder
+    assert set(poller.keys) == {"key"}
+
+
+def test_all_failures_raise(poller):
+    with pytest.raises(ValueError, match="All video tasks failed"):
+        run_batch_video_tasks("key", [{"prompt": "reject"}], submit)
@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+import time
+
+from nodes.cache_utils import DiskLRUCache, JsonRecordStore, SingleFlight, make_cache_key
+
+
+def test_make_cache_key_ignores_field_order():
+    assert make_cache_key(text="hi", voice="a", speed=1.0) == make_cache_key(speed=1.0, voice="a", text="hi")
+
+
+def test_make_cache_key_distinguishes_values():
+    base = make_cache_key(text="hi", speed=1.0)
+    assert make_cache_key(text="hi", speed=1.1) != base
+    assert make_cache_key(text="hi ", speed=1.0) != base
+    assert make_cache_key(text="hi", speed=1.0, extra=None) != base
+
+
+def test_make_cache_key_is_sha256_hex():
+    key = make_cache_key(text="你好", values=[1, 2])
+    assert len(key) == 64
+    int(key, 16)
+
+
+def test_disk_cache_roundtrip_and_stats(cache_root):
+    cache = DiskLRUCache("tts_test", max_bytes=1024)
+    assert cache.get("missing") is None
+    cache.put("a", b"audio", meta={"format": "mp3"}, suffix=".mp3")
+    assert cache.get("a") == (b"audio", {"format": "mp3"})
+    assert os.path.exists(os.path.join(cache.directory, "a.mp3"))
+    info = cache.get_cache_info()
+    assert (info["hits"], info["misses"], info["total_entries"], info["total_bytes"]) == (1, 1, 1, 5)
+
+
+def test_disk_cache_evicts_least_recently_used(cache_root, clock):
+    cache = DiskLRUCache("tts_test", max_bytes=10)
+    cache.put("a", b"aaaa")
+    clock.advance(1)
+    cache.put("b", b"bbbb")
+    clock.advance(1)
+    # 访问a后b成为最久未使用的条目
+    assert cache.get("a") is not None
+    clock.advance(1)
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.evictions == 1
+    assert not os.path.exists(os.path.join(cache.directory, "b.bin"))
+
+
+def test_disk_cache_skips_entries_larger_than_limit(cache_root):
+    cache = DiskLRUCache("tts_test", max_bytes=4)
+    cache.put("big", b"12345")
+    assert cache.get("big") is None
+
+
+def test_disk_cache_hit_does_not_rewrite_index_until_flush(cache_root, clock):
+    cache = DiskLRUCache("tts_test", max_bytes=1024)
+    cache.put("a", b"aaaa")
+    written_at = clock.now
+
+    def on_disk_last_access():
+        with open(cache.index_path, "r", encoding="utf-8") as f:
+            return json.load(f)["a"]["last_access"]
+
+    clock.advance(1)
+    cache.get("a")
+    assert on_disk_last_access() == written_at
+
+    # 写入其他条目时一并保存命中更新的访问时间
+    cache.put("b", b"bbbb")
+    assert on_disk_last_access() == written_at + 1
+
+
+def test_disk_cache_flush_persists_pending_access_times(cache_root, clock):
+    cache = DiskLRUCache("tts_test", max_bytes=10)
+    cache.put("a", b"aaaa")
+    clock.advance(1)
+    cache.put("b", b"bbbb")
+    clock.advance(1)
+    cache.get("a")
+    cache.flush()
+
+    # 重新加载索引后a仍是最近访问的条目
+    restarted = DiskLRUCache("tts_test", max_bytes=10)
+    restarted.put("c", b"cccc")
+    assert restarted.get("a") is not None
+    assert restarted.get("b") is None
+
+
+def test_disk_cache_drops_entries_whose_file_was_removed(cache_root):
+    cache = DiskLRUCache("tts_test", max_bytes=1024)
+    cache.put("a", b"aaaa")
+    os.unlink(os.path.join(cache.directory, "a.bin"))
+    assert cache.get("a") is None
+    assert cache.get_cache_info()["total_entries"] == 0
+
+
+def test_record_store_expires_by_ttl(cache_root, clock):
+    store = JsonRecordStore("uploads_test")
+    store.put("a", "file-1", ttl=60)
+    store.put("b", "file-2")
+    clock.advance(59)
+    assert store.get("a") == "file-1"
+    clock.advance(1)
+    assert store.get("a") is None
+    assert store.get("b") == "file-2"
+    assert [key for key, _ in store.items()] == ["b"]
+
+
+def test_record_store_absolute_expiry_takes_precedence(cache_root, clock):
+    store = JsonRecordStore("uploads_test")
+    store.put("a", "file-1", ttl=3600, expires_at=clock.now + 10)
+    clock.advance(10)
+    assert store.get("a") is None
+
+
+def test_record_store_evicts_oldest_over_limit(cache_root, clock):
+    store = JsonRecordStore("uploads_test", max_entries=2)
+    for key in ("a", "b", "c"):
+        store.put(key, key.upper())
+        clock.advance(1)
+    assert store.get("a") is None
+    assert (store.get("b"), store.get("c")) == ("B", "C")
+    assert store.evictions == 1
+
+
+def test_record_store_persists_across_instances(cache_root):
+    JsonRecordStore("uploads_test").put("a", {"url": "https://example.com/a"})
+    assert JsonRecordStore("uploads_test").get("a") == {"url": "https://example.com/a"}
+
+
+def run_concurrently(flight, key, func, count):
+    """启动count个线程以同一key调用run，等所有跟随者进入等待后放行func，返回各线程的结果或异常"""
+    release = threading.Event()
+    outcomes = [None] * count
+
+    def call(index):
+        try:
+            outcomes[index] = ("result", flight.run(key, func, release))
+        except Exception as e:
+            outcomes[index] = ("error", e)
+
+    threads = [threading.Thread(target=call, args=(index,), daemon=True) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 2
+    while flight.get_cache_info()["hits"] < count - 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+    return outcomes
+
+
+def test_single_flight_shares_result():
+    flight = SingleFlight("test")
+    calls = []
+
+    def work(release):
+        calls.append(1)
+        release.wait(2)
+        return {"task_id": "t1"}
+
+    outcomes = run_concurrently(flight, "k", work, 4)
+    assert len(calls) == 1
+    assert [kind for kind, _ in outcomes] == ["result"] * 4
+    assert all(value is outcomes[0][1] for _, value in outcomes)
+    assert (flight.misses, flight.hits) == (1, 3)
+
+
+def test_single_flight_shares_exception():
+    flight = SingleFlight("test")
+    error = ValueError("submit failed")
+
+    def work(release):
+        release.wait(2)
+        raise error
+
+    outcomes = run_concurrently(flight, "k", work, 3)
+    assert outcomes == [("error", error)] * 3
+
+
+def test_single_flight_runs_again_after_completion():
+    flight = SingleFlight("test")
+    assert flight.run("k", lambda: 1) == 1
+    assert flight.run("k", lambda: 2) == 2
+    assert flight.get_cache_info()["total_entries"] == 0
+    assert flight.misses == 2
+
+
+def test_single_flight_keys_are_independent():
+    flight = SingleFlight("test")
+    assert flight.run("a", lambda: flight.run("b", lambda: "inner")) == "inner"
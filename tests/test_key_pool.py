@@ -0,0 +1,125 @@
+import pytest
+
+from nodes.cache_utils import account_fingerprint
+from nodes.key_pool import PENDING_TIMEOUT, KeyPool, classify_key_error
+
+
+@pytest.fixture(autouse=True)
+def reset_pools():
+    KeyPool.reset()
+    yield
+    KeyPool.reset()
+
+
+def select_many(pool, count):
+    return [pool.select() for _ in range(count)]
+
+
+def test_least_outstanding_spreads_selected_keys(clock):
+    pool = KeyPool("ppio", ["k1", "k2", "k3"])
+    assert select_many(pool, 3) == ["k1", "k2", "k3"]
+
+
+def test_least_outstanding_respects_weights(clock):
+    pool = KeyPool("ppio", ["k1", "k2"], weights=[2, 1])
+    assert select_many(pool, 3) == ["k1", "k2", "k1"]
+
+
+def test_running_tasks_count_towards_load(clock):
+    pool = KeyPool("ppio", ["k1", "k2"])
+    assert pool.select() == "k1"
+    pool._on_start(account_fingerprint("k1"))
+    pool._on_start(account_fingerprint("k1"))
+    assert select_many(pool, 2) == ["k2", "k2"]
+    pool._on_finish(account_fingerprint("k1"))
+    pool._on_finish(account_fingerprint("k1"))
+    assert pool.select() == "k1"
+
+
+def test_abandoned_selections_expire(clock):
+    pool = KeyPool("ppio", ["k1", "k2"])
+    pool.select()
+    clock.advance(PENDING_TIMEOUT)
+    assert pool.select() == "k1"
+
+
+def test_weighted_round_robin_is_smooth(clock):
+    pool = KeyPool("ppio", ["k1", "k2"], weights=[2, 1], strategy="weighted_round_robin")
+    assert select_many(pool, 6) == ["k1", "k2", "k1", "k1", "k2", "k1"]
+
+
+def test_unknown_strategy_falls_back_to_least_outstanding():
+    assert KeyPool("ppio", ["k1", "k2"], strategy="random").strategy == "least_outstanding"
+
+
+@pytest.mark.parametrize("message, kind", [
+    ("API request failed with status 401: Unauthorized", "auth"),
+    ("Invalid API key provided", "auth"),
+    ("status 402: insufficient balance", "quota"),
+    ("status 500: internal error", None),
+    ("status 429: too many requests", None),
+])
+def test_classify_key_error(message, kind):
+    assert classify_key_error(Exception(message)) == kind
+
+
+def test_auth_error_quarantines_key(clock):
+    pool = KeyPool("ppio", ["k1", "k2"], auth_quarantine=3600, quota_quarantine=600)
+    key_id = account_fingerprint("k1")
+    pool._on_error(key_id, "status 401: Unauthorized")
+    assert select_many(pool, 3) == ["k2", "k2", "k2"]
+    stats = pool.get_stats()["keys"][0]
+    assert (stats["quarantined"], stats["quarantine_reason"], stats["errors"]) == (True, "auth", 1)
+    clock.advance(3600)
+    assert pool.get_stats()["keys"][0]["quarantined"] is False
+
+
+def test_quota_error_uses_shorter_quarantine(clock):
+    pool = KeyPool("ppio", ["k1", "k2"], auth_quarantine=3600, quota_quarantine=600)
+    pool._on_error(account_fingerprint("k1"), "insufficient quota")
+    clock.advance(PENDING_TIMEOUT)
+    assert pool.select() == "k2"
+    clock.advance(600)
+    assert pool.select() == "k1"
+
+
+def test_other_errors_do_not_quarantine(clock):
+    pool = KeyPool("ppio", ["k1", "k2"])
+    pool._on_error(account_fingerprint("k1"), "status 500: internal error")
+    assert pool.get_stats()["keys"][0]["quarantined"] is False
+
+
+def test_all_quarantined_uses_key_released_first(clock):
+    pool = KeyPool("ppio", ["k1", "k2"], auth_quarantine=3600, quota_quarantine=600)
+    pool._on_error(account_fingerprint("k1"), "status 401")
+    pool._on_error(account_fingerprint("k2"), "status 402")
+    assert pool.select() == "k2"
+
+
+def test_release_quarantine(clock):
+    pool = KeyPool("ppio", ["k1", "k2"])
+    pool._on_error(account_fingerprint("k1"), "status 403")
+    pool.release_quarantine(account_fingerprint("k1"))
+    assert pool.select() == "k1"
+
+
+def test_registry_routes_notifications_by_fingerprint(clock):
+    pool = KeyPool("ppio", ["k1", "k2"])
+    KeyPool._pools["ppio"] = pool
+    for entry in pool._entries:
+        KeyPool._pools_by_key_id[entry["key_id"]] = pool
+    key_id = account_fingerprint("k2")
+    assert KeyPool.lookup(key_id) is pool
+    KeyPool.notify_error(key_id, "status 401")
+    KeyPool.notify_rate_limited(key_id)
+    stats = pool.get_stats()["keys"][1]
+    assert (stats["quarantined"], stats["rate_limited"]) == (True, 1)
+
+
+def test_first_key_does_not_count_as_selection(clock):
+    pool = KeyPool("ppio", ["k1", "k2"])
+    KeyPool._pools["ppio"] = pool
+    assert KeyPool.first_key("ppio") == "k1"
+    assert pool.select() == "k1"
+    KeyPool._pools["minimax"] = None
+    assert KeyPool.first_key("minimax") is None
@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+from nodes.cache_utils import account_fingerprint
+from nodes.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, JobScheduler, is_rate_limit_error
+
+
+@pytest.fixture
+def scheduler():
+    """独立于全局单例和config.ini的调度器"""
+    instance = object.__new__(JobScheduler)
+    instance._initialize()
+    instance._limits = {}
+    instance._default_limit = None
+    return instance
+
+
+def waiter(seq, owner="default", priority=PRIORITY_INTERACTIVE, key="k1", endpoint="video"):
+    return {
+        "provider": "ppio",
+        "endpoint": endpoint,
+        "key_id": account_fingerprint(key),
+        "priority": priority,
+        "owner": owner,
+        "seq": seq,
+        "queued_at": 0,
+    }
+
+
+def test_provider_limit_blocks_until_release(scheduler):
+    scheduler._default_limit = 1
+    first = scheduler.acquire("ppio", "video", "k1")
+    acquired = threading.Event()
+
+    def second():
+        scheduler.release(scheduler.acquire("ppio", "video", "k2"))
+        acquired.set()
+
+    thread = threading.Thread(target=second, daemon=True)
+    thread.start()
+    assert not acquired.wait(0.2)
+    scheduler.release(first)
+    assert acquired.wait(2)
+    thread.join(2)
+    assert scheduler.snapshot()["providers"]["ppio"]["running"] == 0
+
+
+def test_unconfigured_providers_are_unlimited(scheduler):
+    slots = [scheduler.acquire("minimax", "t2a_v2", "k1") for _ in range(10)]
+    assert scheduler._is_available("minimax", "t2a_v2", account_fingerprint("k1"))
+    for slot in slots:
+        scheduler.release(slot)
+
+
+def test_per_key_limit_does_not_cap_the_provider(scheduler):
+    scheduler._limits = {"ppio_per_key": 1}
+    slots = [scheduler.acquire("ppio", "video", key) for key in ("k1", "k2", "k3", "k4", "k5")]
+    assert scheduler.snapshot()["providers"]["ppio"]["running"] == 5
+    assert scheduler.snapshot()["providers"]["ppio"]["limit"] is None
+    for slot in slots:
+        scheduler.release(slot)
+
+
+def test_per_key_limit_leaves_other_keys_available(scheduler):
+    scheduler._limits = {"ppio_per_key": 1}
+    slot = scheduler.acquire("ppio", "video", "k1")
+    assert not scheduler._is_available("ppio", "video", account_fingerprint("k1"))
+    assert scheduler._is_available("ppio", "video", account_fingerprint("k2"))
+    scheduler.release(slot)
+    assert scheduler._is_available("ppio", "video", account_fingerprint("k1"))
+
+
+def test_endpoint_limit_only_applies_to_its_endpoint(scheduler):
+    scheduler._limits = {"ppio/video": 1}
+    slot = scheduler.acquire("ppio", "video", "k1")
+    assert not scheduler._is_available("ppio", "video", account_fingerprint("k2"))
+    assert scheduler._is_available("ppio", "image", account_fingerprint("k2"))
+    scheduler.release(slot)
+
+
+def test_interactive_waiters_run_before_batch(scheduler):
+    scheduler._waiters = [waiter(0, priority=PRIORITY_BATCH), waiter(1, priority=PRIORITY_INTERACTIVE)]
+    assert scheduler._next_waiter()["seq"] == 1
+
+
+def test_owner_with_fewer_running_jobs_goes_first(scheduler):
+    scheduler._running_owner = {"batch-a": 2, "batch-b": 1}
+    scheduler._waiters = [
+        waiter(0, owner="batch-a", priority=PRIORITY_BATCH),
+        waiter(1, owner="batch-b", priority=PRIORITY_BATCH),
+        waiter(2, owner="batch-c", priority=PRIORITY_BATCH),
+    ]
+    assert scheduler._next_waiter()["owner"] == "batch-c"
+
+
+def test_same_owner_waiters_are_first_in_first_out(scheduler):
+    scheduler._waiters = [waiter(3, owner="a"), waiter(1, owner="a"), waiter(2, owner="a")]
+    assert scheduler._next_waiter()["seq"] == 1
+
+
+def test_unavailable_waiters_are_skipped(scheduler):
+    scheduler._limits = {"ppio_per_key": 1}
+    scheduler._running_key = {("ppio", account_fingerprint("k1")): 1}
+    scheduler._waiters = [waiter(0, key="k1"), waiter(1, key="k2")]
+    assert scheduler._next_waiter()["seq"] == 1
+
+
+def test_rate_limited_key_cools_down(scheduler, clock):
+    key_id = account_fingerprint("k1")
+    scheduler.report_rate_limited("ppio", key_id, 30)
+    assert not scheduler._is_available("ppio", "video", key_id)
+    assert scheduler._next_wakeup() == 30
+    clock.advance(30)
+    assert scheduler._is_available("ppio", "video", key_id)
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Request failed with status 429: Too Many Requests", True),
+    ("concurrency limit reached", True),
+    ("status 500: internal error", False),
+])
+def test_is_rate_limit_error(message, expected):
+    assert is_rate_limit_error(Exception(message)) is expected
@@ -0,0 +1,83 @@
+import json
+import time
+
+import pytest
+
+from nodes.cache_utils import signed_url_expires_at
+from nodes.ppio_utils import TaskResultCache
+
+
+@pytest.fixture(autouse=True)
+def task_cache(cache_root, monkeypatch):
+    monkeypatch.setattr(TaskResultCache, "_store", None)
+
+
+def succeeded(*video_urls, cover_url=None):
+    result = {
+        "task": {"task_id": "t1", "status": "TASK_STATUS_SUCCEED"},
+        "videos": [{"video_url": url, "video_type": "mp4"} for url in video_urls],
+    }
+    if cover_url:
+        result["extra"] = {"cover": {"image_url": cover_url}}
+    return result
+
+
+def put(result, api_key="key-a", task_id="t1"):
+    TaskResultCache.put(api_key, task_id, json.dumps(result))
+
+
+def test_signed_url_expires_at_formats():
+    assert signed_url_expires_at("https://cdn.example.com/v.mp4?Expires=1700003600&Signature=x") == 1700003600
+    amz = "https://s3.example.com/v.mp4?X-Amz-Date=20231114T221320Z&X-Amz-Expires=3600&X-Amz-Signature=x"
+    assert signed_url_expires_at(amz) == 1700000000 + 3600
+    assert signed_url_expires_at("https://cdn.example.com/v.mp4") is None
+    assert signed_url_expires_at("https://cdn.example.com/v.mp4?Expires=soon") is None
+
+
+def test_unfinished_tasks_are_not_cached(clock):
+    put({"task": {"task_id": "t1", "status": "TASK_STATUS_PROCESSING"}})
+    assert TaskResultCache.get("key-a", "t1") is None
+
+
+def test_failed_task_without_urls_never_expires(clock):
+    result = {"task": {"task_id": "t1", "status": "TASK_STATUS_FAILED", "reason": "nsfw"}}
+    put(result)
+    clock.advance(30 * 24 * 3600)
+    assert json.loads(TaskResultCache.get("key-a", "t1")) == result
+
+
+def test_expiry_follows_signed_url_with_margin(clock):
+    expires = int(clock.now) + 3600
+    put(succeeded(f"https://cdn.example.com/v.mp4?Expires={expires}"))
+    clock.advance(3600 - TaskResultCache._expiry_margin - 1)
+    assert TaskResultCache.get("key-a", "t1") is not None
+    clock.advance(1)
+    assert TaskResultCache.get("key-a", "t1") is None
+
+
+def test_earliest_nested_url_decides_expiry(clock):
+    now = int(clock.now)
+    put(succeeded(
+        f"https://cdn.example.com/v.mp4?Expires={now + 7200}",
+        cover_url=f"https://cdn.example.com/c.jpg?Expires={now + 1800}",
+    ))
+    clock.advance(1800 - TaskResultCache._expiry_margin)
+    assert TaskResultCache.get("key-a", "t1") is None
+
+
+def test_amz_signed_url_expiry(clock):
+    signed_at = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(clock.now))
+    put(succeeded(f"https://s3.example.com/v.mp4?X-Amz-Date={signed_at}&X-Amz-Expires=1200"))
+    clock.advance(1200 - TaskResultCache._expiry_margin)
+    assert TaskResultCache.get("key-a", "t1") is None
+
+
+def test_urls_expiring_within_margin_are_not_cached(clock):
+    put(succeeded(f"https://cdn.example.com/v.mp4?Expires={int(clock.now) + 60}"))
+    assert TaskResultCache.get("key-a", "t1") is None
+
+
+def test_results_are_scoped_to_the_account(clock):
+    put(succeeded("https://cdn.example.com/v.mp4"))
+    assert TaskResultCache.get("key-a", "t1") is not None
+    assert TaskResultCache.get("key-b", "t1") is None